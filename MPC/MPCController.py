@@ -1,283 +1,620 @@
 import casadi as ca
 import numpy as np
+import contextlib
 import math
-
-def shift(u, x_n):
-    u_end = np.concatenate((u[1:], u[-1:]))
-    x_n = np.concatenate((x_n[1:], x_n[-1:]))
-    return u_end, x_n
-
-class AltitudeMPC:
-    def __init__(self, quad, T=0.02, N=30, Q=np.diag([40.0, 1.0]), R=np.diag([1.0])):
+import time
+import warnings
+from MPC.solver_cache import cache_key, compile_nlp, jit_build, load_functions, load_solver, store_functions, store_solver
+from MPC.solver_stats import SolverStats
+from utils.profiling import profiled, span
+
+# options that JIT-compile the per-tick functions of the 'qp' and 'rti' backends
+# with the system C compiler, the NLP functions (objective, constraints and their
+# derivatives) are compiled with the same jit_options by solver_cache.compile_nlp.
+# Each build compiles into its own directory, see solver_cache.jit_build
+COMPILED_OPTIONS = {'jit': True,
+                    'compiler': 'shell',
+                    'jit_options': {'flags': ['-O1'], 'verbose': False, 'cleanup': False},
+                    # the sources are removed by jit_build after the build, not when the functions are freed
+                    'jit_cleanup': False,
+                    # serialized functions (solver cache, pickles) link to the binaries
+                    'jit_serialize': 'link'}
+
+# options of the conic solvers used by the 'qp' backend
+QP_SOLVER_OPTIONS = {'osqp': {'osqp': {'verbose': False, 'eps_abs': 1e-6, 'eps_rel': 1e-6, 'polish': True}},
+                     'qpoases': {'printLevel': 'none', 'hessian_type': 'posdef', 'enableEqualities': True},
+                     'qrqp': {'print_iter': False, 'print_header': False}}
+
+# IPOPT return statuses of a solve stopped by the time or iteration limit
+LIMIT_STATUSES = ('Maximum_WallTime_Exceeded', 'Maximum_CpuTime_Exceeded', 'Maximum_Iterations_Exceeded')
+
+# the stats of a 'qp' solve answered by the condensed solution map, no conic solver ran
+CONDENSED_STATS = {'success': True, 'return_status': 'condensed', 'iter_count': 0}
+
+def default_qp_solver():
+    # OSQP is the fastest on the sparse MPC structure, qrqp ships with every casadi
+    # build. Both are set up again on every call (casadi's conic interface passes the
+    # matrices each time), the 'qp' backend avoids the call when no bound is active,
+    # see NlpMPC.condense
+    if ca.has_conic('osqp'):
+        return 'osqp'
+    return 'qrqp'
+
+def weightDiagonal(W, n, name):
+    # the diagonal of a weight given as a diagonal matrix or as a vector of length n
+    W = np.asarray(W, dtype=float)
+    if W.ndim == 2:
+        if W.shape != (n, n) or np.any(W != np.diag(np.diag(W))):
+            raise ValueError("%s must be a diagonal %dx%d matrix" % (name, n, n))
+        W = np.diag(W)
+    if W.shape != (n,):
+        raise ValueError("%s must have %d diagonal entries" % (name, n))
+    if not np.all(np.isfinite(W)) or np.any(W < 0):
+        raise ValueError("%s must be finite and nonnegative" % name)
+    return W.copy()
+
+class NlpMPC:
+    # Base class of the MPC controllers, built directly on ca.nlpsol.
+    #
+    # decision variables  w = [x_0, ..., x_N, u_0, ..., u_{N-1}]
+    # parameters          p = [x_ref_0, ..., x_ref_N, u_ref_0, ..., u_ref_{N-1}, s_0, ..., s_{N-1}, q, r, v]
+    # constraints         g = [x_0 - x_ref_0, x_1 - F(x_0, u_0, s_0), ..., x_N - F(x_{N-1}, u_{N-1}, s_{N-1})]
+    #
+    # where s_i are the stage parameters of the model (e.g. the thrust of PositionMPC)
+    # and q, r the diagonals of the weights Q, R, which set_weights() changes at runtime.
+    # v are the physical parameters of the vehicle named in `vehicle` and the box
+    # constraints on states and controls are passed as lbx/ubx, so one solver serves
+    # every airframe and set_vehicle() switches between them.
+    name = 'mpc'
+    nx = 0  # state dimension
+    nu = 0  # control dimension
+    ns = 0  # stage parameter dimension
+    vehicle = ()  # the quadrotor parameters of the model
+
+    def __init__(self, quad, T, N, Q, R, compiled=False, cache_dir=None, backend='ipopt', qp_solver=None,
+                 stats_size=4096, time_budget=None, condensing=True):
         self.quad = quad
         self.T = T  # time step
         self.N = N  # horizon length
+        self.compiled = compiled  # JIT-compile the NLP, or the QP and RTI functions
+        self.cache_dir = cache_dir  # directory of built solvers, None disables the cache
+
+        # 'ipopt' solves the NLP, 'qp' solves linear-quadratic problems with a conic solver,
+        # 'rti' runs one Gauss-Newton SQP step per tick (real-time iteration)
+        if backend not in ('ipopt', 'qp', 'rti'):
+            raise ValueError("Unknown backend '%s', expected 'ipopt', 'qp' or 'rti'" % backend)
+        self.backend = backend
+        self.qp_solver = qp_solver if qp_solver is not None else default_qp_solver()
+        # the 'qp' backend answers solves without active bounds with the condensed
+        # solution map, False sends every solve to the conic solver
+        self.condensing = condensing
+
+        # statistics of the last stats_size solves
+        self.stats = SolverStats(stats_size)
+
+        # wall time limit of one IPOPT solve [s], a solve that fails or runs out of time
+        # falls back to the shifted previous plan and flags the tick as degraded
+        self.time_budget = time_budget
+        self.degraded = False
+        self.has_solution = False
+        self.prepared = False  # RTI preparation phase done for the next tick
+        self.shifted = True  # the warm start of the last solve was shifted by a stage
+        self.condensed = False  # the last qp solve used the condensed solution map
+
+        # weight matrix, only the diagonals enter the problem
+        self.Q = np.diag(weightDiagonal(Q, self.nx, 'Q'))
+        self.R = np.diag(weightDiagonal(R, self.nu, 'R'))
+
+        self.setupBuffers()
+        self.setupModel()
+        try:
+            self.setupController()
+        except RuntimeError as e:
+            if not self.compiled:
+                raise
+            # JIT compilation needs a working C compiler, without one the uncompiled
+            # solver is used (it has its own cache entry)
+            warnings.warn("compiling %s failed, using the uncompiled solver: %s"
+                          % (type(self).__name__, str(e).splitlines()[-1]), RuntimeWarning)
+            self.compiled = False
+            self.setupController()
+
+    def model(self, x_, u_, s_, v_):
+        # continuous dynamics dx/dt = f(x, u, s), v_ maps the names in `vehicle` to their values
+        raise NotImplementedError
+
+    def bounds(self):
+        # box bounds of one stage: lower/upper state bounds, lower/upper control bounds
+        raise NotImplementedError
+
+    def setupBuffers(self):
+        N, nx, nu, ns = self.N, self.nx, self.nu, self.ns
+
+        # index maps of the packed vectors
+        self.n_states = (N+1)*nx
+        self.n_controls = N*nu
+        self.idx_states = np.arange(self.n_states).reshape(N+1, nx)
+        self.idx_controls = self.n_states + np.arange(self.n_controls).reshape(N, nu)
+        self.n_w = self.n_states + self.n_controls
+        self.n_v = len(self.vehicle)
+        self.n_p = (N+1)*nx + N*nu + N*ns + nx + nu + self.n_v
+        self.n_g = (N+1)*nx
+
+        # the initial guess, the parameter vector and the multipliers of the last solution
+        self.w0 = np.zeros(self.n_w)
+        self.p = np.zeros(self.n_p)
+        self.lam_x = np.zeros(self.n_w)
+        self.lam_g = np.zeros(self.n_g)
+        self.bindViews()
+        self.p_q[:] = np.diag(self.Q)
+        self.p_r[:] = np.diag(self.R)
+
+        # the vehicle parameters, the box constraints of the variables and the equality constraints
+        self.lbx = np.zeros(self.n_w)
+        self.ubx = np.zeros(self.n_w)
+        self.setupVehicle()
+        self.lbg = np.zeros(self.n_g)
+        self.ubg = np.zeros(self.n_g)
+
+    def bindViews(self):
+        # per-stage views into the packed buffers, writing a view writes the buffer
+        N, nx, nu, ns = self.N, self.nx, self.nu, self.ns
+
+        # The history states and controls, views into the initial guess
+        self.next_states = self.w0[:self.n_states].reshape(N+1, nx)
+        self.u0 = self.w0[self.n_states:].reshape(N, nu)
+
+        # the references and the stage parameters
+        self.p_x_ref = self.p[:(N+1)*nx].reshape(N+1, nx)
+        self.p_u_ref = self.p[(N+1)*nx:(N+1)*nx + N*nu].reshape(N, nu)
+        self.p_stage = self.p[(N+1)*nx + N*nu:(N+1)*nx + N*nu + N*ns].reshape(N, ns)
+        i_q = (N+1)*nx + N*nu + N*ns
+        self.p_q = self.p[i_q:i_q + nx]
+        self.p_r = self.p[i_q + nx:i_q + nx + nu]
+        self.p_vehicle = self.p[i_q + nx + nu:]
+
+        # the multipliers, shifted like the initial guess
+        self.lam_x_states = self.lam_x[:self.n_states].reshape(N+1, nx)
+        self.lam_x_controls = self.lam_x[self.n_states:].reshape(N, nu)
+        self.lam_g_stages = self.lam_g.reshape(N+1, nx)
+
+    def __setstate__(self, state):
+        # pickling copies every view separately, bind them to the buffers again
+        self.__dict__.update(state)
+        self.bindViews()
+
+    def setupVehicle(self):
+        # the parameters and bounds of self.quad
+        self.p_vehicle[:] = [getattr(self.quad, name) for name in self.vehicle]
+        lbx_, ubx_, lbu_, ubu_ = self.bounds()
+        self.lbx[:] = np.concatenate((np.tile(lbx_, self.N+1), np.tile(lbu_, self.N)))
+        self.ubx[:] = np.concatenate((np.tile(ubx_, self.N+1), np.tile(ubu_, self.N)))
+
+    def vehicleSymbols(self, v):
+        return {name: v[i] for i, name in enumerate(self.vehicle)}
+
+    def setupModel(self):
+        # one discrete step of the model, extrapolates the tail of the shifted solution
+        x_ = ca.SX.sym('x', self.nx)
+        u_ = ca.SX.sym('u', self.nu)
+        s_ = ca.SX.sym('s', self.ns)
+        v_ = ca.SX.sym('v', self.n_v)
+        self.model_step = ca.Function('model_step', [x_, u_, s_, v_],
+                                      [x_ + self.model(x_, u_, s_, self.vehicleSymbols(v_))*self.T])
+
+    def buildProblem(self):
+        # symbolic decision variables, parameters, objective and constraints
+        N, nx, nu, ns = self.N, self.nx, self.nu, self.ns
+        w = ca.SX.sym('w', self.n_w)
+        p = ca.SX.sym('p', self.n_p)
+        states = ca.reshape(w[:self.n_states], nx, N+1)
+        controls = ca.reshape(w[self.n_states:], nu, N)
+        x_ref = ca.reshape(p[:(N+1)*nx], nx, N+1)
+        u_ref = ca.reshape(p[(N+1)*nx:(N+1)*nx + N*nu], nu, N)
+        stage = ca.reshape(p[(N+1)*nx + N*nu:(N+1)*nx + N*nu + N*ns], ns, N)
+        i_q = (N+1)*nx + N*nu + N*ns
+        q = p[i_q:i_q + nx]
+        r = p[i_q + nx:i_q + nx + nu]
+        v = self.vehicleSymbols(p[i_q + nx + nu:])
+
+        # initial condition and the dynamics
+        g = [states[:, 0] - x_ref[:, 0]]
+        for i in range(N):
+            x_next = states[:, i] + self.model(states[:, i], controls[:, i], stage[:, i], v)*self.T
+            g.append(states[:, i+1] - x_next)
 
-        # weight matrix
-        self.Q = Q
-        self.R = R
-
-        # The history states and controls
-        self.next_states = np.zeros((self.N+1, 2))
-        self.u0 = np.zeros((self.N, 1))
-
-        self.setupController()
-    
-    def setupController(self):
-        self.opti = ca.Opti()
-        # the total thrust
-        self.opt_controls = self.opti.variable(self.N, 1)
-        thrust = self.opt_controls
-
-        # state variable: altitude position
-        self.opt_states = self.opti.variable(self.N+1, 2)
-        z = self.opt_states[:,0]
-        dz = self.opt_states[:,1]
-
-        # create model
-        f = lambda x_, u_: ca.vertcat(*[
-            x_[1],
-            self.quad.g - u_/self.quad.mq,
-        ])
-
-        # parameters, these parameters are the reference trajectories of the pose and inputs
-        self.opt_u_ref = self.opti.parameter(self.N, 1)
-        self.opt_x_ref = self.opti.parameter(self.N+1, 2)
-
-        # initial condition
-        self.opti.subject_to(self.opt_states[0, :] == self.opt_x_ref[0, :])
-        for i in range(self.N):
-            x_next = self.opt_states[i, :] + f(self.opt_states[i, :], self.opt_controls[i, :]).T*self.T
-            self.opti.subject_to(self.opt_states[i+1, :] == x_next)
-        
         # cost function
         obj = 0
-        for i in range(self.N):
-            state_error_ = self.opt_states[i, :] - self.opt_x_ref[i+1, :]
-            control_error_ = self.opt_controls[i, :] - self.opt_u_ref[i, :]
-            obj = obj + ca.mtimes([state_error_, self.Q, state_error_.T]) \
-                        + ca.mtimes([control_error_, self.R, control_error_.T])
-        self.opti.minimize(obj)
-
-        # boundary and control conditions
-        self.opti.subject_to(self.opti.bounded(-math.inf, z, self.quad.max_z))
-        self.opti.subject_to(self.opti.bounded(self.quad.min_dz, dz, self.quad.max_dz))
-
-        self.opti.subject_to(self.opti.bounded(self.quad.min_thrust, thrust, self.quad.max_thrust))
+        for i in range(N):
+            state_error_ = states[:, i] - x_ref[:, i+1]
+            control_error_ = controls[:, i] - u_ref[:, i]
+            obj = obj + ca.dot(q, state_error_**2) + ca.dot(r, control_error_**2)
+        return w, p, obj, ca.vertcat(*g)
 
+    def setupController(self):
+        if self.backend == 'qp':
+            self.setupQp()
+            return
+        if self.backend == 'rti':
+            self.setupRti()
+            return
+
+        # reuse a solver built with the same settings, skips the problem construction
+        self.solver = load_solver(self.cache_dir, self)
+        if self.solver is not None:
+            return
+
+        w, p, obj, g = self.buildProblem()
         opts_setting = {'ipopt.max_iter':5000,
                         'ipopt.print_level':0,
                         'print_time':0,
                         'ipopt.acceptable_tol':1e-6,
-                        'ipopt.acceptable_obj_change_tol':1e-6}
-
-        self.opti.solver('ipopt', opts_setting)
-
-    def solve(self, next_trajectories, next_controls):
-        ## set parameter, here only update initial state of x (x0)
-        self.opti.set_value(self.opt_x_ref, next_trajectories)
-        self.opti.set_value(self.opt_u_ref, next_controls)
-        
-        ## provide the initial guess of the optimization targets
-        self.opti.set_initial(self.opt_states, self.next_states)
-        self.opti.set_initial(self.opt_controls, self.u0.reshape(self.N, 1))
-        
-        ## solve the problem
-        sol = self.opti.solve()
-        
-        ## obtain the control input
-        u_res = sol.value(self.opt_controls)
-        x_m = sol.value(self.opt_states)
-        self.u0, self.next_states = shift(u_res, x_m)
-        return u_res
-
-class PositionMPC:
-    def __init__(self, quad, T=0.02, N=30, Q=np.diag([40.0, 40.0, 1.0, 1.0]), R=np.diag([1.0, 1.0])):
+                        'ipopt.acceptable_obj_change_tol':1e-6,
+                        # start from the shifted primal-dual solution of the last tick
+                        'ipopt.warm_start_init_point':'yes',
+                        'ipopt.warm_start_bound_push':1e-8,
+                        'ipopt.warm_start_slack_bound_push':1e-8,
+                        'ipopt.warm_start_mult_bound_push':1e-8,
+                        'ipopt.mu_init':1e-4}
+        if self.time_budget is not None:
+            opts_setting['ipopt.max_wall_time'] = float(self.time_budget)
+
+        nlp = {'x': w, 'p': p, 'f': obj, 'g': g}
+        with self.building() as options:
+            self.solver = ca.nlpsol(self.name, 'ipopt', nlp, opts_setting)
+            if options:
+                self.solver = ca.nlpsol(self.name, 'ipopt', compile_nlp(self.solver, options['jit_options']), opts_setting)
+            store_solver(self.cache_dir, self, self.solver)
+
+    def qpOptions(self):
+        # failed QPs are reported through the stats and handled by the fallback plan
+        return dict(QP_SOLVER_OPTIONS.get(self.qp_solver, {}), error_on_fail=False)
+
+    @contextlib.contextmanager
+    def building(self):
+        # the options of the functions built inside the block, COMPILED_OPTIONS with a
+        # directory of this build if the controller is compiled (the NLP is compiled by
+        # compile_nlp with its jit_options). The functions of the 'qp' and 'rti' backends
+        # are compiled like the NLP. Store the built functions inside the block.
+        if not self.compiled:
+            yield {}
+            return
+        with jit_build(self.cache_dir, cache_key(self)) as path:
+            yield dict(COMPILED_OPTIONS, jit_options=dict(COMPILED_OPTIONS['jit_options'], directory=path))
+
+    def setupQp(self):
+        # min 1/2 w'Hw + h(p)'w  s.t.  lbg - g0(p) <= Aw <= ubg - g0(p),  lbx <= w <= ubx
+        functions = load_functions(self.cache_dir, self, ('qp_matrices', 'qp_vectors'))
+        if functions is None:
+            w, p, obj, g = self.buildProblem()
+            if not (ca.is_quadratic(obj, w) and ca.is_linear(g, w)):
+                raise ValueError("%s is not linear-quadratic, use the 'ipopt' backend" % type(self).__name__)
+
+            # the Hessian and the constraint Jacobian are constant, evaluate them once
+            # (the Hessian again when the weights change)
+            H = ca.hessian(obj, w)[0]
+            A = ca.jacobian(g, w)
+
+            # only the linear term and the constraint offsets change with the references
+            w_zero = ca.DM.zeros(self.n_w)
+            h = ca.substitute(ca.gradient(obj, w), w, w_zero)
+            g0 = ca.substitute(g, w, w_zero)
+            f0 = ca.substitute(obj, w, w_zero)
+            with self.building() as options:
+                functions = {'qp_matrices': ca.Function('qp_matrices', [p], [H, A], options),
+                             'qp_vectors': ca.Function('qp_vectors', [p], [h, g0, f0], options)}
+                store_functions(self.cache_dir, self, functions)
+        self.qp_matrices, self.qp_vectors = functions['qp_matrices'], functions['qp_vectors']
+        self.H, self.A = self.qp_matrices(self.p)
+
+        self.solver = ca.conic(self.name, self.qp_solver, {'h': self.H.sparsity(), 'a': self.A.sparsity()},
+                               self.qpOptions())
+        self.condense()
+
+    def condense(self):
+        # The equality constraints A w = -g0 fix the states given the controls (their
+        # block of A is lower triangular with identity blocks), w = E u + P g0. Without
+        # active bounds the QP is then unconstrained in u with the Hessian E'HE, and its
+        # solution is linear in the references: w = G_h h + G_g g0. The maps are factored
+        # here once per H and A, a solve whose result is inside the bounds costs two
+        # matrix-vector products, the others go to the conic solver. A reduced Hessian that
+        # is only semidefinite (e.g. a zero control weight) has no unique unconstrained
+        # solution, then every solve goes to the conic solver.
+        self.G_h = self.G_g = None
+        if not self.condensing:
+            return
+        H, A = self.H.full(), self.A.full()
+        A_x_inv = np.linalg.inv(A[:, :self.n_states])
+        E = np.vstack((-A_x_inv @ A[:, self.n_states:], np.eye(self.n_controls)))
+        P = np.vstack((-A_x_inv, np.zeros((self.n_controls, self.n_states))))
+        try:
+            L = np.linalg.cholesky(E.T @ H @ E)
+        except np.linalg.LinAlgError:
+            return
+        K = -np.linalg.solve(L.T, np.linalg.solve(L, E.T))  # -(E'HE)^-1 E'
+        self.G_h = E @ K
+        self.G_g = E @ K @ H @ P + P
+        # the multipliers of the equality constraints solve the state rows of H w + h + A'lam = 0
+        self.A_x_inv_T = A_x_inv.T
+        self.H_dense, self.A_dense = H, A
+
+    def setupRti(self):
+        # Gauss-Newton SQP step around the initial guess w0:
+        # min 1/2 dw'H dw + grad f(w0)'dw  s.t.  lbg - g(w0) <= J_g(w0) dw <= ubg - g(w0),
+        #                                        lbx - w0 <= dw <= ubx - w0
+        names = ('rti_matrices', 'rti_vectors', 'rti_constraints')
+        functions = load_functions(self.cache_dir, self, names)
+        if functions is None:
+            w, p, obj, g = self.buildProblem()
+            # the objective is a sum of weighted squares of linear errors, so its
+            # Hessian is the Gauss-Newton Hessian and depends only on the weights
+            H = ca.hessian(obj, w)[0]
+            J = ca.jacobian(g, w)
+            with self.building() as options:
+                functions = {'rti_matrices': ca.Function('rti_matrices', [w, p], [H, J], options),
+                             'rti_vectors': ca.Function('rti_vectors', [w, p], [ca.gradient(obj, w), g, obj], options),
+                             'rti_constraints': ca.Function('rti_constraints', [w, p], [g], options)}
+                store_functions(self.cache_dir, self, functions)
+        self.rti_matrices, self.rti_vectors, self.rti_constraints = (functions[name] for name in names)
+
+        self.solver = ca.conic(self.name, self.qp_solver, {'h': self.rti_matrices.sparsity_out(0),
+                                                           'a': self.rti_matrices.sparsity_out(1)},
+                               self.qpOptions())
+
+    def set_weights(self, Q=None, R=None):
+        # change the weights without rebuilding the solver, Q and R are diagonal
+        # matrices or their diagonals, None keeps the current one
+        # both are checked before either is written
+        q = weightDiagonal(Q, self.nx, 'Q') if Q is not None else None
+        r = weightDiagonal(R, self.nu, 'R') if R is not None else None
+        if q is not None:
+            self.p_q[:] = q
+            self.Q = np.diag(self.p_q)
+        if r is not None:
+            self.p_r[:] = r
+            self.R = np.diag(self.p_r)
+
+        self.refreshMatrices()
+
+    def set_vehicle(self, quad):
+        # fly another airframe with the same solver, quad is a Quadrotor or any object
+        # with its parameters and bounds
         self.quad = quad
-        self.T = T  # time step
-        self.N = N  # horizon length
-
-        # weight matrix
-        self.Q = Q
-        self.R = R
+        self.setupVehicle()
+        self.refreshMatrices()
+
+    def reset(self):
+        # forget the warm start and the statistics, to fly another run with the same solver
+        self.w0[:] = 0
+        self.lam_x[:] = 0
+        self.lam_g[:] = 0
+        self.p_stage[:] = 0
+        self.has_solution = False
+        self.prepared = False
+        self.shifted = True
+        self.degraded = False
+        self.stats = SolverStats(self.stats.size)
+
+    def refreshMatrices(self):
+        # the QP matrices are the only cached quantities that depend on the parameters
+        if self.backend == 'qp':
+            self.H, self.A = self.qp_matrices(self.p)
+            self.condense()
+        elif self.backend == 'rti' and self.prepared:
+            self.H, self.A = self.rti_matrices(self.w0, self.p)
+
+    def prepare(self):
+        # RTI preparation phase, call it after the control has been applied and before
+        # the next state arrives: linearize around the shifted previous solution
+        if self.backend != 'rti':
+            return
+        # the stage parameters of the next tick are predicted by shifting the last ones
+        if self.shifted:
+            self.p_stage[:-1] = self.p_stage[1:].copy()
+        self.H, self.A = self.rti_matrices(self.w0, self.p)
+        self.prepared = True
+
+    def shiftSolution(self, u_res, x_m, lam_x, lam_g, shift=True):
+        # shift the primal-dual solution by one stage into the warm start of the next solve,
+        # shift=False keeps it on its grid for a next solve less than a stage later
+        if not shift:
+            self.u0[:] = u_res; self.next_states[:] = x_m
+            self.lam_x[:] = lam_x; self.lam_g[:] = lam_g
+            return
+        self.u0[:-1] = u_res[1:]; self.u0[-1] = u_res[-1]
+        self.next_states[:-1] = x_m[1:]
+        # the new last state follows the model with the repeated last control
+        x_end = self.model_step(x_m[-1], u_res[-1], self.p_stage[-1], self.p_vehicle).full().ravel()
+        self.next_states[-1] = np.clip(x_end, self.lbx[:self.nx], self.ubx[:self.nx])
+
+        lam_x_states = lam_x[:self.n_states].reshape(self.N+1, self.nx)
+        lam_x_controls = lam_x[self.n_states:].reshape(self.N, self.nu)
+        lam_g_stages = lam_g.reshape(self.N+1, self.nx)
+        self.lam_x_states[:-1] = lam_x_states[1:]; self.lam_x_states[-1] = lam_x_states[-1]
+        self.lam_x_controls[:-1] = lam_x_controls[1:]; self.lam_x_controls[-1] = lam_x_controls[-1]
+        self.lam_g_stages[:-1] = lam_g_stages[1:]; self.lam_g_stages[-1] = lam_g_stages[-1]
+
+    def constraintViolation(self, w, g):
+        # the largest violation of the variable bounds and the constraints
+        return max(0.0, np.max(self.lbx - w), np.max(w - self.ubx),
+                   np.max(self.lbg - g), np.max(g - self.ubg))
+
+    def solveBackend(self):
+        # one solve with the current buffers: primal solution, multipliers, constraints and cost
+        self.condensed = False
+        if self.backend == 'qp':
+            h, g0, f0 = self.qp_vectors(self.p)
+            h, g0 = h.full().ravel(), g0.full().ravel()
+            w_opt = self.G_h @ h + self.G_g @ g0 if self.G_h is not None else None
+            if w_opt is not None and np.all(w_opt >= self.lbx) and np.all(w_opt <= self.ubx):
+                # no bound is active, the unconstrained solution is the solution
+                self.condensed = True
+                grad = self.H_dense @ w_opt + h
+                lam_g = -self.A_x_inv_T @ grad[:self.n_states]
+                cost = float(f0) + 0.5*w_opt @ (grad + h)
+                return w_opt, np.zeros(self.n_w), lam_g, self.A_dense @ w_opt + g0, cost
+            sol = self.solver(h=self.H, g=h, a=self.A, lbx=self.lbx, ubx=self.ubx,
+                              lba=self.lbg - g0, uba=self.ubg - g0,
+                              x0=self.w0, lam_x0=self.lam_x, lam_a0=self.lam_g)
+            w_opt = sol['x'].full().ravel()
+            lam_g = sol['lam_a']
+            g = ca.mtimes(self.A, sol['x']).full().ravel() + g0
+            cost = float(f0) + float(sol['cost'])
+        elif self.backend == 'rti':
+            ## feedback phase: only the residuals use the new state and references
+            if not self.prepared:
+                self.H, self.A = self.rti_matrices(self.w0, self.p)
+            grad, g_res, f0 = self.rti_vectors(self.w0, self.p)
+            g_res = g_res.full().ravel()
+            sol = self.solver(h=self.H, g=grad, a=self.A, lbx=self.lbx - self.w0, ubx=self.ubx - self.w0,
+                              lba=self.lbg - g_res, uba=self.ubg - g_res,
+                              lam_x0=self.lam_x, lam_a0=self.lam_g)
+            w_opt = self.w0 + sol['x'].full().ravel()
+            lam_g = sol['lam_a']
+            g = self.rti_constraints(w_opt, self.p).full().ravel()
+            # the objective is quadratic, so f(w0) plus the QP cost is the exact objective
+            cost = float(f0) + float(sol['cost'])
+        else:
+            sol = self.solver(x0=self.w0, p=self.p, lbx=self.lbx, ubx=self.ubx, lbg=self.lbg, ubg=self.ubg,
+                              lam_x0=self.lam_x, lam_g0=self.lam_g)
+            w_opt = sol['x'].full().ravel()
+            lam_g = sol['lam_g']
+            g = sol['g'].full().ravel()
+            cost = float(sol['f'])
+        return w_opt, sol['lam_x'].full().ravel(), lam_g.full().ravel(), g, cost
+
+    def fallbackPlan(self):
+        # the shifted previous plan, or the clipped reference before the first solution
+        if self.has_solution:
+            return self.u0.copy(), self.next_states.copy()
+        lbu = self.lbx[self.n_states:self.n_states+self.nu]
+        ubu = self.ubx[self.n_states:self.n_states+self.nu]
+        return np.clip(self.p_u_ref, lbu, ubu), self.p_x_ref.copy()
+
+    @profiled('solve')
+    def solveNlp(self, next_trajectories, next_controls, stage=None, vehicle=None, shift=True):
+        # shift=False: the next solve follows less than a stage T later (a controller
+        # re-solved faster than its grid), the warm start stays on the grid of this one
+        start = time.perf_counter()
+        with span('parameters'):
+            if vehicle is not None and vehicle is not self.quad:
+                self.set_vehicle(vehicle)
+            ## set parameter, the references and the initial state of x (x0)
+            self.p_x_ref[:] = next_trajectories
+            self.p_u_ref[:] = np.reshape(next_controls, (self.N, self.nu))
+            if stage is not None:
+                self.p_stage[:] = np.reshape(stage, (self.N, self.ns))
+
+        ## solve the problem, the initial guess is the shifted last solution
+        with span('solver'):
+            try:
+                w_opt, lam_x, lam_g, g, cost = self.solveBackend()
+                solver_stats = CONDENSED_STATS if self.condensed else self.solver.stats()
+                success, status = solver_stats['success'], solver_stats['return_status']
+                # an RTI tick is one SQP iteration, the other backends report their own count
+                iter_count = 1 if self.backend == 'rti' else solver_stats['iter_count']
+            except RuntimeError:
+                success, status, iter_count = False, 'Exception', -1
+        self.prepared = False
+        self.shifted = shift
+
+        with span('extraction'):
+            if success:
+                ## obtain the control input
+                u_res = w_opt[self.n_states:].reshape(self.N, self.nu)
+                x_m = w_opt[:self.n_states].reshape(self.N+1, self.nx)
+                self.shiftSolution(u_res, x_m, lam_x, lam_g, shift)
+                self.has_solution = True
+                violation = self.constraintViolation(w_opt, g)
+            else:
+                u_res, x_m = self.fallbackPlan()
+                if status in LIMIT_STATUSES and np.all(np.isfinite(w_opt)):
+                    # the solver ran out of time, its last iterate is a better warm start than the old plan
+                    self.shiftSolution(w_opt[self.n_states:].reshape(self.N, self.nu),
+                                       w_opt[:self.n_states].reshape(self.N+1, self.nx), lam_x, lam_g, shift)
+                else:
+                    self.shiftSolution(u_res, x_m, self.lam_x.copy(), self.lam_g.copy(), shift)
+                cost, violation = math.nan, math.nan
+        self.degraded = not success
+
+        self.stats.record(time.perf_counter() - start, iter_count, success, status, cost, violation)
+        return u_res
 
-        # The history states and controls
-        self.next_states = np.zeros((self.N+1, 4))
-        self.u0 = np.zeros((self.N, 2))
+class AltitudeMPC(NlpMPC):
+    name = 'altitude_mpc'
+    nx = 2  # altitude position and velocity
+    nu = 1  # the total thrust
+    vehicle = ('g', 'mq')
 
-        self.setupController()
+    def __init__(self, quad, T=0.02, N=30, Q=np.diag([40.0, 1.0]), R=np.diag([1.0]), **kwargs):
+        super().__init__(quad, T, N, Q, R, **kwargs)
 
-    def setupController(self):
-        self.opti = ca.Opti()
-        # the phi and theta refernece
-        self.opt_controls = self.opti.variable(self.N, 2)
-        phid = self.opt_controls[:,0]
-        thed = self.opt_controls[:,1]
-
-        # state variable: position (x,y)
-        self.opt_states = self.opti.variable(self.N+1, 4)
-        x = self.opt_states[:,0]
-        y = self.opt_states[:,1]
-
-        dx = self.opt_states[:,2]
-        dy = self.opt_states[:,3]
-
-        # create model
-        f = lambda x_, u_, t_: ca.vertcat(*[
-            x_[2], x_[3],                       # dx, dy
-            ca.sin(u_[1])*t_/self.quad.mq,  # ddx
-            -ca.sin(u_[0])*t_/self.quad.mq,  # ddy
+    def model(self, x_, u_, s_, v_):
+        return ca.vertcat(*[
+            x_[1],
+            v_['g'] - u_[0]/v_['mq'],
         ])
 
-        # parameters, these parameters are the reference trajectories of the pose and inputs
-        self.thrust = self.opti.parameter(self.N, 1)
-        self.opt_u_ref = self.opti.parameter(self.N, 2)
-        self.opt_x_ref = self.opti.parameter(self.N+1, 4)
-
-        # initial condition
-        self.opti.subject_to(self.opt_states[0, :] == self.opt_x_ref[0, :])
-        for i in range(self.N):
-            x_next = self.opt_states[i, :] + f(self.opt_states[i, :], self.opt_controls[i, :], self.thrust[i,:]).T*self.T
-            self.opti.subject_to(self.opt_states[i+1, :] == x_next)
-        
-        # cost function
-        obj = 0
-        for i in range(self.N):
-            state_error_ = self.opt_states[i, :] - self.opt_x_ref[i+1, :]
-            control_error_ = self.opt_controls[i, :] - self.opt_u_ref[i, :]
-            obj = obj + ca.mtimes([state_error_, self.Q, state_error_.T]) \
-                        + ca.mtimes([control_error_, self.R, control_error_.T])
-        self.opti.minimize(obj)
-
-        # boundary and control conditions
-        self.opti.subject_to(self.opti.bounded(self.quad.min_dx, dx, self.quad.max_dx))
-        self.opti.subject_to(self.opti.bounded(self.quad.min_dy, dy, self.quad.max_dy))
+    def bounds(self):
+        return ([-math.inf, self.quad.min_dz], [self.quad.max_z, self.quad.max_dz],
+                [self.quad.min_thrust], [self.quad.max_thrust])
+
+    def solve(self, next_trajectories, next_controls, vehicle=None):
+        u_res = self.solveNlp(next_trajectories, next_controls, vehicle=vehicle)
+        return u_res[:,0]
+
+class PositionMPC(NlpMPC):
+    name = 'position_mpc'
+    nx = 4  # position (x,y) and velocity
+    nu = 2  # the phi and theta reference
+    ns = 1  # the total thrust from the altitude controller
+    vehicle = ('mq',)
+
+    def __init__(self, quad, T=0.02, N=30, Q=np.diag([40.0, 40.0, 1.0, 1.0]), R=np.diag([1.0, 1.0]), **kwargs):
+        super().__init__(quad, T, N, Q, R, **kwargs)
+
+    def model(self, x_, u_, s_, v_):
+        return ca.vertcat(*[
+            x_[2], x_[3],                   # dx, dy
+            ca.sin(u_[1])*s_[0]/v_['mq'],   # ddx
+            -ca.sin(u_[0])*s_[0]/v_['mq'],  # ddy
+        ])
 
-        self.opti.subject_to(self.opti.bounded(self.quad.min_phi, phid, self.quad.max_phi))
-        self.opti.subject_to(self.opti.bounded(self.quad.min_the, thed, self.quad.max_the))
+    def bounds(self):
+        return ([-math.inf, -math.inf, self.quad.min_dx, self.quad.min_dy],
+                [math.inf, math.inf, self.quad.max_dx, self.quad.max_dy],
+                [self.quad.min_phi, self.quad.min_the],
+                [self.quad.max_phi, self.quad.max_the])
 
-        opts_setting = {'ipopt.max_iter':5000,
-                        'ipopt.print_level':0,
-                        'print_time':0,
-                        'ipopt.acceptable_tol':1e-6,
-                        'ipopt.acceptable_obj_change_tol':1e-6}
-
-        self.opti.solver('ipopt', opts_setting)
-
-    def solve(self, next_trajectories, next_controls, thrust):
-        ## set parameter, here only update initial state of x (x0)
-        self.opti.set_value(self.opt_x_ref, next_trajectories)
-        self.opti.set_value(self.opt_u_ref, next_controls)
-        self.opti.set_value(self.thrust, thrust)
-        
-        ## provide the initial guess of the optimization targets
-        self.opti.set_initial(self.opt_states, self.next_states)
-        self.opti.set_initial(self.opt_controls, self.u0.reshape(self.N, 2))
-        
-        ## solve the problem
-        sol = self.opti.solve()
-        
-        ## obtain the control input
-        u_res = sol.value(self.opt_controls)
-        x_m = sol.value(self.opt_states)
-        self.u0, self.next_states = shift(u_res, x_m)
+    def solve(self, next_trajectories, next_controls, thrust, vehicle=None):
+        u_res = self.solveNlp(next_trajectories, next_controls, thrust, vehicle=vehicle)
         return u_res[:,0], u_res[:,1]
 
-class AttitudeMPC:
-    def __init__(self, quad, T=0.02, N=30, Q=np.diag([40.0, 40.0, 40.0, 1.0, 1.0, 1.0]), R=np.diag([1.0, 1.0, 1.0])):
-        self.quad = quad
-        self.T = T  # time step
-        self.N = N  # horizon length
-
-        # weight matrix
-        self.Q = Q
-        self.R = R
+class AttitudeMPC(NlpMPC):
+    name = 'attitude_mpc'
+    nx = 6  # orientation and angular velocity
+    nu = 3  # the torques of all axis
+    vehicle = ('Ix', 'Iy', 'Iz', 'la')
 
-        # The history states and controls
-        self.next_states = np.zeros((self.N+1, 6))
-        self.u0 = np.zeros((self.N, 3))
+    def __init__(self, quad, T=0.02, N=30, Q=np.diag([40.0, 40.0, 40.0, 1.0, 1.0, 1.0]), R=np.diag([1.0, 1.0, 1.0]), **kwargs):
+        super().__init__(quad, T, N, Q, R, **kwargs)
 
-        self.setupController()
-
-    def setupController(self):
-        self.opti = ca.Opti()
-        # the torques of all axis
-        self.opt_controls = self.opti.variable(self.N, 3)
-        tau_phi = self.opt_controls[:,0]
-        tau_the = self.opt_controls[:,1]
-        tau_psi = self.opt_controls[:,2]
-
-        # state variable: orientation
-        self.opt_states = self.opti.variable(self.N+1, 6)
-        phi = self.opt_states[:,0]
-        the = self.opt_states[:,1]
-        psi = self.opt_states[:,2]
-
-        dphi = self.opt_states[:,3]
-        dthe = self.opt_states[:,4]
-        dpsi = self.opt_states[:,5]
-
-        # create model
-        f = lambda x_, u_: ca.vertcat(*[
+    def model(self, x_, u_, s_, v_):
+        return ca.vertcat(*[
             x_[3], x_[4], x_[5],            # dotphi, dotthe, dotpsi
-            (x_[4]*x_[5]*(self.quad.Iy-self.quad.Iz) + self.quad.la*u_[0])/self.quad.Ix,    # ddotphi
-            (x_[3]*x_[5]*(self.quad.Iz-self.quad.Ix) + self.quad.la*u_[1])/self.quad.Iy,    # ddotthe
-            (x_[3]*x_[4]*(self.quad.Ix-self.quad.Iy) + u_[2])/self.quad.Iz,                 # ddotpsi
+            (x_[4]*x_[5]*(v_['Iy']-v_['Iz']) + v_['la']*u_[0])/v_['Ix'],    # ddotphi
+            (x_[3]*x_[5]*(v_['Iz']-v_['Ix']) + v_['la']*u_[1])/v_['Iy'],    # ddotthe
+            (x_[3]*x_[4]*(v_['Ix']-v_['Iy']) + u_[2])/v_['Iz'],             # ddotpsi
         ])
 
-        # parameters, these parameters are the reference trajectories of the pose and inputs
-        self.opt_u_ref = self.opti.parameter(self.N, 3)
-        self.opt_x_ref = self.opti.parameter(self.N+1, 6)
-
-        # initial condition
-        self.opti.subject_to(self.opt_states[0, :] == self.opt_x_ref[0, :])
-        for i in range(self.N):
-            x_next = self.opt_states[i, :] + f(self.opt_states[i, :], self.opt_controls[i, :]).T*self.T
-            self.opti.subject_to(self.opt_states[i+1, :] == x_next)
-        
-        # cost function
-        obj = 0
-        for i in range(self.N):
-            state_error_ = self.opt_states[i, :] - self.opt_x_ref[i+1, :]
-            control_error_ = self.opt_controls[i, :] - self.opt_u_ref[i, :]
-            obj = obj + ca.mtimes([state_error_, self.Q, state_error_.T]) \
-                        + ca.mtimes([control_error_, self.R, control_error_.T])
-        self.opti.minimize(obj)
-
-        # boundary and control conditions
-        self.opti.subject_to(self.opti.bounded(self.quad.min_phi, phi, self.quad.max_phi))
-        self.opti.subject_to(self.opti.bounded(self.quad.min_the, the, self.quad.max_the))
-
-        self.opti.subject_to(self.opti.bounded(self.quad.min_dphi, dphi, self.quad.max_dphi))
-        self.opti.subject_to(self.opti.bounded(self.quad.min_dthe, dthe, self.quad.max_dthe))
-        self.opti.subject_to(self.opti.bounded(self.quad.min_dpsi, dpsi, self.quad.max_dpsi))
-
-        self.opti.subject_to(self.opti.bounded(self.quad.min_tau_phi, tau_phi, self.quad.max_tau_phi))
-        self.opti.subject_to(self.opti.bounded(self.quad.min_tau_the, tau_the, self.quad.max_tau_the))
-        self.opti.subject_to(self.opti.bounded(self.quad.min_tau_psi, tau_psi, self.quad.max_tau_psi))
-
-        opts_setting = {'ipopt.max_iter':5000,
-                        'ipopt.print_level':0,
-                        'print_time':0,
-                        'ipopt.acceptable_tol':1e-6,
-                        'ipopt.acceptable_obj_change_tol':1e-6}
-
-        self.opti.solver('ipopt', opts_setting)
-
-    def solve(self, next_trajectories, next_controls):
-        ## set parameter, here only update initial state of x (x0)
-        self.opti.set_value(self.opt_x_ref, next_trajectories)
-        self.opti.set_value(self.opt_u_ref, next_controls)
-        
-        ## provide the initial guess of the optimization targets
-        self.opti.set_initial(self.opt_states, self.next_states)
-        self.opti.set_initial(self.opt_controls, self.u0.reshape(self.N, 3))
-        
-        ## solve the problem
-        sol = self.opti.solve()
-        
-        ## obtain the control input
-        u_res = sol.value(self.opt_controls)
-        x_m = sol.value(self.opt_states)
-        self.u0, self.next_states = shift(u_res, x_m)
-        return u_res[:,0], u_res[:,1], u_res[:,2]
\ No newline at end of file
+    def bounds(self):
+        return ([self.quad.min_phi, self.quad.min_the, -math.inf,
+                 self.quad.min_dphi, self.quad.min_dthe, self.quad.min_dpsi],
+                [self.quad.max_phi, self.quad.max_the, math.inf,
+                 self.quad.max_dphi, self.quad.max_dthe, self.quad.max_dpsi],
+                [self.quad.min_tau_phi, self.quad.min_tau_the, self.quad.min_tau_psi],
+                [self.quad.max_tau_phi, self.quad.max_tau_the, self.quad.max_tau_psi])
+
+    def solve(self, next_trajectories, next_controls, vehicle=None, shift=True):
+        u_res = self.solveNlp(next_trajectories, next_controls, vehicle=vehicle, shift=shift)
+        return u_res[:,0], u_res[:,1], u_res[:,2]
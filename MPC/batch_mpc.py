@@ -0,0 +1,242 @@
+import casadi as ca
+import numpy as np
+import os
+import time
+from MPC.MPCController import weightDiagonal
+from MPC.solver_stats import SolverStats
+from utils.profiling import profiled, span
+
+class BatchMPC:
+    # K independent problems of one controller solved by one mapped call.
+    #
+    # The functions of a built controller (solver, QP/RTI matrices, model step) are
+    # mapped over K vehicles with ca.Function.map, so the K solves run in the casadi
+    # thread pool and the buffers below are stacked copies of the controller's
+    # buffers, one row per vehicle. The references, weights, vehicle parameters and
+    # bounds can differ per vehicle, the controller's solver is shared.
+    #
+    # IPOPT is not thread-safe, the 'ipopt' backend maps its functions 'serial' by
+    # default and refuses the thread maps, the conic backends use the thread pool.
+    def __init__(self, controller, K, quads=None, parallelization=None, n_threads=None,
+                 stats_size=4096, tol=1e-4):
+        c = self.controller = controller
+        self.K = K
+        self.N, self.nx, self.nu, self.ns = c.N, c.nx, c.nu, c.ns
+        self.backend = c.backend
+        self.tol = tol  # largest constraint violation of a successful solve
+        if parallelization is None:
+            parallelization = 'serial' if self.backend == 'ipopt' else 'thread'
+        if self.backend == 'ipopt' and parallelization in ('thread', 'openmp'):
+            raise ValueError("IPOPT is not thread-safe, map the 'ipopt' backend with 'serial'")
+        if parallelization == 'thread' and n_threads is None:
+            n_threads = os.cpu_count() or 1
+
+        # statistics of the batch solves, one entry per call
+        self.stats = SolverStats(stats_size)
+        self.success = np.zeros(K, dtype=bool)   # per vehicle, of the last solve
+        self.has_solution = np.zeros(K, dtype=bool)
+        self.prepared = False
+
+        # stacked buffers, row k is the packed vector of vehicle k
+        self.w0 = np.tile(c.w0, (K, 1))
+        self.p = np.tile(c.p, (K, 1))
+        self.lam_x = np.tile(c.lam_x, (K, 1))
+        self.lam_g = np.tile(c.lam_g, (K, 1))
+        self.lbx = np.tile(c.lbx, (K, 1))
+        self.ubx = np.tile(c.ubx, (K, 1))
+        self.bindViews()
+
+        # the mapped functions of the backend
+        def mapped(f):
+            if parallelization == 'thread':
+                return f.map(K, 'thread', n_threads)
+            return f.map(K, parallelization)
+        self.solver = mapped(c.solver)
+        self.model_step = mapped(c.model_step)
+        if self.backend == 'qp':
+            self.qp_matrices = mapped(c.qp_matrices)
+            self.qp_vectors = mapped(c.qp_vectors)
+            sparsity = c.A.sparsity()
+        elif self.backend == 'rti':
+            self.rti_matrices = mapped(c.rti_matrices)
+            self.rti_vectors = mapped(c.rti_vectors)
+            sparsity = c.rti_matrices.sparsity_out(1)
+        if self.backend in ('qp', 'rti'):
+            # the constraints of the QPs, A w + g0
+            a = ca.SX.sym('a', sparsity)
+            w = ca.SX.sym('w', c.n_w)
+            g0 = ca.SX.sym('g0', c.n_g)
+            self.qp_constraints = mapped(ca.Function('qp_constraints', [a, w, g0], [ca.mtimes(a, w) + g0]))
+
+        if quads is not None:
+            for k, quad in enumerate(quads):
+                self.set_vehicle(k, quad, refresh=False)
+        self.refreshMatrices()
+
+    def bindViews(self):
+        # per-vehicle, per-stage views into the stacked buffers
+        c, K, N, nx, nu, ns = self.controller, self.K, self.N, self.nx, self.nu, self.ns
+        self.next_states = self.w0[:, :c.n_states].reshape(K, N+1, nx)
+        self.u0 = self.w0[:, c.n_states:].reshape(K, N, nu)
+
+        i_q = (N+1)*nx + N*nu + N*ns
+        self.p_x_ref = self.p[:, :(N+1)*nx].reshape(K, N+1, nx)
+        self.p_u_ref = self.p[:, (N+1)*nx:(N+1)*nx + N*nu].reshape(K, N, nu)
+        self.p_stage = self.p[:, (N+1)*nx + N*nu:i_q].reshape(K, N, ns)
+        self.p_q = self.p[:, i_q:i_q + nx]
+        self.p_r = self.p[:, i_q + nx:i_q + nx + nu]
+        self.p_vehicle = self.p[:, i_q + nx + nu:]
+
+        self.lam_x_states = self.lam_x[:, :c.n_states].reshape(K, N+1, nx)
+        self.lam_x_controls = self.lam_x[:, c.n_states:].reshape(K, N, nu)
+        self.lam_g_stages = self.lam_g.reshape(K, N+1, nx)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.bindViews()
+
+    def set_weights(self, Q=None, R=None, k=None):
+        # the weights of vehicle k, of all vehicles if k is None
+        rows = slice(None) if k is None else k
+        if Q is not None:
+            self.p_q[rows] = weightDiagonal(Q, self.nx, 'Q')
+        if R is not None:
+            self.p_r[rows] = weightDiagonal(R, self.nu, 'R')
+        self.refreshMatrices()
+
+    def set_vehicle(self, k, quad, refresh=True):
+        # the parameters and bounds of vehicle k, computed by the controller for quad
+        c = self.controller
+        current = c.quad
+        c.quad = quad
+        c.setupVehicle()
+        self.p_vehicle[k] = c.p_vehicle
+        self.lbx[k] = c.lbx
+        self.ubx[k] = c.ubx
+        c.quad = current
+        c.setupVehicle()
+        if refresh:
+            self.refreshMatrices()
+
+    def refreshMatrices(self):
+        if self.backend == 'qp':
+            self.H, self.A = self.qp_matrices(self.p.T)
+        elif self.backend == 'rti' and self.prepared:
+            self.H, self.A = self.rti_matrices(self.w0.T, self.p.T)
+
+    def prepare(self):
+        # RTI preparation of all vehicles, see NlpMPC.prepare()
+        if self.backend != 'rti':
+            return
+        self.p_stage[:, :-1] = self.p_stage[:, 1:].copy()
+        self.H, self.A = self.rti_matrices(self.w0.T, self.p.T)
+        self.prepared = True
+
+    def solveBackend(self):
+        # one mapped solve: the primal solutions, multipliers, constraints and costs, one row per vehicle
+        c = self.controller
+        if self.backend == 'qp':
+            h, g0, f0 = self.qp_vectors(self.p.T)
+            g0 = g0.full()
+            sol = self.solver(h=self.H, g=h, a=self.A, lbx=self.lbx.T, ubx=self.ubx.T,
+                              lba=c.lbg[:, None] - g0, uba=c.ubg[:, None] - g0,
+                              x0=self.w0.T, lam_x0=self.lam_x.T, lam_a0=self.lam_g.T)
+            w_opt = sol['x'].full().T
+            lam_g = sol['lam_a']
+            g = self.qp_constraints(self.A, sol['x'], g0).full().T
+            cost = f0.full().ravel() + sol['cost'].full().ravel()
+        elif self.backend == 'rti':
+            if not self.prepared:
+                self.H, self.A = self.rti_matrices(self.w0.T, self.p.T)
+            grad, g_res, f0 = self.rti_vectors(self.w0.T, self.p.T)
+            g_res = g_res.full()
+            sol = self.solver(h=self.H, g=grad, a=self.A, lbx=self.lbx.T - self.w0.T, ubx=self.ubx.T - self.w0.T,
+                              lba=c.lbg[:, None] - g_res, uba=c.ubg[:, None] - g_res,
+                              lam_x0=self.lam_x.T, lam_a0=self.lam_g.T)
+            w_opt = self.w0 + sol['x'].full().T
+            lam_g = sol['lam_a']
+            # one SQP step is judged by its QP, the linearized constraints
+            g = self.qp_constraints(self.A, sol['x'], g_res).full().T
+            cost = f0.full().ravel() + sol['cost'].full().ravel()
+        else:
+            sol = self.solver(x0=self.w0.T, p=self.p.T, lbx=self.lbx.T, ubx=self.ubx.T, lbg=c.lbg, ubg=c.ubg,
+                              lam_x0=self.lam_x.T, lam_g0=self.lam_g.T)
+            w_opt = sol['x'].full().T
+            lam_g = sol['lam_g']
+            g = sol['g'].full().T
+            cost = sol['f'].full().ravel()
+        return w_opt, sol['lam_x'].full().T, lam_g.full().T, g, cost
+
+    def shiftSolution(self, u_res, x_m, lam_x, lam_g):
+        # NlpMPC.shiftSolution() of all vehicles, the tail states by one mapped model step
+        self.u0[:, :-1] = u_res[:, 1:]; self.u0[:, -1] = u_res[:, -1]
+        self.next_states[:, :-1] = x_m[:, 1:]
+        x_end = self.model_step(x_m[:, -1].T, u_res[:, -1].T, self.p_stage[:, -1].T, self.p_vehicle.T).full().T
+        self.next_states[:, -1] = np.clip(x_end, self.lbx[:, :self.nx], self.ubx[:, :self.nx])
+
+        c = self.controller
+        lam_x_states = lam_x[:, :c.n_states].reshape(self.K, self.N+1, self.nx)
+        lam_x_controls = lam_x[:, c.n_states:].reshape(self.K, self.N, self.nu)
+        lam_g_stages = lam_g.reshape(self.K, self.N+1, self.nx)
+        self.lam_x_states[:, :-1] = lam_x_states[:, 1:]; self.lam_x_states[:, -1] = lam_x_states[:, -1]
+        self.lam_x_controls[:, :-1] = lam_x_controls[:, 1:]; self.lam_x_controls[:, -1] = lam_x_controls[:, -1]
+        self.lam_g_stages[:, :-1] = lam_g_stages[:, 1:]; self.lam_g_stages[:, -1] = lam_g_stages[:, -1]
+
+    def constraintViolation(self, w, g):
+        # the largest violation of the bounds and the constraints of every vehicle
+        c = self.controller
+        return np.maximum.reduce([np.zeros(self.K), np.max(self.lbx - w, axis=1), np.max(w - self.ubx, axis=1),
+                                  np.max(c.lbg - g, axis=1), np.max(g - c.ubg, axis=1)])
+
+    def fallbackPlan(self):
+        # the shifted previous plans, the clipped references of vehicles without a solution
+        u_res, x_m = self.u0.copy(), self.next_states.copy()
+        fresh = ~self.has_solution
+        lbu = self.lbx[:, None, self.controller.n_states:self.controller.n_states + self.nu]
+        ubu = self.ubx[:, None, self.controller.n_states:self.controller.n_states + self.nu]
+        u_res[fresh] = np.clip(self.p_u_ref, lbu, ubu)[fresh]
+        x_m[fresh] = self.p_x_ref[fresh]
+        return u_res, x_m
+
+    @profiled('solve')
+    def solve(self, next_trajectories, next_controls, stage=None):
+        # next_trajectories (K, N+1, nx), next_controls (K, N, nu), stage (K, N, ns),
+        # returns the planned controls (K, N, nu)
+        start = time.perf_counter()
+        with span('parameters'):
+            self.p_x_ref[:] = next_trajectories
+            self.p_u_ref[:] = np.reshape(next_controls, (self.K, self.N, self.nu))
+            if stage is not None:
+                self.p_stage[:] = np.reshape(stage, (self.K, self.N, self.ns))
+
+        # the mapped solvers report no per-instance status, a solve succeeded if it is
+        # finite and feasible
+        with span('solver'):
+            try:
+                w_opt, lam_x, lam_g, g, cost = self.solveBackend()
+                violation = self.constraintViolation(w_opt, g)
+                success = np.isfinite(w_opt).all(axis=1) & (violation <= self.tol)
+            except RuntimeError:
+                success = np.zeros(self.K, dtype=bool)
+        self.prepared = False
+
+        # failed vehicles fall back to their shifted previous plan
+        with span('extraction'):
+            u_res, x_m = self.fallbackPlan()
+            if success.any():
+                u_res[success] = w_opt[success, self.controller.n_states:].reshape(-1, self.N, self.nu)
+                x_m[success] = w_opt[success, :self.controller.n_states].reshape(-1, self.N+1, self.nx)
+                lam_x = np.where(success[:, None], lam_x, self.lam_x)
+                lam_g = np.where(success[:, None], lam_g, self.lam_g)
+            else:
+                lam_x, lam_g = self.lam_x.copy(), self.lam_g.copy()
+            self.shiftSolution(u_res, x_m, lam_x, lam_g)
+        self.has_solution |= success
+        self.success = success
+
+        n_failed = self.K - int(np.count_nonzero(success))
+        self.stats.record(time.perf_counter() - start, -1, n_failed == 0,
+                          'Solve_Succeeded' if n_failed == 0 else 'Failed_Vehicles',
+                          float(np.sum(cost[success])) if success.any() else np.nan,
+                          float(np.max(violation[success])) if success.any() else np.nan)
+        return u_res
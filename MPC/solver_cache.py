@@ -0,0 +1,153 @@
+import casadi as ca
+import atexit
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+# bump when the problem formulation changes so that stale entries are not loaded
+CACHE_VERSION = 8
+
+# the binaries of the controllers compiled without a cache, removed when the process exits
+_jit_root = None
+
+def cache_key(controller):
+    # the references, weights, vehicle parameters and bounds are inputs of the solver,
+    # so one entry per (class, N, T, backend) serves every airframe
+    content = {
+        'version': CACHE_VERSION,
+        'casadi': ca.__version__,
+        'class': type(controller).__name__,
+        'N': int(controller.N),
+        'T': float(controller.T),
+        'backend': controller.backend,
+        'compiled': bool(controller.compiled),
+        'time_budget': controller.time_budget,
+    }
+    digest = hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+    return '%s_%s' % (type(controller).__name__, digest[:16])
+
+def cache_path(cache_dir, controller, name=None):
+    # the entry of the solver, or of the function `name` of the 'qp' and 'rti' backends
+    suffix = '' if name is None else '_' + name
+    return os.path.join(cache_dir, cache_key(controller) + suffix + '.casadi')
+
+def load_solver(cache_dir, controller, name=None):
+    # returns the cached solver function of the controller, None if there is no entry
+    if cache_dir is None:
+        return None
+    path = cache_path(cache_dir, controller, name)
+    if not os.path.isfile(path):
+        return None
+    try:
+        return ca.Function.load(path)
+    except Exception:
+        # a truncated or incompatible entry is rebuilt and overwritten
+        return None
+
+def store_solver(cache_dir, controller, solver, name=None):
+    if cache_dir is None:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(cache_dir, controller, name)
+    # write to a temporary file first so concurrent readers never see a partial entry
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    solver.save(tmp_path)
+    os.replace(tmp_path, path)
+
+def load_functions(cache_dir, controller, names):
+    # the cached functions by name, None unless all of them have an entry
+    functions = {name: load_solver(cache_dir, controller, name) for name in names}
+    if any(function is None for function in functions.values()):
+        return None
+    return functions
+
+def store_functions(cache_dir, controller, functions):
+    for name, function in functions.items():
+        store_solver(cache_dir, controller, function, name)
+
+def jit_directory(cache_dir, key):
+    # a new directory <key>.<random> for the binaries of one compiled build. The
+    # functions link to their binaries instead of embedding them (an embedded binary is
+    # written back to a fixed path on every load, concurrent loads overwrite each
+    # other's mapped file), so they are kept under the cache next to its entries,
+    # without a cache in a temporary directory of this process
+    global _jit_root
+    if cache_dir is not None:
+        root = os.path.join(os.path.abspath(cache_dir), 'jit')
+        os.makedirs(root, exist_ok=True)
+    else:
+        if _jit_root is None:
+            _jit_root = tempfile.mkdtemp(prefix='mpc_jit_')
+            atexit.register(_remove_jit_root, _jit_root, os.getpid())
+        root = _jit_root
+    return tempfile.mkdtemp(prefix=key + '.', dir=root)
+
+def _remove_jit_root(path, pid):
+    # forked workers inherit the handler, only the process that created it removes it.
+    # The builds leave no sources for casadi to remove, so this can run before the
+    # functions are freed
+    if os.getpid() == pid:
+        shutil.rmtree(path, ignore_errors=True)
+
+def compile_nlp(solver, jit_options):
+    # the path of a library with the NLP functions of the nlpsol `solver` (objective,
+    # constraints and their derivatives), compiled into jit_options['directory'];
+    # nlpsol(name, plugin, library, opts) builds the solver on it. The 'jit' option of
+    # nlpsol is not used: it writes its source to the working directory
+    path = jit_options['directory']
+    generator = ca.CodeGenerator('nlp.c')
+    generator.add(solver.oracle())
+    for name in solver.get_function():
+        generator.add(solver.get_function(name))
+    source = generator.generate(path + os.sep)
+    return ca.Importer(source, 'shell', jit_options).library()
+
+# a build with this file in its directory is in progress and not collected, unless the
+# file is older than BUILD_TIMEOUT seconds (a killed build)
+BUILD_MARKER = '.building'
+BUILD_TIMEOUT = 3600
+
+def collect_builds(cache_dir, keep):
+    # remove the build directories no entry of the cache links to: the builds of keys
+    # without entries (e.g. after a change of CACHE_VERSION, N or the backend) and the
+    # builds of the key of `keep` other than it, which its entries replaced
+    root = os.path.dirname(keep)
+    key = os.path.basename(keep).split('.')[0]
+    now = time.time()
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if path == keep or not os.path.isdir(path):
+            continue
+        marker = os.path.join(path, BUILD_MARKER)
+        try:
+            if now - os.path.getmtime(marker) < BUILD_TIMEOUT:
+                continue
+        except OSError:
+            pass  # no marker, the build is done
+        build_key = name.split('.')[0]
+        if build_key == key or not glob.glob(os.path.join(glob.escape(cache_dir), build_key + '*.casadi')):
+            shutil.rmtree(path, ignore_errors=True)
+
+@contextlib.contextmanager
+def jit_build(cache_dir, key):
+    # the directory of a compiled build of the entries `key`, store them inside the block.
+    # The sources and objects are removed afterwards, only the binaries the entries link
+    # to are kept, and the builds the cache no longer links to are collected
+    path = jit_directory(cache_dir, key)
+    marker = os.path.join(path, BUILD_MARKER)
+    open(marker, 'w').close()
+    try:
+        yield path
+    except BaseException:
+        # a failed build (e.g. no C compiler) leaves nothing behind
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+    for name in glob.glob(os.path.join(path, '*.o')) + glob.glob(os.path.join(path, '*.c')) + [marker]:
+        os.remove(name)
+    if cache_dir is not None:
+        collect_builds(os.path.abspath(cache_dir), path)
@@ -0,0 +1,90 @@
+import numpy as np
+
+class SolverStats:
+    # Fixed-size ring buffer of per-solve statistics, the newest `size` solves are kept
+    fields = ('wall_time', 'iter_count', 'success', 'status', 'cost', 'constraint_violation')
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.count = 0  # total number of recorded solves, also the ring buffer cursor
+
+        self.wall_time = np.zeros(size)                     # [s]
+        self.iter_count = np.zeros(size, dtype=np.int32)     # solver iterations, -1 if not reported
+        self.success = np.zeros(size, dtype=bool)
+        self.status = np.zeros(size, dtype=np.int16)         # index into status_names
+        self.cost = np.zeros(size)
+        self.constraint_violation = np.zeros(size)
+
+        # the return status strings, stored once and referenced by index
+        self.status_names = []
+        self.status_index = {}
+
+    def record(self, wall_time, iter_count, success, status, cost, constraint_violation):
+        if status not in self.status_index:
+            self.status_index[status] = len(self.status_names)
+            self.status_names.append(status)
+        i = self.count % self.size
+        self.wall_time[i] = wall_time
+        self.iter_count[i] = iter_count
+        self.success[i] = success
+        self.status[i] = self.status_index[status]
+        self.cost[i] = cost
+        self.constraint_violation[i] = constraint_violation
+        self.count += 1
+
+    def last(self):
+        # the arguments of record() of the newest solve
+        i = (self.count - 1) % self.size
+        return (float(self.wall_time[i]), int(self.iter_count[i]), bool(self.success[i]),
+                self.status_names[self.status[i]], float(self.cost[i]), float(self.constraint_violation[i]))
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def view(self, field):
+        # the recorded values of one field in chronological order
+        values = getattr(self, field)
+        if self.count <= self.size:
+            return values[:self.count]
+        i = self.count % self.size
+        return np.concatenate((values[i:], values[:i]))
+
+    def latency_percentiles(self, q=(50, 95, 99)):
+        # percentiles of the solve wall time [s]
+        if len(self) == 0:
+            return {p: float('nan') for p in q}
+        return {p: float(v) for p, v in zip(q, np.percentile(self.wall_time[:len(self)], q))}
+
+    def failure_count(self):
+        return int(len(self) - np.count_nonzero(self.success[:len(self)]))
+
+    def failures_by_status(self):
+        n = len(self)
+        counts = np.bincount(self.status[:n][~self.success[:n]], minlength=len(self.status_names))
+        return {name: int(c) for name, c in zip(self.status_names, counts) if c > 0}
+
+    def mean_iter_count(self):
+        # the mean over the solves that report their iterations (-1 does not), nan without any
+        reported = self.iter_count[:len(self)]
+        reported = reported[reported >= 0]
+        return float(np.mean(reported)) if len(reported) else float('nan')
+
+    def summary(self):
+        n = len(self)
+        p50, p95, p99 = (self.latency_percentiles()[q] for q in (50, 95, 99))
+        return {'solves': n,
+                'p50': p50, 'p95': p95, 'p99': p99,
+                'mean_iter_count': self.mean_iter_count(),
+                'failures': self.failure_count()}
+
+    def to_npz(self, path):
+        np.savez(path, status_names=np.array(self.status_names, dtype=str),
+                 **{field: self.view(field) for field in self.fields})
+
+    def to_csv(self, path):
+        columns = [self.view(field) for field in self.fields]
+        with open(path, 'w') as f:
+            f.write(','.join(self.fields) + '\n')
+            for wall_time, iter_count, success, status, cost, violation in zip(*columns):
+                f.write('%.9f,%d,%d,%s,%.12g,%.6g\n' % (wall_time, iter_count, success,
+                                                      self.status_names[status], cost, violation))
@@ -0,0 +1,25 @@
+import math
+from dynamics.Quadrotor import Quadrotor
+from motor_model.motor_model import MotorModel
+from scripts.cascade import ATTITUDE_RATIO, buildCascade, buildControllers, buildReferences
+from scripts.main import simulate
+from utils.telemetry import TelemetryRecorder
+from benchmarks.common import latency
+
+def run(N=50, sim_time=10.0, dt=0.02, attitude_ratio=ATTITUDE_RATIO, compiled=False, cache_dir=None, warmup=5):
+    # one scheduler.step() of scripts/main.py on the circle, built as main builds it: an
+    # attitude solve, the motor model and one dynamics step every attitude period, the
+    # altitude and position solves (with the IPOPT budget of main) every attitude_ratio-th
+    # tick. The failures of the budgeted solves depend on the load of the machine, the
+    # solve group measures the failures of the controllers
+    attitude_dt = dt/attitude_ratio
+    quad = Quadrotor(keep_history=False)
+    traj, attitude_traj = buildReferences(sim_time, dt, attitude_dt)
+    controllers = buildControllers(quad, N, dt, compiled=compiled, cache_dir=cache_dir)
+    scheduler = buildCascade(quad, MotorModel(), traj, controllers, attitude_dt)
+    recorder = TelemetryRecorder(capacity=int(math.ceil(sim_time/attitude_dt - 1e-9)))
+    wall_time = simulate(scheduler, quad, attitude_traj, controllers, sim_time, attitude_dt, recorder)
+
+    result = latency(recorder['tick_time'][warmup:])
+    result['sim_s_per_wall_s'] = len(recorder)*attitude_dt/wall_time
+    return {'cascade/tick/N=%d/attitude_ratio=%d' % (N, attitude_ratio): result}
@@ -0,0 +1,41 @@
+import numpy as np
+import time
+
+SEED = 0  # of every random scenario, so that runs are comparable
+
+def latency(times, iter_counts=None, failures=None):
+    # the result of a latency scenario from its wall times [s]
+    times = np.asarray(times)*1e3
+    p50, p95, p99 = np.percentile(times, [50, 95, 99])
+    result = {'n': len(times), 'mean_ms': float(np.mean(times)),
+              'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99)}
+    if iter_counts is not None:
+        # the solves that report their iterations, -1 marks the others; the statistics
+        # are None (null in json) when no solve reports them, e.g. some conic solvers
+        iter_counts = np.asarray(iter_counts)
+        iter_counts = iter_counts[iter_counts >= 0]
+        if len(iter_counts):
+            result['iter_mean'] = float(np.mean(iter_counts))
+            result['iter_p50'] = float(np.percentile(iter_counts, 50))
+            result['iter_max'] = int(np.max(iter_counts))
+        else:
+            result['iter_mean'] = result['iter_p50'] = None
+            result['iter_max'] = -1
+    if failures is not None:
+        result['failures'] = int(failures)
+    return result
+
+def throughput(step, n_calls, items_per_call=1, warmup=10):
+    # the result of a throughput scenario: step() timed n_calls times, each processing
+    # items_per_call items (steps, rows, ...)
+    for _ in range(warmup):
+        step()
+    times = np.zeros(n_calls)
+    for i in range(n_calls):
+        start = time.perf_counter()
+        step()
+        times[i] = time.perf_counter() - start
+    result = latency(times)
+    result['items_per_call'] = items_per_call
+    result['items_per_s'] = float(n_calls*items_per_call/np.sum(times))
+    return result
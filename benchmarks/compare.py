@@ -0,0 +1,100 @@
+import argparse
+import json
+import sys
+from benchmarks import run as benchmarks
+
+# the tolerance band of each checked metric, higher values are worse: a result regresses
+# when it exceeds baseline*(1 + relative) + absolute. A baseline file may override them
+# with its own "tolerances" entry of the same layout. The absolute latency band covers
+# the timer and scheduling jitter of the sub-millisecond scenarios.
+TOLERANCES = {'p95_ms': {'relative': 0.25, 'absolute': 0.1},
+              'iter_mean': {'relative': 0.10, 'absolute': 0.5},
+              'failures': {'relative': 0.0, 'absolute': 0}}
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+def rerun(baseline, repeat=3, cache_dir=None):
+    # the scenarios of the baseline with its settings, the median of each metric over
+    # `repeat` runs to filter out noise of the machine
+    settings = baseline['meta'].get('settings', {})
+    groups = settings.get('groups', list(benchmarks.GROUPS))
+    return benchmarks.median([benchmarks.run(groups, quick=settings.get('quick', False),
+                                             compiled=settings.get('compiled', False), cache_dir=cache_dir)
+                              for _ in range(repeat)])
+
+def compare(baseline, results, tolerances=None):
+    # the checks of every metric of the baseline: (scenario, metric, baseline, current, limit, status)
+    # with status 'regression', 'missing', 'improved' or 'ok'
+    tolerances = dict(TOLERANCES, **(tolerances or {}))
+    checks = []
+    for name, reference in sorted(baseline['results'].items()):
+        for metric, band in tolerances.items():
+            if metric not in reference:
+                continue
+            base = reference[metric]
+            if base is None or not base >= 0:
+                continue  # not reported by the solver (null or -1), e.g. the iterations of a conic solver
+            limit = base*(1 + band['relative']) + band['absolute']
+            current = results.get(name, {}).get(metric)
+            if current is None:
+                status = 'missing'
+            elif current > limit:
+                status = 'regression'
+            elif current < base:
+                status = 'improved'
+            else:
+                status = 'ok'
+            checks.append((name, metric, base, current, limit, status))
+    return checks
+
+def formatChecks(checks, verbose=False):
+    # the checks as a diff table, only the failed ones unless verbose
+    lines = ["%-52s %-10s %12s %12s %8s %12s  %s" % ('scenario', 'metric', 'baseline', 'current', 'change', 'limit', 'status')]
+    for name, metric, base, current, limit, status in checks:
+        if not verbose and status not in ('regression', 'missing'):
+            continue
+        if current is None:
+            lines.append("%-52s %-10s %12.4f %12s %8s %12.4f  %s" % (name, metric, base, '-', '-', limit, status))
+        else:
+            change = '%+7.1f%%' % (100*(current - base)/base) if base else '%+8.3g' % (current - base)
+            lines.append("%-52s %-10s %12.4f %12.4f %8s %12.4f  %s" % (name, metric, base, current, change, limit, status))
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the benchmarks against a baseline, exit 1 on a regression.")
+    parser.add_argument('--baseline', default='benchmarks/baseline.json', help="the baseline json of benchmarks.run")
+    parser.add_argument('--results', default=None, help="compare this results json instead of rerunning the baseline scenarios")
+    parser.add_argument('--repeat', type=int, default=3, help="reruns, the median of each metric is compared")
+    parser.add_argument('--cache-dir', default='.mpc_cache', help="solver cache of the compiled solvers")
+    parser.add_argument('--latency-tolerance', type=float, default=None, help="relative p95 tolerance, e.g. 0.25")
+    parser.add_argument('--iteration-tolerance', type=float, default=None, help="relative iteration tolerance, e.g. 0.1")
+    parser.add_argument('--out', default=None, help="write the rerun results to this json file")
+    parser.add_argument('--verbose', action='store_true', help="list every check, not only the failed ones")
+    args = parser.parse_args()
+
+    baseline = load(args.baseline)
+    tolerances = {metric: dict(band) for metric, band in baseline.get('tolerances', TOLERANCES).items()}
+    if args.latency_tolerance is not None:
+        tolerances.setdefault('p95_ms', dict(TOLERANCES['p95_ms']))['relative'] = args.latency_tolerance
+    if args.iteration_tolerance is not None:
+        tolerances.setdefault('iter_mean', dict(TOLERANCES['iter_mean']))['relative'] = args.iteration_tolerance
+
+    if args.results is not None:
+        results = load(args.results)['results']
+    else:
+        results = rerun(baseline, args.repeat, args.cache_dir)
+        if args.out is not None:
+            with open(args.out, 'w') as f:
+                json.dump({'meta': benchmarks.metadata(**baseline['meta'].get('settings', {})), 'results': results},
+                          f, indent=2, sort_keys=True, allow_nan=False)
+
+    checks = compare(baseline, results, tolerances)
+    failed = [check for check in checks if check[-1] in ('regression', 'missing')]
+    if failed or args.verbose:
+        print(formatChecks(checks, args.verbose))
+    print("%d checks, %d failed against %s (commit %s)" % (
+        len(checks), len(failed), args.baseline, baseline['meta'].get('commit')))
+    sys.exit(1 if failed else 0)
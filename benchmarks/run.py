@@ -0,0 +1,99 @@
+import numpy as np
+import argparse
+import casadi as ca
+import json
+import os
+import platform
+import subprocess
+import time
+from benchmarks import cascade_tick, solve_latency, throughput
+from benchmarks.common import SEED
+
+def metadata(**settings):
+    # where, on what and with which settings the results were measured
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'casadi': ca.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'seed': SEED,
+            'settings': settings}
+
+def run(groups, quick=False, compiled=False, cache_dir=None):
+    # the results of the scenario groups by scenario name
+    scale = 5 if quick else 1
+    suites = {
+        'solve': lambda: solve_latency.run(Ns=(10, 30) if quick else (10, 30, 50, 100), n_solves=100//scale,
+                                           compiled=compiled, cache_dir=cache_dir),
+        'backends': lambda: solve_latency.runBackends(n_solves=200//scale),
+        'cascade': lambda: cascade_tick.run(sim_time=10.0/scale, compiled=compiled, cache_dir=cache_dir),
+        'motor': lambda: throughput.runMotorModel(n_calls=2000//scale),
+        'dynamics': lambda: throughput.runDynamics(n_steps=5000//scale),
+    }
+    results = {}
+    for group in groups:
+        start = time.perf_counter()
+        results.update(suites[group]())
+        print("%-8s done in %.1f s" % (group, time.perf_counter() - start))
+    return results
+
+def median(runs):
+    # the median of every metric of each scenario over repeated runs of the same groups,
+    # a single slow run of the machine does not move it, counts stay integers and
+    # unreported metrics (None) stay None
+    results = {}
+    for name in runs[0]:
+        metrics = [r[name] for r in runs if name in r]
+        results[name] = {}
+        for metric, value in metrics[0].items():
+            values = [m[metric] for m in metrics if m[metric] is not None]
+            if not values:
+                results[name][metric] = None
+                continue
+            value = float(np.median(values))
+            results[name][metric] = int(round(value)) if isinstance(metrics[0][metric], int) else value
+    return results
+
+def formatResults(results):
+    lines = []
+    for name, result in results.items():
+        line = "%-52s p50 %9.4f ms  p95 %9.4f ms  p99 %9.4f ms" % (name, result['p50_ms'], result['p95_ms'], result['p99_ms'])
+        if 'iter_mean' in result:
+            # None when the solver reports no iterations, e.g. some conic solvers
+            iterations = '%5.1f' % result['iter_mean'] if result['iter_mean'] is not None else '    -'
+            line += "  iterations %s  failures %d" % (iterations, result['failures'])
+        if 'items_per_s' in result:
+            line += "  %12.0f /s" % result['items_per_s']
+        if 'sim_s_per_wall_s' in result:
+            line += "  %.2f simulated s per wall s" % result['sim_s_per_wall_s']
+        lines.append(line)
+    return '\n'.join(lines)
+
+GROUPS = ('solve', 'backends', 'cascade', 'motor', 'dynamics')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the MPC solve latency and the simulator throughput.")
+    parser.add_argument('--only', nargs='+', default=list(GROUPS), choices=GROUPS, help="scenario groups to run")
+    parser.add_argument('--quick', action='store_true', help="fewer samples and horizons, e.g. for CI")
+    parser.add_argument('--compiled', action='store_true', help="JIT-compile the controllers as scripts/main.py")
+    parser.add_argument('--cache-dir', default='.mpc_cache', help="solver cache of the compiled solvers")
+    parser.add_argument('--repeat', type=int, default=3, help="runs of the groups, the median of each metric is kept")
+    parser.add_argument('--out', default=None, help="write the results to this json file")
+    args = parser.parse_args()
+
+    results = median([run(args.only, quick=args.quick, compiled=args.compiled,
+                          cache_dir=args.cache_dir if args.compiled else None) for _ in range(args.repeat)])
+    print(formatResults(results))
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            meta = metadata(groups=args.only, quick=args.quick, compiled=args.compiled, repeat=args.repeat)
+            json.dump({'meta': meta, 'results': results}, f, indent=2, sort_keys=True, allow_nan=False)
+        print("results written to %s" % args.out)
@@ -0,0 +1,71 @@
+import numpy as np
+import time
+from dynamics.Quadrotor import Quadrotor
+from MPC.MPCController import AltitudeMPC, AttitudeMPC, PositionMPC
+from trajectory.reference import ReferenceTrajectory
+from benchmarks.common import SEED, latency
+
+def scenario(N, n_solves, dt):
+    # the solve inputs of each loop on consecutive samples of the circle, from states
+    # around the reference (seeded), as the cascade produces them in closed loop
+    rng = np.random.default_rng(SEED)
+    traj = ReferenceTrajectory(n_solves*dt, dt, horizon=max(N, 200))
+    quad = Quadrotor(keep_history=False)
+    inputs = {'altitude': [], 'position': [], 'attitude': []}
+    for i in range(n_solves):
+        quad.pos = traj.pos[i, :3] + rng.normal(0, 0.1, 3)
+        quad.dpos = traj.vel[i, :3] + rng.normal(0, 0.1, 3)
+        quad.ori = np.array([0.0, 0.0, traj.pos[i, 3]]) + rng.normal(0, 0.02, 3)
+        quad.dori = rng.normal(0, 0.05, 3)
+        x_, u_ = traj.desired_altitude(quad, i, N)
+        thrust = u_[:, 0].copy()
+        inputs['altitude'].append((x_.copy(), u_.copy()))
+        x_, u_ = traj.desired_position(quad, i, N, thrust)
+        inputs['position'].append((x_.copy(), u_.copy(), thrust))
+        x_, u_ = traj.desired_attitude(quad, i, N, u_[:, 0].copy(), u_[:, 1].copy())
+        inputs['attitude'].append((x_.copy(), u_.copy()))
+    return quad, inputs
+
+def timeSolves(controller, inputs, warmup):
+    # wall time of each solve after the first `warmup`, the RTI preparation runs
+    # between the solves as in the cascade and is not timed
+    times = []
+    for args in inputs:
+        start = time.perf_counter()
+        controller.solve(*args)
+        times.append(time.perf_counter() - start)
+        controller.prepare()
+    iter_counts = controller.stats.view('iter_count')[warmup:]
+    failures = len(iter_counts) - np.count_nonzero(controller.stats.view('success')[warmup:])
+    return latency(times[warmup:], iter_counts, failures)
+
+def run(Ns=(10, 30, 50, 100), n_solves=100, warmup=5, dt=0.02, compiled=False, cache_dir=None):
+    # solve() of each controller class with the backend of scripts/main.py, without a time budget
+    results = {}
+    for N in Ns:
+        quad, inputs = scenario(N, n_solves + warmup, dt)
+        controllers = (('altitude', AltitudeMPC(quad, T=dt, N=N, backend='qp', compiled=compiled, cache_dir=cache_dir)),
+                       ('position', PositionMPC(quad, T=dt, N=N, compiled=compiled, cache_dir=cache_dir)),
+                       ('attitude', AttitudeMPC(quad, T=dt, N=N, backend='rti', compiled=compiled, cache_dir=cache_dir)))
+        for name, controller in controllers:
+            key = 'solve/%s/%s/N=%d' % (type(controller).__name__, controller.backend, N)
+            results[key] = timeSolves(controller, inputs[name], warmup)
+    return results
+
+def runBackends(N=50, n_solves=200, warmup=5, dt=0.02):
+    # AltitudeMPC with IPOPT, the condensed qp backend and each conic solver on every
+    # solve (condensing=False), on the same references
+    quad, inputs = scenario(N, n_solves + warmup, dt)
+    backends = {'ipopt': dict(backend='ipopt'), 'qp/condensed': dict(backend='qp')}
+    for qp_solver in ('osqp', 'qpoases', 'qrqp'):
+        backends['qp/' + qp_solver] = dict(backend='qp', qp_solver=qp_solver, condensing=False)
+
+    results = {}
+    for name, kwargs in backends.items():
+        try:
+            controller = AltitudeMPC(quad, T=dt, N=N, **kwargs)
+        except Exception as e:
+            print("AltitudeMPC %s unavailable: %s" % (name, e))
+            continue
+        results['backend/AltitudeMPC/%s/N=%d' % (name, N)] = timeSolves(controller, inputs['altitude'], warmup)
+    return results
@@ -0,0 +1,38 @@
+import numpy as np
+from dynamics.Quadrotor import Quadrotor
+from dynamics.quadrotor_batch import QuadrotorBatch
+from motor_model.motor_model import MotorModel
+from benchmarks.common import SEED, throughput
+
+def wrenches(M):
+    # seeded wrench rows around hover
+    rng = np.random.default_rng(SEED)
+    return np.column_stack((rng.uniform(2.0, 4.0, M), rng.normal(0, 0.01, (M, 3))))
+
+def runMotorModel(n_calls=2000, batch_sizes=(50, 10000)):
+    motor_model = MotorModel()
+    results = {}
+    W = wrenches(n_calls)
+    rows = iter(np.tile(W, (2, 1)))  # the warmup calls consume rows too
+    results['motor/calculate_motor_speed'] = throughput(
+        lambda: motor_model.calculate_motor_speed(*next(rows)), n_calls)
+    for M in batch_sizes:
+        W, out = wrenches(M), np.zeros((M, 4))
+        results['motor/calculate_motor_speeds/M=%d' % M] = throughput(
+            lambda: motor_model.calculate_motor_speeds(W, out=out), max(n_calls*50//M, 20), M)
+    return results
+
+def runDynamics(n_steps=5000, K=1000, dt=0.02):
+    # Quadrotor.updateConfiguration hovering with small torques, and QuadrotorBatch of K vehicles
+    quad = Quadrotor(pos=[0, 0, -2], keep_history=False)
+    hover = quad.mq*quad.g
+    results = {'dynamics/Quadrotor.updateConfiguration': throughput(
+        lambda: quad.updateConfiguration(hover, 1e-4, -1e-4, 1e-5, dt), n_steps)}
+
+    batch = QuadrotorBatch(K)
+    batch.pos[:, 2] = -2
+    thrust = np.full(K, hover)
+    torques = np.random.default_rng(SEED).normal(0, 1e-4, (3, K))
+    results['dynamics/QuadrotorBatch.updateConfiguration/K=%d' % K] = throughput(
+        lambda: batch.updateConfiguration(thrust, *torques, dt), max(n_steps//10, 20), K)
+    return results
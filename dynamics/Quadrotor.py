@@ -1,19 +1,19 @@
 import numpy as np
 import math
 import time
-import matplotlib.pyplot as plt
 
 class Quadrotor:
-    def __init__(self, pos=[0,0,0], ori=[0,0,0], dpos=[0,0,0], dori=[0,0,0]):
+    def __init__(self, pos=[0,0,0], ori=[0,0,0], dpos=[0,0,0], dori=[0,0,0], keep_history=True):
         # The configuration of quadrotor
         self.pos = np.array(pos)
         self.ori = np.array(ori)
         self.dpos = np.array(dpos)
         self.dori = np.array(dori)
 
-        # The paths
-        self.path = [np.append(self.pos, self.ori)]
-        self.vel = [np.append(self.dpos, self.dori)]
+        # The paths, None without history (e.g. recorded by a TelemetryRecorder)
+        self.keep_history = keep_history
+        self.path = [np.append(self.pos, self.ori)] if keep_history else None
+        self.vel = [np.append(self.dpos, self.dori)] if keep_history else None
         # The constant parameters of quadrotor
         self.mq =0.302              # Mass of the quadrotor [kg]
         self.g = 9.8                # Gravity [m/s^2]
@@ -93,14 +93,16 @@ class Quadrotor:
         self.dori = self.dori + ddori*dt
         self.correctDotState()
 
-        self.vel.append(np.append(self.dpos, self.dori))
+        if self.keep_history:
+            self.vel.append(np.append(self.dpos, self.dori))
         
         self.pos = self.pos + self.dpos*dt
         self.ori = self.ori + self.dori*dt
         self.correctState()
 
         # Add current configuration to paths
-        self.path.append(np.append(self.pos, self.ori))
+        if self.keep_history:
+            self.path.append(np.append(self.pos, self.ori))
 
 
     def updateConfigurationViaSpeed(self, o1, o2, o3, o4, dt):
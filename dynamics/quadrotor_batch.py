@@ -0,0 +1,106 @@
+import numpy as np
+from dynamics.Quadrotor import Quadrotor
+
+class QuadrotorBatch:
+    # K quadrotors of dynamics/Quadrotor.py stepped together with vectorized NumPy.
+    #
+    # The states are the rows of one (K, 12) array [x, y, z, phi, the, psi,
+    # dx, dy, dz, dphi, dthe, dpsi], pos/ori/dpos/dori are (K, 3) views into it.
+    # Every parameter and bound is a (K,) array, so the vehicles may differ. The
+    # update follows Quadrotor.updateConfiguration operation by operation, including
+    # the clamping, and gives the same trajectories as K scalar vehicles.
+    parameters = ('mq', 'g', 'Ix', 'Iy', 'Iz', 'la', 'b', 'd',
+                  'max_z', 'min_phi', 'max_phi', 'min_the', 'max_the',
+                  'min_dx', 'max_dx', 'min_dy', 'max_dy', 'min_dz', 'max_dz',
+                  'min_dphi', 'max_dphi', 'min_dthe', 'max_dthe', 'min_dpsi', 'max_dpsi',
+                  'min_thrust', 'max_thrust', 'min_tau_phi', 'max_tau_phi',
+                  'min_tau_the', 'max_tau_the', 'min_tau_psi', 'max_tau_psi')
+
+    def __init__(self, K, quads=None, state=None):
+        # quads: one Quadrotor per vehicle (or a single one shared by all), default Quadrotor()
+        self.K = K
+        if quads is None:
+            quads = Quadrotor()
+        if not isinstance(quads, (list, tuple)):
+            quads = [quads]*K
+        if len(quads) != K:
+            raise ValueError("Expected %d quadrotors, got %d" % (K, len(quads)))
+        for name in self.parameters:
+            setattr(self, name, np.array([getattr(q, name) for q in quads], dtype=float))
+
+        self.state = np.zeros((K, 12))
+        if state is not None:
+            self.state[:] = state
+        self.pos = self.state[:, 0:3]
+        self.ori = self.state[:, 3:6]
+        self.dpos = self.state[:, 6:9]
+        self.dori = self.state[:, 9:12]
+
+        # the derivatives of the last step
+        self.ddpos = np.zeros((K, 3))
+        self.ddori = np.zeros((K, 3))
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.pos = self.state[:, 0:3]
+        self.ori = self.state[:, 3:6]
+        self.dpos = self.state[:, 6:9]
+        self.dori = self.state[:, 9:12]
+
+    def correctControl(self, thrust, tau_phi, tau_the, tau_psi):
+        thrust = np.minimum(np.maximum(thrust, self.min_thrust), self.max_thrust)
+        tau_phi = np.minimum(np.maximum(tau_phi, self.min_tau_phi), self.max_tau_phi)
+        tau_the = np.minimum(np.maximum(tau_the, self.min_tau_the), self.max_tau_the)
+        tau_psi = np.minimum(np.maximum(tau_psi, self.min_tau_psi), self.max_tau_psi)
+        return thrust, tau_phi, tau_the, tau_psi
+
+    def correctDotState(self):
+        for i, (lo, hi) in enumerate(((self.min_dx, self.max_dx), (self.min_dy, self.max_dy),
+                                      (self.min_dz, self.max_dz))):
+            np.minimum(np.maximum(self.dpos[:, i], lo), hi, out=self.dpos[:, i])
+        for i, (lo, hi) in enumerate(((self.min_dphi, self.max_dphi), (self.min_dthe, self.max_dthe),
+                                      (self.min_dpsi, self.max_dpsi))):
+            np.minimum(np.maximum(self.dori[:, i], lo), hi, out=self.dori[:, i])
+
+    def correctState(self):
+        np.minimum(self.pos[:, 2], self.max_z, out=self.pos[:, 2])
+
+        np.minimum(np.maximum(self.ori[:, 0], self.min_phi), self.max_phi, out=self.ori[:, 0])
+        np.minimum(np.maximum(self.ori[:, 1], self.min_the), self.max_the, out=self.ori[:, 1])
+
+    def updateConfiguration(self, thrust, tau_phi, tau_the, tau_psi, dt):
+        # one step of all vehicles, the controls are (K,) arrays or scalars
+        phi = self.ori[:, 0]
+        the = self.ori[:, 1]
+
+        dphi = self.dori[:, 0]
+        dthe = self.dori[:, 1]
+        dpsi = self.dori[:, 2]
+
+        # The dynamic equations
+        thrust, tau_phi, tau_the, tau_psi = self.correctControl(thrust, tau_phi, tau_the, tau_psi)
+        self.ddpos[:, 0] = thrust/self.mq*np.sin(the)
+        self.ddpos[:, 1] = -thrust/self.mq*np.sin(phi)
+        self.ddpos[:, 2] = self.g - thrust/self.mq
+
+        self.ddori[:, 0] = (dthe*dpsi*(self.Iy - self.Iz) + tau_phi*self.la)/self.Ix
+        self.ddori[:, 1] = (dphi*dpsi*(self.Iz - self.Ix) + tau_the*self.la)/self.Iy
+        self.ddori[:, 2] = (dphi*dthe*(self.Ix - self.Iy) + tau_psi)/self.Iz
+
+        # Update the quadrotor states
+        self.dpos += self.ddpos*dt
+        self.dori += self.ddori*dt
+        self.correctDotState()
+
+        self.pos += self.dpos*dt
+        self.ori += self.dori*dt
+        self.correctState()
+
+    def updateConfigurationViaSpeed(self, o1, o2, o3, o4, dt):
+        # Compute the control vector through angular speed, (K,) arrays
+        thrust = self.b * (o1**2 + o2**2 + o3**2 + o4**2)
+        tau_phi = self.b * (-o2**2 + o4**2)
+        tau_the = self.b * (o1**2 - o3**2)
+        tau_psi = self.d * (o1**2 - o2**2 + o3**2 - o4**2)
+        self.updateConfiguration(thrust, tau_phi, tau_the, tau_psi, dt)
+        return thrust, tau_phi, tau_the, tau_psi
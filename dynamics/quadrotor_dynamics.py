@@ -8,7 +8,11 @@ class Quadrotor:
                  inertia=np.diag([3.9195e-4, 4.0515e-4, 6.3890e-3]), 
                  motor_constant: float = 2.9265e-7, 
                  moment_constant: float = 0.0162,
-                 arm_length: float = 0.0775):
+                 arm_length: float = 0.0775,
+                 K=None):
+        # K: the number of vehicles stepped together, the states are then (K, 3) arrays
+        # and the motor speeds (4, K) columns. None is a single vehicle
+        self.K = K
         self.mass = mass
         self.arm_length = arm_length
         self.gravity = gravity
@@ -20,11 +24,12 @@ class Quadrotor:
                                            [arm_length*thrust_coeff, 0, -arm_length*thrust_coeff, 0],
                                            [torque_coeff, -torque_coeff, torque_coeff, -torque_coeff]])
         
+        shape = 3 if K is None else (K, 3)
         self.state = {
-            'position': np.zeros(3),  # [x, y, z]
-            'velocity': np.zeros(3),  # [vx, vy, vz]
-            'orientation': np.zeros(3),  # Euler angles [roll, pitch, yaw]
-            'angular_velocity': np.zeros(3)  # [p, q, r]
+            'position': np.zeros(shape),  # [x, y, z]
+            'velocity': np.zeros(shape),  # [vx, vy, vz]
+            'orientation': np.zeros(shape),  # Euler angles [roll, pitch, yaw]
+            'angular_velocity': np.zeros(shape)  # [p, q, r]
         }
 
         # Setup constraints for quadrotor
@@ -45,40 +50,39 @@ class Quadrotor:
         self.max_tau_psi = 10.0; self.min_tau_psi = -self.max_tau_psi
 
     def motor_to_forces_and_torques(self, motor_speeds):
-        # Convert motor speeds (rad/s) to forces using thrust coefficient
-        U = self.allocation_matrix @ motor_speeds**2  
-        U1 = U[0, 0]
-        U2 = U[1, 0]
-        U3 = U[2, 0]
-        U4 = U[3, 0]
-        return U1, U2, U3, U4
+        # Convert motor speeds (rad/s) to forces using thrust coefficient, one column per vehicle
+        U = self.allocation_matrix @ np.reshape(motor_speeds, (4, -1))**2
+        if self.K is None:
+            U = U[:, 0]
+        return U[0], U[1], U[2], U[3]
 
     def update_state(self, motor_speeds, dt=0.01):
         # Calculate forces and torques
         U1, U2, U3, U4 = self.motor_to_forces_and_torques(motor_speeds)
+        phi = self.state['orientation'][..., 0]
+        the = self.state['orientation'][..., 1]
+        psi = self.state['orientation'][..., 2]
 
         # Update linear acceleration
-        ddx = U1/self.mass*(np.cos(self.state['orientation'][0])*np.sin(self.state['orientation'][1])*np.cos(self.state['orientation'][2]) + \
-                            np.sin(self.state['orientation'][0])*np.sin(self.state['orientation'][2]))
-        ddy = U1/self.mass*(np.cos(self.state['orientation'][0])*np.sin(self.state['orientation'][1])*np.sin(self.state['orientation'][2]) - \
-                            np.sin(self.state['orientation'][0])*np.cos(self.state['orientation'][2]))
-        ddz = self.gravity - U1/self.mass*(np.cos(self.state['orientation'][0])*np.cos(self.state['orientation'][1]))
+        ddx = U1/self.mass*(np.cos(phi)*np.sin(the)*np.cos(psi) + np.sin(phi)*np.sin(psi))
+        ddy = U1/self.mass*(np.cos(phi)*np.sin(the)*np.sin(psi) - np.sin(phi)*np.cos(psi))
+        ddz = self.gravity - U1/self.mass*(np.cos(phi)*np.cos(the))
 
         # Calculate and update linear acceleration
-        acceleration = np.array([ddx, ddy, ddz])
+        acceleration = np.stack((ddx, ddy, ddz), axis=-1)
         self.state['velocity'] += acceleration * dt
         self.state['position'] += self.state['velocity'] * dt
 
         # Update angular acceleration
-        ddphi = (self.state['angular_velocity'][1]*self.state['angular_velocity'][2]*\
-                 (self.inertia[1,1] - self.inertia[2,2]) + U2)/self.inertia[0,0]
-        ddthe = (self.state['angular_velocity'][2]*self.state['angular_velocity'][0]*\
-                 (self.inertia[2,2] - self.inertia[0,0]) + U3)/self.inertia[1,1]
-        ddpsi = (self.state['angular_velocity'][0]*self.state['angular_velocity'][1]*\
-                 (self.inertia[0,0] - self.inertia[1,1]) + U4)/self.inertia[2,2]
-        
+        p = self.state['angular_velocity'][..., 0]
+        q = self.state['angular_velocity'][..., 1]
+        r = self.state['angular_velocity'][..., 2]
+        ddphi = (q*r*(self.inertia[1,1] - self.inertia[2,2]) + U2)/self.inertia[0,0]
+        ddthe = (r*p*(self.inertia[2,2] - self.inertia[0,0]) + U3)/self.inertia[1,1]
+        ddpsi = (p*q*(self.inertia[0,0] - self.inertia[1,1]) + U4)/self.inertia[2,2]
+
         # Calculate and update angular acceleration
-        angular_acceleration = np.array([ddphi, ddthe, ddpsi])
+        angular_acceleration = np.stack((ddphi, ddthe, ddpsi), axis=-1)
         self.state['angular_velocity'] += angular_acceleration * dt
         self.state['orientation'] += self.state['angular_velocity'] * dt
 
@@ -88,3 +92,6 @@ class Quadrotor:
 # motor_speeds = np.array([400, 400, 400, 400]).reshape(4,1)  
 # quadrotor = Quadrotor()
 # print(quadrotor.update_state(motor_speeds))
+# # Three vehicles, one column of motor speeds each
+# quadrotors = Quadrotor(K=3)
+# print(quadrotors.update_state(np.tile(motor_speeds, (1, 3))))
@@ -1,10 +1,10 @@
 import numpy as np
-import warnings
 
 class MotorModel:
-    def __init__(self, motor_constant: float = 2.9265e-7, 
+    def __init__(self, motor_constant: float = 2.9265e-7,
                  moment_constant: float = 0.0162,
-                 arm_length: float = 0.0775):
+                 arm_length: float = 0.0775,
+                 max_speed: float = 3000):
         thrust_coeff = motor_constant
         torque_coeff = motor_constant * moment_constant
         self.allocation_matrix = np.array([[thrust_coeff, thrust_coeff, thrust_coeff, thrust_coeff],
@@ -12,18 +12,52 @@ class MotorModel:
                                            [arm_length*thrust_coeff, 0, -arm_length*thrust_coeff, 0],
                                            [torque_coeff, -torque_coeff, torque_coeff, -torque_coeff]])
         self.inv_allocation_matrix = np.linalg.inv(self.allocation_matrix)
+        # the transposes for row-wise batches, (M, 4) @ (4, 4)
+        self.inv_allocation_matrix_T = np.ascontiguousarray(self.inv_allocation_matrix.T)
+        self.allocation_matrix_T = np.ascontiguousarray(self.allocation_matrix.T)
+        self.max_speed = max_speed
+
+        # per motor: the wrenches that needed a negative squared speed (replaced by 0)
+        # and the speeds clipped to max_speed, counted instead of warned about
+        self.negative_count = np.zeros(4, dtype=np.int64)
+        self.saturation_count = np.zeros(4, dtype=np.int64)
+        self.wrench = np.zeros((1, 4))
+
+    def reset_counts(self):
+        self.negative_count[:] = 0
+        self.saturation_count[:] = 0
+
+    @staticmethod
+    def wrench_rows(wrenches):
+        # the wrenches as rows (M, 4), a single wrench (4,) is one row
+        wrenches = np.atleast_2d(wrenches)
+        if wrenches.ndim != 2 or wrenches.shape[1] != 4:
+            raise ValueError("Expected wrench rows of shape (M, 4), got %s" % (wrenches.shape,))
+        return wrenches
+
+    def calculate_motor_speeds(self, wrenches, out=None):
+        # The motor speeds (M, 4) of the wrench rows [thrust, torque_roll, torque_pitch,
+        # torque_yaw] (M, 4), e.g. a whole MPC plan or one row per vehicle of a fleet
+        speeds = np.matmul(self.wrench_rows(wrenches), self.inv_allocation_matrix_T, out=out)
+        self.negative_count += (speeds < 0).sum(axis=0)
+        np.maximum(speeds, 0, out=speeds)
+        np.sqrt(speeds, out=speeds)
+        self.saturation_count += (speeds > self.max_speed).sum(axis=0)
+        np.minimum(speeds, self.max_speed, out=speeds)
+        return speeds
+
+    def feasible(self, wrenches):
+        # (M,) True for the wrench rows the motors produce without clipping
+        speeds_sq = self.wrench_rows(wrenches) @ self.inv_allocation_matrix_T
+        return np.all((speeds_sq >= 0) & (speeds_sq <= self.max_speed**2), axis=1)
 
     def calculate_motor_speed(self, thrust, torque_roll, torque_pitch, torque_yaw):
-        U = np.array([thrust, torque_roll, torque_pitch, torque_yaw]).reshape(4, 1)
-        motor_speeds_sq = self.inv_allocation_matrix @ U
-        negative_indices = motor_speeds_sq < 0
-        if np.any(negative_indices):
-            warnings.warn("Negative values encountered in motor speeds squared, replacing with zero.")
-            motor_speeds_sq[negative_indices] = 0
-
-        motor_speeds = np.clip(np.sqrt(motor_speeds_sq), 0, 3000)
-        return motor_speeds
-    
+        self.wrench[0] = thrust, torque_roll, torque_pitch, torque_yaw
+        return self.calculate_motor_speeds(self.wrench).reshape(4, 1)
+
     def calculate_forces_n_torques(self, motor_speeds):
         return self.allocation_matrix @ motor_speeds**2
-        
\ No newline at end of file
+
+    def calculate_wrenches(self, motor_speeds):
+        # the wrench rows (M, 4) of the motor speeds (M, 4)
+        return (motor_speeds*motor_speeds) @ self.allocation_matrix_T
@@ -0,0 +1,51 @@
+from MPC.MPCController import AltitudeMPC, AttitudeMPC, PositionMPC
+from scripts.scheduler import CascadeScheduler, PipelinedScheduler
+from trajectory.reference import ReferenceTrajectory, circle
+from trajectory.streaming import StreamingTrajectory, stream
+from trajectory.waypoints import WaypointTrajectory
+from trajectory.minsnap import MinimumSnapTrajectory
+
+# attitude loop periods per period of the altitude and position loops, 200 Hz at dt = 0.02
+ATTITUDE_RATIO = 4
+
+# the wall time limit of each IPOPT solve as a fraction of dt, the shifted last plan is used past it
+TIME_BUDGET = 0.5
+
+def buildControllers(quad, N=50, dt=0.02, compiled=False, cache_dir=None, time_budget=TIME_BUDGET):
+    # the altitude, position and attitude MPCs of the cascade, time_budget None solves without a limit
+    al = AltitudeMPC(quad, T=dt, N=N, backend='qp', compiled=compiled, cache_dir=cache_dir)  # linear-quadratic, solved as a QP
+    po = PositionMPC(quad, T=dt, N=N, compiled=compiled, cache_dir=cache_dir,
+                     time_budget=None if time_budget is None else time_budget*dt)
+    # the attitude MPC predicts on the outer grid: its horizon spans the outer ones (it
+    # diverges below about 1 s) with the same N and it is re-solved every attitude period.
+    # On the attitude grid the horizon would need N*dt/attitude_dt stages, a solve several
+    # times slower
+    at = AttitudeMPC(quad, T=dt, N=N, backend='rti', compiled=compiled, cache_dir=cache_dir)  # one SQP step per tick
+    return al, po, at
+
+def buildReferences(sim_time, dt, attitude_dt, shape=circle, streaming=False, waypoints=None, snap_waypoints=None):
+    # the references on the grid of the controllers and on the attitude grid, the one the
+    # closed loop is recorded against. waypoints is a recorded path (see
+    # trajectory.waypoints), snap_waypoints (times, [x, y, z, yaw] rows) a minimum-snap
+    # trajectory through them, both instead of the shape
+    if snap_waypoints is not None:
+        return (MinimumSnapTrajectory(snap_waypoints[1], snap_waypoints[0], dt),
+                MinimumSnapTrajectory(snap_waypoints[1], snap_waypoints[0], attitude_dt))
+    if waypoints is not None:
+        return WaypointTrajectory(waypoints, dt), WaypointTrajectory(waypoints, attitude_dt)
+    if streaming:
+        # pulled from a generator in constant memory instead of tabulated
+        return (StreamingTrajectory(stream(shape, dt, duration=sim_time), dt),
+                StreamingTrajectory(stream(shape, attitude_dt, duration=sim_time), attitude_dt))
+    return ReferenceTrajectory(sim_time, dt, shape=shape), ReferenceTrajectory(sim_time, attitude_dt, shape=shape)
+
+def buildCascade(quad, motor_model, traj, controllers, attitude_dt, pipelined=False, executor='process'):
+    # the scheduler of scripts/main.py: each loop at its own rate with the dynamics stepped
+    # every attitude_dt, or pipelined, the three solves overlapping with one tick of
+    # latency between the loops ('process' or 'thread' workers, single rate only)
+    al, po, at = controllers
+    if pipelined:
+        if abs(attitude_dt - po.T) > 1e-12:
+            raise ValueError("The pipelined cascade runs at a single rate, attitude_dt must be dt")
+        return PipelinedScheduler(quad, motor_model, traj, al, po, at, executor=executor)
+    return CascadeScheduler(quad, motor_model, traj, al, po, at, attitude_dt=attitude_dt)
@@ -0,0 +1,343 @@
+import numpy as np
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+from utils.profiling import span
+
+class CascadeScheduler:
+    # Runs the altitude/position/attitude MPCs of the cascade at their own rates.
+    #
+    # One step() is one period of the attitude loop, the fastest rate, and one
+    # dynamics step. The altitude and position loops are solved every
+    # `outer_every` steps. Their thrust plan is held (zero-order, as in the MPC
+    # model). The tilt plan is held as well, or by default interpolated: plan[i] is
+    # reached at the end of the outer step i, on a line from the tilt asked for at
+    # the solve, as a single-rate loop asks for it one step after its solve.
+    #
+    # The attitude MPC predicts on its own grid at.T, a multiple of the attitude
+    # period attitude_dt (at.T by default): with at.T = po.T its horizon spans the
+    # outer horizon with the same N and it is re-solved every attitude period, its
+    # warm start shifted once a stage has passed. attitude_traj holds the references
+    # on the grid of the attitude MPC.
+    def __init__(self, quad, motor_model, traj, al, po, at, attitude_traj=None, hold=False, attitude_dt=None):
+        self.quad = quad
+        self.motor_model = motor_model
+        self.traj = traj                    # references on the altitude/position grid
+        self.attitude_traj = attitude_traj if attitude_traj is not None else traj  # on the attitude MPC grid
+        self.al = al
+        self.po = po
+        self.at = at
+        self.hold = hold
+
+        if not np.isclose(al.T, po.T):
+            raise ValueError("The altitude and position loops must run at the same rate")
+        self.dt = attitude_dt if attitude_dt is not None else at.T
+        self.outer_every = int(round(po.T / self.dt))
+        if self.outer_every < 1 or not np.isclose(self.outer_every*self.dt, po.T):
+            raise ValueError("The position period must be a multiple of the attitude period")
+        self.stage_every = int(round(at.T / self.dt))
+        if self.stage_every < 1 or not np.isclose(self.stage_every*self.dt, at.T) or at.T > po.T + 1e-12:
+            raise ValueError("The attitude MPC step must be a multiple of the attitude period, at most the position period")
+
+        # the last outer plans and the step they were computed at
+        self.thrusts = None
+        self.phids = None
+        self.theds = None
+        self.dphids = None  # the tilt rates of the outer plans on their grid
+        self.dtheds = None
+        self.phi0 = None    # the tilt the interpolated plans start from, None holds them
+        self.the0 = None
+        self.tilt = None    # the tilt asked for at the next step
+        self.outer_step = 0
+
+    def planTimes(self, k, count, step):
+        # the times k*dt + step, k*dt + 2*step, ... in outer steps since the outer solve
+        return ((k - self.outer_step)*self.dt + (1 + np.arange(count))*step) / self.po.T
+
+    def samplePlan(self, plan, times, start=None):
+        # an outer plan at the times of planTimes. Held, each time takes the outer step
+        # it ends; interpolated (a start is given) plan[i] is reached at the end of the
+        # outer step i
+        if self.hold or start is None:
+            return plan[np.minimum(np.ceil(times - 1e-9).astype(int) - 1, len(plan) - 1)]
+        return np.interp(times, np.arange(len(plan) + 1), np.concatenate(([start], plan)))
+
+    def sampleRates(self, rates, times):
+        # the rates of an outer plan at the times of the attitude stages, as samplePlan.
+        # rates[i] is the slope of the i-th segment of the plan, each stage takes the
+        # segment that ends at it (the backward differences that desired_attitude takes on
+        # its own grid), past the plan the rate is zero. A held plan[i] starts the outer
+        # step i, so its segments end one attitude stage earlier.
+        if self.hold:
+            times = times - self.at.T/self.po.T
+        return rates[np.clip(np.ceil(times - 1e-9).astype(int) - 1, 0, len(rates) - 1)]
+
+    def step(self, k):
+        quad = self.quad
+        if k % self.outer_every == 0:
+            i = k // self.outer_every
+            # Solve altitude -> thrust
+            with span('altitude'):
+                with span('reference'):
+                    next_al_trajectories, next_al_controls = self.traj.desired_altitude(quad, i, self.al.N)
+                self.thrusts = self.al.solve(next_al_trajectories, next_al_controls)
+
+            # Solve position -> phid, thed
+            with span('position'):
+                with span('reference'):
+                    next_po_trajectories, next_po_controls = self.traj.desired_position(quad, i, self.po.N, self.thrusts)
+                self.phids, self.theds = self.po.solve(next_po_trajectories, next_po_controls, self.thrusts)
+            self.outer_step = k
+            if self.outer_every > 1 and not self.hold:
+                # the interpolated plan continues from the tilt asked for at this step
+                self.phi0, self.the0 = self.tilt if self.tilt is not None else quad.ori[:2]
+            if self.stage_every < self.outer_every:
+                # differentiate the tilt plan on its own grid, differenced on the attitude
+                # grid the held plan has zero rates inside a step and a spike at its end
+                if self.hold:
+                    self.dphids = np.append(np.diff(self.phids), 0.0)/self.po.T
+                    self.dtheds = np.append(np.diff(self.theds), 0.0)/self.po.T
+                else:
+                    self.dphids = np.append(np.diff(self.phids, prepend=self.phi0), 0.0)/self.po.T
+                    self.dtheds = np.append(np.diff(self.theds, prepend=self.the0), 0.0)/self.po.T
+
+        # Solve attitude -> tau_phi, tau_the, tau_psi
+        with span('attitude'):
+            with span('reference'):
+                # the outer plans on the stages of the attitude horizon
+                thrust = self.samplePlan(self.thrusts, self.planTimes(k, 1, self.dt))[0]
+                stages = self.planTimes(k, self.at.N, self.at.T)
+                phids = self.samplePlan(self.phids, stages, self.phi0)
+                theds = self.samplePlan(self.theds, stages, self.the0)
+                if self.phi0 is not None:
+                    now = self.planTimes(k, 1, self.dt)
+                    self.tilt = (self.samplePlan(self.phids, now, self.phi0)[0],
+                                 self.samplePlan(self.theds, now, self.the0)[0])
+                dphids = dtheds = None
+                if self.stage_every < self.outer_every:
+                    dphids = self.sampleRates(self.dphids, stages)
+                    dtheds = self.sampleRates(self.dtheds, stages)
+                next_at_trajectories, next_at_controls = self.attitude_traj.desired_attitude(
+                    quad, k // self.stage_every, self.at.N, phids, theds, dphids, dtheds)
+            # the next solve starts a new stage of the attitude grid, or lies inside this one
+            tau_phis, tau_thes, tau_psis = self.at.solve(next_at_trajectories, next_at_controls,
+                                                         shift=(k + 1) % self.stage_every == 0)
+
+        # motor speeds
+        with span('motor'):
+            motor_speed = self.motor_model.calculate_motor_speed(thrust=thrust,
+                                                                 torque_roll=tau_phis[0],
+                                                                 torque_pitch=tau_thes[0],
+                                                                 torque_yaw=tau_psis[0])
+            forces_and_torques = self.motor_model.calculate_forces_n_torques(motor_speed)
+
+        # with propeller model, one dynamics step at the attitude rate
+        with span('dynamics'):
+            quad.updateConfiguration(float(forces_and_torques[0, 0]),
+                                     float(forces_and_torques[1, 0]),
+                                     float(forces_and_torques[2, 0]),
+                                     float(forces_and_torques[3, 0]), self.dt)
+
+        # RTI preparation of the next tick, linearize around the shifted plan
+        with span('prepare'):
+            self.at.prepare()
+            if (k + 1) % self.outer_every == 0:
+                self.al.prepare()
+                self.po.prepare()
+
+        return thrust, tau_phis[0], tau_thes[0], tau_psis[0], motor_speed, forces_and_torques
+
+    def close(self):
+        pass
+
+
+def controllerWorker(conn, controller):
+    # Serves one controller in its own process: ('solve', args) replies with the plan and
+    # the statistics of the solve, ('prepare',) runs after the reply has been sent,
+    # ('get', name) returns an attribute.
+    while True:
+        message = conn.recv()
+        if message[0] == 'solve':
+            plan = controller.solve(*message[1])
+            conn.send((plan, controller.stats.last()))
+        elif message[0] == 'prepare':
+            controller.prepare()
+        elif message[0] == 'get':
+            conn.send(getattr(controller, message[1]))
+        else:
+            conn.close()
+            return
+
+class ControllerProcess:
+    # A controller copied into a worker process, solve() is split into submit() and result()
+    def __init__(self, controller):
+        self.controller = controller
+        self.conn, child_conn = mp.Pipe()
+        self.process = mp.Process(target=controllerWorker, args=(child_conn, controller), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def submit(self, *args):
+        self.conn.send(('solve', args))
+
+    def result(self):
+        # the statistics of the solve are recorded in this process too, so that they
+        # are current while the workers run
+        plan, record = self.conn.recv()
+        self.controller.stats.record(*record)
+        return plan
+
+    def prepare(self):
+        self.conn.send(('prepare',))
+
+    def get(self, name):
+        self.conn.send(('get', name))
+        return self.conn.recv()
+
+    def close(self):
+        self.conn.send(('close',))
+        self.process.join()
+
+class ControllerThread:
+    # The same interface for a controller solved in a thread of the scheduler's pool
+    def __init__(self, controller, pool):
+        self.controller = controller
+        self.pool = pool
+        self.future = None
+        self.preparing = None
+
+    def submit(self, *args):
+        # the solve uses the linearization of the preparation, wait for it
+        if self.preparing is not None:
+            self.preparing.result()
+            self.preparing = None
+        self.future = self.pool.submit(self.controller.solve, *args)
+
+    def result(self):
+        return self.future.result()
+
+    def prepare(self):
+        self.preparing = self.pool.submit(self.controller.prepare)
+
+    def get(self, name):
+        return getattr(self.controller, name)
+
+    def close(self):
+        pass
+
+class PipelinedScheduler:
+    # Solves the three MPCs of the cascade concurrently, one tick of latency per stage.
+    #
+    # At tick k the altitude MPC uses the current references, the position MPC the
+    # thrust plan of tick k-1 and the attitude MPC the phid/thed plans of tick k-1,
+    # each shifted by one step, so that the three solves are independent.
+    # executor='process' runs every controller in its own worker process (no GIL),
+    # executor='thread' in a thread pool of this process. Single rate only, the
+    # first tick is solved serially to seed the upstream plans.
+    def __init__(self, quad, motor_model, traj, al, po, at, executor='process'):
+        if not (np.isclose(al.T, po.T) and np.isclose(po.T, at.T)):
+            raise ValueError("The pipelined cascade runs the three loops at the same rate")
+        if executor not in ('process', 'thread'):
+            raise ValueError("Unknown executor %r, expected 'process' or 'thread'" % executor)
+
+        self.quad = quad
+        self.motor_model = motor_model
+        self.traj = traj
+        self.al = al
+        self.po = po
+        self.at = at
+        self.dt = at.T
+        self.executor = executor
+        self.workers = None
+
+        # the upstream plans of the last tick
+        self.thrusts = None
+        self.phids = None
+        self.theds = None
+
+    def start(self):
+        if self.executor == 'process':
+            self.workers = [ControllerProcess(c) for c in (self.al, self.po, self.at)]
+        else:
+            self.pool = ThreadPoolExecutor(3)
+            self.workers = [ControllerThread(c, self.pool) for c in (self.al, self.po, self.at)]
+
+    def close(self):
+        # stops the workers, the controllers here have the statistics of all solves
+        if self.workers is None:
+            return
+        for worker in self.workers:
+            worker.close()
+        if self.executor == 'thread':
+            self.pool.shutdown()
+        self.workers = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def shiftPlan(plan):
+        # the plan of the last tick seen from this tick, the last step is held
+        return np.append(plan[1:], plan[-1])
+
+    def step(self, k):
+        quad = self.quad
+        if self.thrusts is None:
+            # bootstrap: one serial pass of the cascade
+            with span('bootstrap'):
+                next_al_trajectories, next_al_controls = self.traj.desired_altitude(quad, k, self.al.N)
+                thrusts = self.al.solve(next_al_trajectories, next_al_controls)
+                next_po_trajectories, next_po_controls = self.traj.desired_position(quad, k, self.po.N, thrusts)
+                phids, theds = self.po.solve(next_po_trajectories, next_po_controls, thrusts)
+                next_at_trajectories, next_at_controls = self.traj.desired_attitude(quad, k, self.at.N, phids, theds)
+                tau_phis, tau_thes, tau_psis = self.at.solve(next_at_trajectories, next_at_controls)
+                self.start()
+        else:
+            al, po, at = self.workers
+            thrusts_prev = self.shiftPlan(self.thrusts)
+            phids_prev = self.shiftPlan(self.phids)
+            theds_prev = self.shiftPlan(self.theds)
+
+            # the three problems only depend on the state and the last tick's plans
+            with span('submit'):
+                with span('reference'):
+                    next_al_trajectories, next_al_controls = self.traj.desired_altitude(quad, k, self.al.N)
+                al.submit(next_al_trajectories, next_al_controls)
+                with span('reference'):
+                    next_po_trajectories, next_po_controls = self.traj.desired_position(quad, k, self.po.N, thrusts_prev)
+                po.submit(next_po_trajectories, next_po_controls, thrusts_prev)
+                with span('reference'):
+                    next_at_trajectories, next_at_controls = self.traj.desired_attitude(quad, k, self.at.N, phids_prev, theds_prev)
+                at.submit(next_at_trajectories, next_at_controls)
+
+            # the solves run in the workers, their spans are not recorded with process workers
+            with span('wait'):
+                thrusts = al.result()
+                phids, theds = po.result()
+                tau_phis, tau_thes, tau_psis = at.result()
+        self.thrusts, self.phids, self.theds = thrusts, phids, theds
+
+        # RTI preparation of the next tick, sent before the motor model and the dynamics
+        # so that the workers run it while this thread steps the quadrotor
+        with span('prepare'):
+            for worker in self.workers:
+                worker.prepare()
+
+        # the actuated thrust is the one of this tick's altitude plan, as in the serial cascade
+        thrust = thrusts[0]
+        with span('motor'):
+            motor_speed = self.motor_model.calculate_motor_speed(thrust=thrust,
+                                                                 torque_roll=tau_phis[0],
+                                                                 torque_pitch=tau_thes[0],
+                                                                 torque_yaw=tau_psis[0])
+            forces_and_torques = self.motor_model.calculate_forces_n_torques(motor_speed)
+
+        with span('dynamics'):
+            quad.updateConfiguration(float(forces_and_torques[0, 0]),
+                                     float(forces_and_torques[1, 0]),
+                                     float(forces_and_torques[2, 0]),
+                                     float(forces_and_torques[3, 0]), self.dt)
+
+        return thrust, tau_phis[0], tau_thes[0], tau_psis[0], motor_speed, forces_and_torques
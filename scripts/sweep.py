@@ -0,0 +1,152 @@
+import numpy as np
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from utils.telemetry import TelemetryRecorder
+from dynamics.Quadrotor import Quadrotor
+from motor_model.motor_model import MotorModel
+from scripts.cascade import ATTITUDE_RATIO, buildCascade, buildControllers, buildReferences
+from scripts.main import simulate
+from trajectory.reference import circle, eight
+
+# the reference shapes of a configuration
+SHAPES = {'circle': circle, 'eight': eight}
+
+# a configuration of the cascade as in scripts/main.py, weights None keep the defaults of
+# the controllers, e.g. 'position_Q': [40, 40, 1, 1]; the attitude loop runs every
+# dt/attitude_ratio
+DEFAULTS = {'N': 50, 'dt': 0.02, 'attitude_ratio': ATTITUDE_RATIO, 'shape': 'circle', 'sim_time': 10.0,
+            'altitude_Q': None, 'altitude_R': None,
+            'position_Q': None, 'position_R': None,
+            'attitude_Q': None, 'attitude_R': None}
+
+CACHE_DIR = '.mpc_cache'
+
+# the controllers of this process by (N, dt) and their default weights, built once by
+# warmCache before the workers fork and reset for each configuration
+controllers = {}
+
+def grid(**axes):
+    # the configurations of all combinations of the values of the axes,
+    # e.g. grid(N=[30, 50], shape=['circle', 'eight'])
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*(axes[name] for name in names))]
+
+def workerControllers(N, dt, quad):
+    # the controllers do not depend on the attitude rate, they predict on the outer grid
+    key = (N, dt)
+    if key not in controllers:
+        cascade = buildControllers(quad, N, dt, compiled=True, cache_dir=CACHE_DIR)
+        controllers[key] = (cascade, [(c.p_q.copy(), c.p_r.copy()) for c in cascade])
+    return controllers[key]
+
+def runConfiguration(config):
+    # one closed-loop simulation, the row of the results table
+    row = {'config': json.dumps({k: v for k, v in config.items() if v != DEFAULTS.get(k)}, sort_keys=True)}
+    try:
+        unknown = set(config) - set(DEFAULTS)
+        if unknown:
+            raise ValueError("Unknown configuration keys %s" % sorted(unknown))
+        config = dict(DEFAULTS, **config)
+        N, dt, sim_time = int(config['N']), float(config['dt']), float(config['sim_time'])
+        attitude_dt = dt/int(config['attitude_ratio'])
+        quad = Quadrotor(keep_history=False)
+        cascade, defaults = workerControllers(N, dt, quad)
+        for name, controller, (q, r) in zip(('altitude', 'position', 'attitude'), cascade, defaults):
+            controller.reset()
+            controller.set_vehicle(quad)
+            controller.set_weights(q if config[name + '_Q'] is None else config[name + '_Q'],
+                                   r if config[name + '_R'] is None else config[name + '_R'])
+
+        traj, attitude_traj = buildReferences(sim_time, dt, attitude_dt, shape=SHAPES[config['shape']])
+        scheduler = buildCascade(quad, MotorModel(), traj, cascade, attitude_dt)
+        recorder = TelemetryRecorder(capacity=int(math.ceil(sim_time/attitude_dt - 1e-9)))
+        wall_time = simulate(scheduler, quad, attitude_traj, cascade, sim_time, attitude_dt, recorder)
+
+        error = recorder['state'][:, :3] - recorder['reference'][:, :3]
+        row['rmse'] = float(np.sqrt(np.mean(np.sum(error**2, axis=1))))
+        row['rmse_z'] = float(np.sqrt(np.mean(error[:, 2]**2)))
+        for name, controller in zip(('altitude', 'position', 'attitude'), cascade):
+            summary = controller.stats.summary()
+            for q in ('p50', 'p95', 'p99'):
+                row['%s_%s_ms' % (name, q)] = summary[q]*1e3
+            row[name + '_failures'] = summary['failures']
+        row['sim_rate'] = len(recorder)*attitude_dt/wall_time
+        row['error'] = ''
+    except Exception as e:
+        traceback.print_exc()
+        row['error'] = '%s: %s' % (type(e).__name__, e)
+    return row
+
+def warmCache(configs):
+    # build the controllers of each (N, dt) once here, before the workers are forked:
+    # they inherit them instead of all compiling or loading the same solvers
+    quad = Quadrotor(keep_history=False)
+    for N, dt in sorted({(int(c.get('N', DEFAULTS['N'])), float(c.get('dt', DEFAULTS['dt']))) for c in configs}):
+        workerControllers(N, dt, quad)
+
+def sweep(configs, workers=None):
+    # the result rows of the configurations, in their order, simulated in parallel
+    warmCache(configs)
+    # spawned workers (no fork on the platform) load the solvers from the cache instead
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=context) as pool:
+        return list(pool.map(runConfiguration, configs))
+
+COLUMNS = ['rmse', 'rmse_z'] + ['%s_%s' % (name, field) for name in ('altitude', 'position', 'attitude')
+                                for field in ('p50_ms', 'p95_ms', 'p99_ms', 'failures')] + ['sim_rate']
+
+def formatTable(rows):
+    # the rows as an aligned text table, one line per configuration
+    lines = ['  '.join(['%-6s' % 'run'] + ['%12s' % c for c in COLUMNS]) + '  config']
+    for i, row in enumerate(rows):
+        if row['error']:
+            cells = ['%12s' % '-' for c in COLUMNS]
+        else:
+            cells = ['%12d' % row[c] if c.endswith('failures') else '%12.3f' % row[c] for c in COLUMNS]
+        lines.append('  '.join(['%-6d' % i] + cells) + '  ' + row['config'] + ('  ' + row['error'] if row['error'] else ''))
+    return '\n'.join(lines)
+
+def toCsv(rows, path):
+    fields = ['config'] + COLUMNS + ['error']
+    with open(path, 'w') as f:
+        f.write(','.join(fields) + '\n')
+        for row in rows:
+            f.write(','.join('"%s"' % str(row.get(k, '')).replace('"', '""') for k in fields) + '\n')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate the cascade for a grid of configurations in parallel.")
+    parser.add_argument('--N', type=int, nargs='+', default=[DEFAULTS['N']], help="horizon lengths")
+    parser.add_argument('--dt', type=float, nargs='+', default=[DEFAULTS['dt']],
+                        help="periods of the altitude and position loops [s]")
+    parser.add_argument('--attitude-ratio', type=int, nargs='+', default=[DEFAULTS['attitude_ratio']],
+                        help="attitude loop periods per dt, 1 runs the cascade at one rate")
+    parser.add_argument('--shape', nargs='+', default=[DEFAULTS['shape']], choices=sorted(SHAPES),
+                        help="reference trajectories")
+    parser.add_argument('--sim-time', type=float, default=DEFAULTS['sim_time'], help="simulated time [s]")
+    parser.add_argument('--configs', default=None,
+                        help="a json file with a list of configurations, instead of the grid")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes, all cores by default")
+    parser.add_argument('--out', default=None, help="write the table to this csv file")
+    args = parser.parse_args()
+
+    if args.configs is not None:
+        with open(args.configs) as f:
+            configs = json.load(f)
+    else:
+        configs = grid(N=args.N, dt=args.dt, attitude_ratio=args.attitude_ratio, shape=args.shape,
+                       sim_time=[args.sim_time])
+    start = time.perf_counter()
+    rows = sweep(configs, args.workers)
+    print(formatTable(rows))
+    print("%d configurations in %.1f s" % (len(rows), time.perf_counter() - start))
+    if args.out is not None:
+        toCsv(rows, args.out)
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from dynamics.Quadrotor import Quadrotor
+from MPC.MPCController import AltitudeMPC
+from MPC.batch_mpc import BatchMPC
+from trajectory.reference import ReferenceTrajectory
+
+N = 10
+
+def altitudeProblems(K):
+    # the altitude references of K vehicles starting at different heights and speeds
+    traj = ReferenceTrajectory(1.0, 0.02)
+    quads, trajectories, controls = [], [], []
+    for k in range(K):
+        quad = Quadrotor(pos=[0, 0, -0.5*k], dpos=[0, 0, 0.2*k], keep_history=False)
+        x_, u_ = traj.desired_altitude(quad, 5*k, N)
+        quads.append(quad)
+        trajectories.append(x_.copy())
+        controls.append(u_.copy())
+    return quads, np.array(trajectories), np.array(controls)
+
+def test_batch_matches_scalar_solves():
+    K = 3
+    quads, trajectories, controls = altitudeProblems(K)
+    controller = AltitudeMPC(quads[0], N=N, backend='qp', condensing=False)
+    batch = BatchMPC(controller, K, quads=quads)
+    plans = batch.solve(trajectories, controls)
+
+    assert batch.success.all()
+    for k in range(K):
+        scalar = AltitudeMPC(quads[k], N=N, backend='qp', condensing=False)
+        np.testing.assert_allclose(plans[k, :, 0], scalar.solve(trajectories[k], controls[k]), atol=1e-4)
+
+def test_ipopt_is_mapped_serially():
+    K = 2
+    quads, trajectories, controls = altitudeProblems(K)
+    controller = AltitudeMPC(quads[0], N=N)
+    with pytest.raises(ValueError):
+        BatchMPC(controller, K, quads=quads, parallelization='thread')
+
+    plans = BatchMPC(controller, K, quads=quads).solve(trajectories, controls)
+    for k in range(K):
+        scalar = AltitudeMPC(quads[k], N=N)
+        np.testing.assert_allclose(plans[k, :, 0], scalar.solve(trajectories[k], controls[k]), atol=1e-4)
@@ -0,0 +1,23 @@
+import numpy as np
+from benchmarks import cascade_tick
+from benchmarks.common import latency, throughput
+
+def test_latency_and_throughput_results():
+    result = latency([0.001, 0.002, 0.003, 0.004], iter_counts=[3, -1, 5, -1], failures=2)
+    assert result['n'] == 4 and np.isclose(result['mean_ms'], 2.5) and np.isclose(result['p50_ms'], 2.5)
+    assert result['iter_mean'] == 4.0 and result['iter_max'] == 5 and result['failures'] == 2
+    # a solver that reports no iterations
+    unreported = latency([0.001], iter_counts=[-1])
+    assert unreported['iter_mean'] is None and unreported['iter_max'] == -1
+
+    calls = []
+    result = throughput(lambda: calls.append(1), n_calls=20, items_per_call=8, warmup=3)
+    assert len(calls) == 23 and result['n'] == 20 and result['items_per_call'] == 8 and result['items_per_s'] > 0
+
+def test_cascade_tick_times_every_attitude_period():
+    results = cascade_tick.run(N=10, sim_time=0.2, attitude_ratio=4, warmup=5)
+    assert list(results) == ['cascade/tick/N=10/attitude_ratio=4']
+    result = results['cascade/tick/N=10/attitude_ratio=4']
+    # 40 ticks at 200 Hz, the first 5 are not timed
+    assert result['n'] == 35
+    assert result['p50_ms'] <= result['p95_ms'] <= result['p99_ms'] and result['sim_s_per_wall_s'] > 0
@@ -0,0 +1,51 @@
+import copy
+import json
+import os
+import subprocess
+import sys
+from benchmarks.compare import compare
+from benchmarks.run import median
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BASELINE = {'meta': {'commit': 'abc1234', 'settings': {}},
+            'results': {'solve/AltitudeMPC/N=10': {'p95_ms': 2.0, 'iter_mean': 4.0, 'failures': 0},
+                        'backend/AltitudeMPC/qp/N=10': {'p95_ms': 0.4, 'iter_mean': None, 'failures': 0}}}
+
+def runCompare(tmp_path, results):
+    baseline, current = tmp_path / 'baseline.json', tmp_path / 'results.json'
+    baseline.write_text(json.dumps(BASELINE))
+    current.write_text(json.dumps({'meta': {}, 'results': results}))
+    return subprocess.run([sys.executable, '-m', 'benchmarks.compare', '--baseline', str(baseline),
+                           '--results', str(current)], cwd=ROOT, capture_output=True, text=True)
+
+def test_checks_against_the_tolerance_bands():
+    results = copy.deepcopy(BASELINE['results'])
+    results['solve/AltitudeMPC/N=10']['p95_ms'] = 2.55   # within 2.0*1.25 + 0.1
+    results['solve/AltitudeMPC/N=10']['iter_mean'] = 3.0
+    checks = {(name, metric): status for name, metric, _, _, _, status in compare(BASELINE, results)}
+    assert checks[('solve/AltitudeMPC/N=10', 'p95_ms')] == 'ok'
+    assert checks[('solve/AltitudeMPC/N=10', 'iter_mean')] == 'improved'
+    # null in the baseline is not compared
+    assert ('backend/AltitudeMPC/qp/N=10', 'iter_mean') not in checks
+
+def test_exits_non_zero_on_a_regression(tmp_path):
+    assert runCompare(tmp_path, BASELINE['results']).returncode == 0
+
+    regressed = copy.deepcopy(BASELINE['results'])
+    regressed['solve/AltitudeMPC/N=10']['p95_ms'] = 2.7
+    completed = runCompare(tmp_path, regressed)
+    assert completed.returncode == 1
+    assert 'regression' in completed.stdout and '1 failed' in completed.stdout
+
+    failing = copy.deepcopy(BASELINE['results'])
+    failing['backend/AltitudeMPC/qp/N=10']['failures'] = 1
+    del failing['solve/AltitudeMPC/N=10']
+    completed = runCompare(tmp_path, failing)
+    assert completed.returncode == 1 and 'missing' in completed.stdout
+
+def test_median_keeps_unreported_metrics_null():
+    runs = [{'s': {'p95_ms': p, 'iter_mean': None, 'failures': f}} for p, f in ((1.0, 0), (3.0, 1), (2.0, 1))]
+    result = median(runs)['s']
+    assert result == {'p95_ms': 2.0, 'iter_mean': None, 'failures': 1}
+    json.dumps(result, allow_nan=False)  # written as null
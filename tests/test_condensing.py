@@ -0,0 +1,24 @@
+import numpy as np
+from dynamics.Quadrotor import Quadrotor
+from MPC.MPCController import AltitudeMPC
+from trajectory.reference import ReferenceTrajectory
+
+def test_condensed_matches_sparse_qp():
+    traj = ReferenceTrajectory(2.0, 0.02)
+    quad = Quadrotor(pos=[0, 0, -1.8], keep_history=False)
+    condensed = AltitudeMPC(quad, N=20, backend='qp')
+    sparse = AltitudeMPC(quad, N=20, backend='qp', condensing=False)
+    for idx in range(0, 50, 10):
+        x_, u_ = traj.desired_altitude(quad, idx, 20)
+        np.testing.assert_allclose(condensed.solve(x_, u_), sparse.solve(x_, u_), atol=1e-5)
+        assert condensed.condensed and not sparse.condensed
+
+def test_active_bounds_go_to_the_conic_solver():
+    # far below the reference the thrust plan saturates, the condensed map does not apply
+    traj = ReferenceTrajectory(2.0, 0.02)
+    quad = Quadrotor(pos=[0, 0, 5.0], keep_history=False)
+    condensed = AltitudeMPC(quad, N=20, backend='qp')
+    sparse = AltitudeMPC(quad, N=20, backend='qp', condensing=False)
+    x_, u_ = traj.desired_altitude(quad, 0, 20)
+    np.testing.assert_allclose(condensed.solve(x_, u_), sparse.solve(x_, u_), atol=1e-5)
+    assert not condensed.condensed
@@ -0,0 +1,28 @@
+import numpy as np
+import sys
+from scripts import cascade, main as script
+
+def smallControllers(monkeypatch):
+    # the cascade of main with short horizons and without compiling
+    monkeypatch.setattr(script, 'buildControllers',
+                        lambda quad, N, dt, **kwargs: cascade.buildControllers(quad, 10, dt, time_budget=None))
+
+def test_headless_run_writes_the_telemetry(tmp_path, monkeypatch):
+    smallControllers(monkeypatch)
+    out, stats_dir = str(tmp_path / 'run.npz'), tmp_path / 'stats'
+    script.main(headless=True, out=out, attitude_ratio=2, stats_dir=str(stats_dir),
+                telemetry_dir=str(tmp_path / 'telemetry'))
+    assert 'utils.plot' not in sys.modules and 'matplotlib.pyplot' not in sys.modules
+    run = np.load(out)
+    assert run['state'].shape == (1000, 12) and run['motor_speed'].shape == (1000, 4)
+    np.testing.assert_allclose(np.diff(run['time']), 0.01)
+    assert sorted(p.name for p in stats_dir.iterdir()) == ['altitude_stats.csv', 'attitude_stats.csv',
+                                                          'position_stats.csv']
+    assert (tmp_path / 'telemetry' / 'state.dat').is_file()
+
+def test_snap_waypoints_of_a_file(tmp_path):
+    path = str(tmp_path / 'path.csv')
+    np.savetxt(path, [[0, 0, 0, -1], [2, 1, 0, -2], [4, 1, 1, -2]], delimiter=',')
+    times, rows = script.snapWaypoints(path)
+    np.testing.assert_array_equal(times, [0, 2, 4])
+    np.testing.assert_array_equal(rows, [[0, 0, -1, 0], [1, 0, -2, 0], [1, 1, -2, 0]])
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from trajectory.minsnap import SEGMENT_CACHE, MinimumSnap, MinimumSnapTrajectory, derivative_row, flat_attitude, segment_coefficients
+
+WAYPOINTS = np.array([[0.0, 0.0, -1.0, 0.0], [2.0, 1.0, -2.0, 0.5], [3.0, -1.0, -2.5, 1.0],
+                      [1.0, -2.0, -1.5, 0.5], [0.0, 0.0, -1.0, 0.0]])
+TIMES = np.array([0.0, 2.0, 3.5, 6.0, 8.0])
+
+def test_continuous_at_the_knots():
+    snap = MinimumSnap(WAYPOINTS, TIMES)
+    np.testing.assert_allclose(snap.evaluate(TIMES, order=0)[0], WAYPOINTS, atol=1e-9)
+    # the derivatives 1..6 of the segments on both sides of each interior knot agree
+    for i in range(1, len(TIMES) - 1):
+        for k in range(1, 7):
+            from_left = derivative_row(k, 1.0, 1.0/snap.durations[i-1]) @ snap.coefficients[i-1]
+            from_right = derivative_row(k, 0.0, 1.0/snap.durations[i]) @ snap.coefficients[i]
+            np.testing.assert_allclose(from_left, from_right, rtol=1e-6, atol=1e-6)
+    # at rest at both ends
+    for derivative in snap.evaluate(TIMES[[0, -1]])[1:4]:
+        np.testing.assert_allclose(derivative, 0.0, atol=1e-9)
+
+def test_derivatives_match_finite_differences():
+    snap = MinimumSnap(WAYPOINTS, TIMES)
+    t, h = np.linspace(0.1, 7.9, 40), 1e-5
+    values, ahead, behind = snap.evaluate(t), snap.evaluate(t + h), snap.evaluate(t - h)
+    for k in range(1, 5):
+        np.testing.assert_allclose(values[k], (ahead[k-1] - behind[k-1])/(2*h), rtol=1e-4, atol=1e-4)
+
+def test_flat_attitude_derivatives():
+    snap = MinimumSnap(WAYPOINTS, TIMES)
+    t, h = np.linspace(0.5, 7.5, 30), 1e-4
+    flat = lambda t: flat_attitude(*snap.evaluate(t)[2:5], 9.8)
+    phi, the, dphi, dthe, ddphi, ddthe = flat(t)
+    ahead, behind = flat(t + h), flat(t - h)
+    np.testing.assert_allclose(dphi, (ahead[0] - behind[0])/(2*h), atol=1e-5)
+    np.testing.assert_allclose(dthe, (ahead[1] - behind[1])/(2*h), atol=1e-5)
+    np.testing.assert_allclose(ddphi, (ahead[2] - behind[2])/(2*h), atol=1e-4)
+    np.testing.assert_allclose(ddthe, (ahead[3] - behind[3])/(2*h), atol=1e-4)
+
+def test_segments_are_solved_once():
+    SEGMENT_CACHE.clear()
+    first = segment_coefficients(WAYPOINTS, TIMES)
+    assert segment_coefficients(WAYPOINTS.copy(), list(TIMES)) is first
+    assert len(SEGMENT_CACHE) == 1
+    traj = MinimumSnapTrajectory(WAYPOINTS, TIMES, dt=0.02)
+    assert len(SEGMENT_CACHE) == 1
+    np.testing.assert_allclose(traj.reference(100), MinimumSnap(WAYPOINTS, TIMES).evaluate([2.0], 0)[0][0])
+    with pytest.raises(ValueError):
+        segment_coefficients(WAYPOINTS, TIMES[::-1])
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from motor_model.motor_model import MotorModel
+
+# a roll torque the motors cannot produce: motor 2 would need a negative squared speed,
+# motor 4 a speed above max_speed
+ROLL = [1.0, 0.5, 0.0, 0.0]
+HOVER = [1.0, 0.0, 0.0, 0.0]
+
+def test_counters_of_a_single_wrench():
+    model = MotorModel()
+    speeds = model.calculate_motor_speeds(np.array(ROLL))
+    assert speeds.shape == (1, 4)
+    np.testing.assert_array_equal(model.negative_count, [0, 1, 0, 0])
+    np.testing.assert_array_equal(model.saturation_count, [0, 0, 0, 1])
+    assert speeds[0, 1] == 0 and speeds[0, 3] == model.max_speed
+
+def test_counters_of_a_batch():
+    model = MotorModel()
+    wrenches = np.array([ROLL, HOVER, ROLL])
+    speeds = model.calculate_motor_speeds(wrenches)
+    np.testing.assert_array_equal(model.negative_count, [0, 2, 0, 0])
+    np.testing.assert_array_equal(model.saturation_count, [0, 0, 0, 2])
+    np.testing.assert_array_equal(model.feasible(wrenches), [False, True, False])
+    # the scalar call counts the same and gives the same speeds
+    scalar = MotorModel()
+    for wrench, row in zip(wrenches, speeds):
+        np.testing.assert_array_equal(scalar.calculate_motor_speed(*wrench)[:, 0], row)
+    np.testing.assert_array_equal(scalar.negative_count, model.negative_count)
+    np.testing.assert_array_equal(scalar.saturation_count, model.saturation_count)
+
+def test_rejects_other_shapes():
+    with pytest.raises(ValueError):
+        MotorModel().calculate_motor_speeds(np.zeros((2, 3)))
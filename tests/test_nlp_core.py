@@ -0,0 +1,43 @@
+import casadi as ca
+import math
+import numpy as np
+import pytest
+from dynamics.Quadrotor import Quadrotor
+from MPC.MPCController import AltitudeMPC
+from trajectory.reference import ReferenceTrajectory
+
+def optiAltitude(quad, T, N, Q, R, x_ref, u_ref):
+    # the altitude problem as ca.Opti wrote it before the nlpsol core
+    opti = ca.Opti()
+    u = opti.variable(N, 1)
+    x = opti.variable(N+1, 2)
+    f = lambda x_, u_: ca.vertcat(x_[1], quad.g - u_/quad.mq)
+    opti.subject_to(x[0, :] == x_ref[0:1, :])
+    obj = 0
+    for i in range(N):
+        opti.subject_to(x[i+1, :] == x[i, :] + f(x[i, :], u[i, :]).T*T)
+        e, v = x[i, :] - x_ref[i+1:i+2, :], u[i, :] - u_ref[i:i+1, :]
+        obj = obj + ca.mtimes([e, Q, e.T]) + ca.mtimes([v, R, v.T])
+    opti.minimize(obj)
+    opti.subject_to(opti.bounded(-math.inf, x[:, 0], quad.max_z))
+    opti.subject_to(opti.bounded(quad.min_dz, x[:, 1], quad.max_dz))
+    opti.subject_to(opti.bounded(quad.min_thrust, u, quad.max_thrust))
+    opti.solver('ipopt', {'ipopt.print_level': 0, 'print_time': 0, 'ipopt.tol': 1e-10})
+    return opti.solve().value(u)
+
+@pytest.mark.parametrize('z', [-1.8, -8.0])
+def test_solves_like_the_opti_formulation(z):
+    # near the reference, and far above it with the thrust on its lower bound
+    quad = Quadrotor(pos=[0, 0, z], keep_history=False)
+    x_, u_ = ReferenceTrajectory(2.0, 0.02).desired_altitude(quad, 0, 20)
+    controller = AltitudeMPC(quad, N=20)
+    expected = optiAltitude(quad, 0.02, 20, controller.Q, controller.R, x_.copy(), u_.copy())
+    np.testing.assert_allclose(controller.solve(x_, u_), expected, atol=1e-5)
+    assert controller.stats.last()[2]
+
+def test_buffers_are_views_of_the_packed_vectors():
+    controller = AltitudeMPC(Quadrotor(keep_history=False), N=10)
+    controller.p_x_ref[3] = [1.0, 2.0]
+    controller.u0[4] = 7.0
+    assert controller.p[6:8].tolist() == [1.0, 2.0]
+    assert controller.w0[controller.n_states + 4] == 7.0
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from dynamics.Quadrotor import Quadrotor
+from MPC.MPCController import AltitudeMPC, AttitudeMPC
+from trajectory.reference import ReferenceTrajectory
+
+@pytest.mark.parametrize('backend', ['ipopt', 'qp', 'rti'])
+def test_set_weights_solves_like_a_new_controller(backend):
+    traj = ReferenceTrajectory(2.0, 0.02)
+    quad = Quadrotor(pos=[0, 0, -1.5], dpos=[0, 0, 0.5], keep_history=False)
+    Q, R = np.diag([5.0, 2.0]), [0.1]
+    reweighted = AltitudeMPC(quad, N=20, backend=backend)
+    reweighted.solve(*traj.desired_altitude(quad, 0, 20))
+    reweighted.set_weights(Q, R)
+    fresh = AltitudeMPC(quad, N=20, Q=Q, R=np.diag(R), backend=backend)
+    for idx in (1, 2):
+        x_, u_ = traj.desired_altitude(quad, idx, 20)
+        np.testing.assert_allclose(reweighted.solve(x_, u_), fresh.solve(x_, u_), atol=1e-5)
+
+def test_set_weights_checks_the_diagonals():
+    controller = AltitudeMPC(Quadrotor(keep_history=False), N=5)
+    with pytest.raises(ValueError):
+        controller.set_weights(Q=[1.0, 2.0, 3.0], R=[1.0])
+    np.testing.assert_array_equal(controller.p_r, [1.0])
+
+def heavier(quad):
+    other = Quadrotor(pos=quad.pos, dpos=quad.dpos, keep_history=False)
+    other.mq, other.Ix, other.Iy = 0.5, 6e-4, 6e-4
+    other.max_thrust, other.max_dz, other.min_dz = 6.0, 2.0, -2.0
+    return other
+
+@pytest.mark.parametrize('backend', ['ipopt', 'qp', 'rti'])
+def test_set_vehicle_solves_like_a_new_controller(backend):
+    traj = ReferenceTrajectory(2.0, 0.02)
+    quad = Quadrotor(pos=[0, 0, -1.5], dpos=[0, 0, 0.5], keep_history=False)
+    other = heavier(quad)
+    switched = AltitudeMPC(quad, N=20, backend=backend)
+    switched.solve(*traj.desired_altitude(quad, 0, 20))
+    fresh = AltitudeMPC(other, N=20, backend=backend)
+    for idx in (1, 2):
+        x_, u_ = traj.desired_altitude(other, idx, 20)
+        u = switched.solve(x_, u_, vehicle=other)
+        np.testing.assert_allclose(u, fresh.solve(x_, u_), atol=1e-5)
+        assert u.max() <= other.max_thrust + 1e-6
+    assert switched.quad is other
+
+def test_set_vehicle_of_the_attitude_model():
+    traj = ReferenceTrajectory(2.0, 0.02)
+    quad = Quadrotor(ori=[0.1, -0.05, 0.0], keep_history=False)
+    other = heavier(quad)
+    phid, thed = np.linspace(0.2, 0.0, 20), np.linspace(-0.1, 0.1, 20)
+    switched = AttitudeMPC(quad, N=20)
+    switched.solve(*traj.desired_attitude(quad, 0, 20, phid, thed))
+    switched.set_vehicle(other)
+    fresh = AttitudeMPC(other, N=20)
+    x_, u_ = traj.desired_attitude(other, 1, 20, phid, thed)
+    np.testing.assert_allclose(switched.solve(x_, u_), fresh.solve(x_, u_), atol=1e-5)
@@ -0,0 +1,42 @@
+import json
+import time
+from utils import profiling
+
+@profiling.profiled('solve')
+def solve():
+    with profiling.span('solver'):
+        time.sleep(0.001)
+
+def test_spans_aggregate_by_stage(tmp_path):
+    profiling.enable(trace=True)
+    try:
+        for _ in range(5):
+            with profiling.span('tick'):
+                solve()
+                with profiling.span('solver'):
+                    pass
+    finally:
+        profiler = profiling.disable()
+
+    summary = profiler.summary()
+    assert sorted(summary) == ['tick', 'tick;solve', 'tick;solve;solver', 'tick;solver']
+    assert [summary[name]['count'] for name in sorted(summary)] == [5, 5, 5, 5]
+    stage = summary['tick;solve;solver']
+    assert stage['total_ms'] >= 5.0
+    assert stage['p50_ms'] <= stage['p99_ms'] <= stage['max_ms']
+    # the nested spans are not counted in the self time of their parents
+    assert summary['tick;solve']['self_ms'] < summary['tick;solve']['total_ms'] - 4.0
+
+    path = tmp_path / 'profile.json'
+    profiler.to_speedscope(str(path))
+    events = json.loads(path.read_text())['profiles'][0]['events']
+    assert len(events) == 5*4*2
+
+def test_disabled_spans_record_nothing():
+    profiler = profiling.enable()
+    profiling.disable()
+    assert profiling.active() is None
+    assert profiling.span('tick') is profiling.NULL_SPAN
+    with profiling.span('tick'):
+        solve()
+    assert profiler.summary() == {}
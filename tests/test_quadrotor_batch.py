@@ -0,0 +1,51 @@
+import numpy as np
+from dynamics.Quadrotor import Quadrotor
+from dynamics.quadrotor_batch import QuadrotorBatch
+from dynamics.quadrotor_dynamics import Quadrotor as MotorQuadrotor
+
+def test_batch_matches_the_scalar_vehicles():
+    # different airframes, controls that saturate the torques and the rates, a descent to max_z
+    rng = np.random.default_rng(0)
+    K, dt = 5, 0.01
+    quads = [Quadrotor(pos=rng.uniform(-1, 0, 3), ori=rng.uniform(-0.2, 0.2, 3),
+                       dpos=rng.uniform(-1, 1, 3), dori=rng.uniform(-0.5, 0.5, 3), keep_history=False)
+             for _ in range(K)]
+    quads[1].mq, quads[2].Ix, quads[3].max_tau_phi = 0.5, 6e-4, 0.5
+    batch = QuadrotorBatch(K, quads, state=[np.concatenate((q.pos, q.ori, q.dpos, q.dori)) for q in quads])
+
+    for step in range(300):
+        controls = np.column_stack((rng.uniform(0, 5, K), rng.uniform(-1.5, 1.5, (K, 3))*np.sin(0.05*step)))
+        for q, u in zip(quads, controls):
+            q.updateConfiguration(*u, dt)
+        batch.updateConfiguration(*controls.T, dt)
+        expected = [np.concatenate((q.pos, q.ori, q.dpos, q.dori)) for q in quads]
+        np.testing.assert_allclose(batch.state, expected, rtol=1e-12, atol=1e-12)
+    assert np.any(np.abs(batch.dori) == batch.max_dphi[:, None])
+    assert np.any(batch.pos[:, 2] == 0)
+
+def test_motor_speeds_match_the_scalar_vehicle():
+    K, dt = 3, 0.02
+    quad = Quadrotor(pos=[0, 0, -1.0], keep_history=False)
+    batch = QuadrotorBatch(K, quad, state=np.concatenate((quad.pos, quad.ori, quad.dpos, quad.dori)))
+    speeds = np.array([2000.0, 2050.0, 1980.0, 2010.0])
+    for _ in range(50):
+        expected = quad.updateConfigurationViaSpeed(*speeds, dt)
+        wrench = batch.updateConfigurationViaSpeed(*(np.full(K, o) for o in speeds), dt)
+        np.testing.assert_allclose(np.array(wrench).T, np.tile(expected, (K, 1)))
+    np.testing.assert_allclose(batch.pos, np.tile(quad.pos, (K, 1)))
+    np.testing.assert_allclose(batch.ori, np.tile(quad.ori, (K, 1)))
+
+def test_motor_speed_dynamics_of_k_vehicles():
+    # dynamics/quadrotor_dynamics.py, K vehicles against one vehicle each
+    rng = np.random.default_rng(1)
+    K, dt = 4, 0.005
+    batch = MotorQuadrotor(K=K)
+    single = [MotorQuadrotor() for _ in range(K)]
+    for _ in range(100):
+        speeds = rng.uniform(3000, 4000, (4, K))
+        state = batch.update_state(speeds, dt)
+        for k, quad in enumerate(single):
+            quad.update_state(speeds[:, k:k+1], dt)
+            for name in state:
+                np.testing.assert_allclose(state[name][k], quad.state[name], rtol=1e-12, atol=1e-12)
+    assert state['position'].shape == (K, 3)
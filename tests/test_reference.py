@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from dynamics.Quadrotor import Quadrotor
+from trajectory.reference import ReferenceTrajectory, circle, eight
+
+@pytest.mark.parametrize('shape', [circle, eight])
+def test_derivatives_match_finite_differences(shape):
+    t, h = np.linspace(0.0, 10.0, 101), 1e-5
+    pos, vel, acc = shape(t)
+    ahead, behind = shape(t + h), shape(t - h)
+    np.testing.assert_allclose(vel, (ahead[0] - behind[0])/(2*h), atol=1e-6)
+    np.testing.assert_allclose(acc, (ahead[1] - behind[1])/(2*h), atol=1e-6)
+    np.testing.assert_allclose(acc, (ahead[0] - 2*pos + behind[0])/h**2, atol=1e-3)
+
+def test_windows_hold_the_end_at_rest():
+    dt, N = 0.02, 20
+    traj = ReferenceTrajectory(1.0, dt, horizon=N)
+    quad = Quadrotor(pos=[0.1, 0.2, -1.0], dpos=[0.3, 0.0, 0.1], keep_history=False)
+    x_, u_ = traj.desired_altitude(quad, 40, N)
+    np.testing.assert_array_equal(x_[0], [quad.pos[2], quad.dpos[2]])
+    np.testing.assert_array_equal(x_[1:11], traj.altitude[40:50])
+    # past the end: the last position, no velocity, the hover thrust
+    np.testing.assert_array_equal(x_[11:], np.tile([traj.z_ref[-1], 0.0], (10, 1)))
+    np.testing.assert_allclose(u_[10:, 0], quad.mq*quad.g)
+
+    x_, u_ = traj.desired_position(quad, 0, N, np.full(N, quad.mq*quad.g))
+    pos, vel, acc = circle(np.arange(N)*dt)
+    np.testing.assert_array_equal(x_[1:, :2], pos[:, :2])
+    np.testing.assert_allclose(np.sin(u_[:, 1]), acc[:, 0]/quad.g)
+    np.testing.assert_allclose(np.sin(u_[:, 0]), -acc[:, 1]/quad.g)
+    with pytest.raises(ValueError):
+        traj.desired_altitude(quad, 0, N + 1)
@@ -0,0 +1,30 @@
+import numpy as np
+from dynamics.Quadrotor import Quadrotor
+from MPC.MPCController import AltitudeMPC, AttitudeMPC
+from trajectory.reference import ReferenceTrajectory
+
+def test_one_step_solves_a_linear_model():
+    traj = ReferenceTrajectory(2.0, 0.02)
+    quad = Quadrotor(pos=[0, 0, -1.5], dpos=[0, 0, 0.5], keep_history=False)
+    rti = AltitudeMPC(quad, N=20, backend='rti')
+    ipopt = AltitudeMPC(quad, N=20)
+    for idx in range(3):
+        x_, u_ = traj.desired_altitude(quad, idx, 20)
+        np.testing.assert_allclose(rti.solve(x_, u_), ipopt.solve(x_, u_), atol=1e-5)
+        rti.prepare()
+        assert rti.stats.last()[1] == 1
+
+def test_iterations_converge_to_the_nonlinear_solution():
+    # the same problem solved again on its grid is one more SQP step each
+    traj = ReferenceTrajectory(2.0, 0.02)
+    quad = Quadrotor(ori=[0.3, -0.2, 0.1], dori=[0.5, 0.0, -0.2], keep_history=False)
+    phid, thed = np.linspace(0.6, 0.0, 20), np.linspace(-0.4, 0.2, 20)
+    x_, u_ = traj.desired_attitude(quad, 0, 20, phid, thed)
+    x_, u_ = x_.copy(), u_.copy()
+    expected = np.array(AttitudeMPC(quad, N=20).solve(x_, u_))
+    rti = AttitudeMPC(quad, N=20, backend='rti')
+    errors = []
+    for _ in range(6):
+        errors.append(np.abs(np.array(rti.solve(x_, u_, shift=False)) - expected).max())
+        rti.prepare()
+    assert errors[0] > 1e-2 and errors[-1] < 1e-5
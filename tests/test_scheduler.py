@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from dynamics.Quadrotor import Quadrotor
+from motor_model.motor_model import MotorModel
+from scripts.cascade import buildControllers
+from scripts.scheduler import PipelinedScheduler
+from trajectory.reference import ReferenceTrajectory
+
+N, DT, TICKS = 10, 0.02, 6
+
+def controllers(quad):
+    return buildControllers(quad, N, DT, time_budget=None)
+
+def pipelinedSerially(quad, traj):
+    # the pipelined cascade written out serially: each loop takes the plans of the last
+    # tick, shifted by one step
+    motor_model = MotorModel()
+    al, po, at = controllers(quad)
+    shift = PipelinedScheduler.shiftPlan
+    controls = []
+    for k in range(TICKS):
+        thrusts = al.solve(*traj.desired_altitude(quad, k, N))
+        upstream = thrusts if k == 0 else shift(last[0])
+        phids, theds = po.solve(*traj.desired_position(quad, k, N, upstream), upstream)
+        tilt = (phids, theds) if k == 0 else (shift(last[1]), shift(last[2]))
+        tau_phis, tau_thes, tau_psis = at.solve(*traj.desired_attitude(quad, k, N, *tilt))
+        last = (thrusts, phids, theds)
+        for controller in (al, po, at):
+            controller.prepare()
+        motor_speed = motor_model.calculate_motor_speed(thrust=thrusts[0], torque_roll=tau_phis[0],
+                                                        torque_pitch=tau_thes[0], torque_yaw=tau_psis[0])
+        wrench = motor_model.calculate_forces_n_torques(motor_speed)[:, 0]
+        quad.updateConfiguration(*(float(w) for w in wrench), DT)
+        controls.append((thrusts[0], tau_phis[0], tau_thes[0], tau_psis[0]))
+    return np.array(controls)
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_pipelined_workers_solve_the_serial_pipeline(executor):
+    traj = ReferenceTrajectory(1.0, DT)
+    expected = pipelinedSerially(Quadrotor(keep_history=False), traj)
+
+    quad = Quadrotor(keep_history=False)
+    al, po, at = controllers(quad)
+    with PipelinedScheduler(quad, MotorModel(), traj, al, po, at, executor=executor) as scheduler:
+        controls = np.array([scheduler.step(k)[:4] for k in range(TICKS)])
+    np.testing.assert_allclose(controls, expected, rtol=1e-9, atol=1e-9)
+    # the statistics of the worker solves are recorded in this process
+    assert [c.stats.count for c in (al, po, at)] == [TICKS]*3
+
+def test_pipelined_cascade_is_single_rate():
+    quad = Quadrotor(keep_history=False)
+    al, po, at = controllers(quad)
+    at.T = DT/4
+    with pytest.raises(ValueError):
+        PipelinedScheduler(quad, MotorModel(), ReferenceTrajectory(1.0, DT), al, po, at)
+    with pytest.raises(ValueError):
+        PipelinedScheduler(quad, MotorModel(), ReferenceTrajectory(1.0, DT), al, po, al, executor='fork')
@@ -0,0 +1,65 @@
+import numpy as np
+import os
+from dynamics.Quadrotor import Quadrotor
+from MPC.MPCController import AltitudeMPC
+from MPC.solver_cache import cache_key, cache_path, load_solver
+from trajectory.reference import ReferenceTrajectory
+
+def test_entries_by_problem():
+    quad = Quadrotor(keep_history=False)
+    assert cache_key(AltitudeMPC(quad, N=10)) == cache_key(AltitudeMPC(Quadrotor(pos=[1, 2, -3]), N=10))
+    assert cache_key(AltitudeMPC(quad, N=10)) != cache_key(AltitudeMPC(quad, N=20))
+    assert cache_key(AltitudeMPC(quad, N=10)) != cache_key(AltitudeMPC(quad, N=10, backend='qp'))
+
+def test_cached_solver_solves_the_same(tmp_path):
+    quad = Quadrotor(keep_history=False)
+    x_, u_ = ReferenceTrajectory(1.0, 0.02).desired_altitude(quad, 0, 10)
+    built = AltitudeMPC(quad, N=10, cache_dir=str(tmp_path))
+    assert os.path.isfile(cache_path(str(tmp_path), built))
+
+    loaded = AltitudeMPC(quad, N=10, cache_dir=str(tmp_path))
+    np.testing.assert_allclose(loaded.solve(x_, u_), built.solve(x_, u_), atol=1e-6)
+
+def test_truncated_entry_is_rebuilt(tmp_path):
+    controller = AltitudeMPC(Quadrotor(keep_history=False), N=10, cache_dir=str(tmp_path))
+    path = cache_path(str(tmp_path), controller)
+    with open(path, 'r+b') as f:
+        f.truncate(100)
+    assert load_solver(str(tmp_path), controller) is None
+    AltitudeMPC(Quadrotor(keep_history=False), N=10, cache_dir=str(tmp_path))
+    assert load_solver(str(tmp_path), controller) is not None
+
+def test_compiled_build_leaves_no_files(tmp_path, monkeypatch):
+    cwd = tmp_path / 'cwd'
+    cwd.mkdir()
+    monkeypatch.chdir(cwd)
+    cache_dir = str(tmp_path / 'cache')
+    AltitudeMPC(Quadrotor(keep_history=False), N=5, backend='qp', compiled=True, cache_dir=cache_dir)
+    assert os.listdir(cwd) == []
+    # only the entries and the binaries they link to are kept
+    files = [name for root, dirs, names in os.walk(cache_dir) for name in names]
+    assert any(name.endswith('.so') for name in files)
+    assert all(name.endswith(('.casadi', '.so')) for name in files)
+
+def test_unreferenced_builds_are_collected(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path)
+    stale = tmp_path / 'jit' / 'AltitudeMPC_0000000000000000.old'
+    building = tmp_path / 'jit' / 'PositionMPC_0000000000000000.new'
+    stale.mkdir(parents=True)
+    building.mkdir()
+    (building / '.building').touch()
+
+    # the working directory is not changed while the solver compiles
+    cwd = tmp_path / 'cwd'
+    cwd.mkdir()
+    monkeypatch.chdir(cwd)
+    controller = AltitudeMPC(Quadrotor(keep_history=False), N=5, compiled=True, cache_dir=cache_dir)
+    assert os.getcwd() == str(cwd) and os.listdir(cwd) == []
+    builds = os.listdir(tmp_path / 'jit')
+    assert sorted(name.split('.')[0] for name in builds) == [cache_key(controller), 'PositionMPC_0000000000000000']
+
+    # a rebuild of the same entry replaces its build
+    os.remove(cache_path(cache_dir, controller))
+    AltitudeMPC(Quadrotor(keep_history=False), N=5, compiled=True, cache_dir=cache_dir)
+    assert len(os.listdir(tmp_path / 'jit')) == 2
+    assert set(os.listdir(tmp_path / 'jit')) != set(builds)
@@ -0,0 +1,47 @@
+import numpy as np
+from MPC.solver_stats import SolverStats
+
+def record(stats, solves):
+    for k in solves:
+        stats.record(0.001*k, k % 3 - 1, k % 4 != 0, 'Solve_Succeeded' if k % 4 else 'Infeasible_Problem_Detected',
+                     float(k), 0.0)
+
+def test_ring_buffer_wraps_around():
+    stats = SolverStats(size=8)
+    record(stats, range(1, 21))
+    assert stats.count == 20 and len(stats) == 8
+    # the newest 8 solves in chronological order
+    np.testing.assert_array_equal(stats.view('cost'), np.arange(13, 21))
+    np.testing.assert_allclose(stats.view('wall_time'), 0.001*np.arange(13, 21))
+    assert stats.last() == (0.02, 20 % 3 - 1, False, 'Infeasible_Problem_Detected', 20.0, 0.0)
+    # 16 and 20 are the failures still in the buffer
+    assert stats.failure_count() == 2
+    assert stats.failures_by_status() == {'Infeasible_Problem_Detected': 2}
+
+def test_percentiles_and_iteration_means():
+    stats = SolverStats(size=8)
+    assert all(np.isnan(v) for v in stats.latency_percentiles().values())
+    record(stats, range(1, 101))
+    kept = 0.001*np.arange(93, 101)
+    percentiles = stats.latency_percentiles()
+    for q in (50, 95, 99):
+        assert np.isclose(percentiles[q], np.percentile(kept, q))
+    assert percentiles[50] <= percentiles[95] <= percentiles[99] <= kept.max()
+    # the -1 of the unreported iteration counts is left out of the mean
+    counts = np.arange(93, 101) % 3 - 1
+    assert stats.mean_iter_count() == np.mean(counts[counts >= 0])
+    summary = stats.summary()
+    assert summary['solves'] == 8 and summary['p50'] == percentiles[50]
+
+def test_exports_in_chronological_order(tmp_path):
+    stats = SolverStats(size=4)
+    record(stats, range(1, 7))
+    stats.to_npz(str(tmp_path / 'stats.npz'))
+    data = np.load(str(tmp_path / 'stats.npz'))
+    np.testing.assert_array_equal(data['cost'], [3, 4, 5, 6])
+    assert [data['status_names'][s] for s in data['status']] == ['Solve_Succeeded', 'Infeasible_Problem_Detected',
+                                                                'Solve_Succeeded', 'Solve_Succeeded']
+    stats.to_csv(str(tmp_path / 'stats.csv'))
+    lines = (tmp_path / 'stats.csv').read_text().splitlines()
+    assert lines[0] == ','.join(SolverStats.fields) and len(lines) == 5
+    assert lines[2].split(',')[3] == 'Infeasible_Problem_Detected'
@@ -0,0 +1,28 @@
+import numpy as np
+from dynamics.Quadrotor import Quadrotor
+from trajectory.reference import ReferenceTrajectory, eight
+from trajectory.streaming import StreamingTrajectory, stream
+
+def test_windows_match_the_tabulated_reference():
+    # a small buffer is refilled many times over the run, the windows reach into the padding
+    dt, N, sim_time = 0.02, 30, 4.0
+    quad = Quadrotor(pos=[0.5, -0.3, -1.0], dpos=[0.1, 0.2, 0.0], keep_history=False)
+    tabulated = ReferenceTrajectory(sim_time, dt, shape=eight, horizon=N)
+    streaming = StreamingTrajectory(stream(eight, dt, duration=sim_time, chunk=7), dt, horizon=N, capacity=2*N)
+
+    phid, thed = np.linspace(-0.1, 0.1, N), np.linspace(0.2, 0.0, N)
+    for idx in range(0, int(sim_time/dt), 3):
+        for name, args in (('desired_altitude', ()), ('desired_position', (np.full(N, 3.0),)),
+                           ('desired_attitude', (phid, thed))):
+            expected = getattr(tabulated, name)(quad, idx, N, *args)
+            for a, b in zip(getattr(streaming, name)(quad, idx, N, *args), expected):
+                np.testing.assert_array_equal(a, b)
+        np.testing.assert_array_equal(streaming.reference(idx), tabulated.reference(idx))
+
+def test_single_samples():
+    dt = 0.02
+    samples = ((t, *(a[0] for a in eight(np.array([t])))) for t in np.arange(50)*dt)
+    streaming = StreamingTrajectory(samples, dt, horizon=10, capacity=16)
+    tabulated = ReferenceTrajectory(1.0, dt, shape=eight, horizon=10)
+    for idx in range(50):
+        np.testing.assert_array_equal(streaming.reference(idx), tabulated.reference(idx))
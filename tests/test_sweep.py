@@ -0,0 +1,34 @@
+import json
+import pytest
+from dynamics.Quadrotor import Quadrotor
+from scripts import cascade, sweep
+
+@pytest.fixture
+def controllers(monkeypatch):
+    # uncompiled controllers without a time budget, the runs are deterministic
+    built = cascade.buildControllers(Quadrotor(keep_history=False), 10, 0.02, time_budget=None)
+    monkeypatch.setitem(sweep.controllers, (10, 0.02), (built, [(c.p_q.copy(), c.p_r.copy()) for c in built]))
+    return built
+
+def test_grid_combines_the_axes():
+    configs = sweep.grid(N=[30, 50], shape=['circle', 'eight'], attitude_ratio=[1])
+    assert configs == [{'N': 30, 'shape': 'circle', 'attitude_ratio': 1}, {'N': 30, 'shape': 'eight', 'attitude_ratio': 1},
+                       {'N': 50, 'shape': 'circle', 'attitude_ratio': 1}, {'N': 50, 'shape': 'eight', 'attitude_ratio': 1}]
+
+def test_reused_controllers_run_like_new_ones(controllers):
+    config = {'N': 10, 'sim_time': 1.0, 'attitude_ratio': 2}
+    first = sweep.runConfiguration(config)
+    assert first['error'] == '' and json.loads(first['config']) == {'N': 10, 'attitude_ratio': 2, 'sim_time': 1.0}
+    reweighted = sweep.runConfiguration(dict(config, position_Q=[5, 5, 1, 1]))
+    assert reweighted['rmse'] != first['rmse']
+    # the weights and the warm starts of the last configuration are not carried over
+    assert sweep.runConfiguration(config)['rmse'] == first['rmse']
+    assert controllers[1].stats.count == 50
+
+def test_rows_in_the_order_of_the_configurations(controllers):
+    configs = [{'N': 10, 'sim_time': t, 'shape': 'eight'} for t in (0.5, 0.3)] + [{'N': 10, 'speed': 2}]
+    rows = sweep.sweep(configs, workers=2)
+    assert [json.loads(row['config']).get('sim_time') for row in rows] == [0.5, 0.3, None]
+    assert rows[0]['rmse'] == sweep.runConfiguration(configs[0])['rmse']
+    assert rows[2]['error'].startswith('ValueError') and 'speed' in rows[2]['error']
+    assert '-' in sweep.formatTable(rows).splitlines()[3]
@@ -0,0 +1,41 @@
+import numpy as np
+from utils.telemetry import CHANNELS, TelemetryRecorder
+
+def fill(recorder, n):
+    for i in range(n):
+        recorder.record(time=0.02*i, state=np.arange(12) + i, control=(i, -i, 2*i, 0.5*i))
+
+def test_buffers_grow_and_keep_the_rows():
+    recorder = TelemetryRecorder(capacity=4)
+    fill(recorder, 11)
+    assert len(recorder) == 11 and recorder.capacity == 16
+    np.testing.assert_allclose(recorder['time'], 0.02*np.arange(11))
+    np.testing.assert_array_equal(recorder['state'][:, 0], np.arange(11))
+    # the channels not given to record() stay zero
+    assert recorder['motor_speed'].shape == (11, 4) and not recorder['motor_speed'].any()
+
+def test_memmap_spill_round_trips(tmp_path):
+    spill_dir = tmp_path / 'spill'
+    in_memory = TelemetryRecorder(capacity=4)
+    spilled = TelemetryRecorder(capacity=4, spill_dir=str(spill_dir))
+    fill(in_memory, 37)
+    fill(spilled, 37)
+    spilled.flush()
+    assert isinstance(spilled.buffers['state'], np.memmap)
+    for name, (width, dtype) in CHANNELS.items():
+        np.testing.assert_array_equal(spilled[name], in_memory[name])
+        # the files hold the rows, read back without the recorder
+        shape = (spilled.capacity,) if width == 1 else (spilled.capacity, width)
+        on_disk = np.memmap(str(spill_dir / (name + '.dat')), dtype=dtype, mode='r', shape=shape)
+        np.testing.assert_array_equal(on_disk[:37], in_memory[name])
+
+    spilled.save(str(tmp_path / 'run.npz'))
+    saved = np.load(str(tmp_path / 'run.npz'))
+    for name in CHANNELS:
+        np.testing.assert_array_equal(saved[name], in_memory[name])
+
+    # a new recorder in the same directory starts from empty files
+    again = TelemetryRecorder(capacity=4, spill_dir=str(spill_dir))
+    fill(again, 2)
+    assert (spill_dir / 'state.dat').stat().st_size == 4*12*8
+    np.testing.assert_array_equal(again['state'], in_memory['state'][:2])
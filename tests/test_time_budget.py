@@ -0,0 +1,32 @@
+import numpy as np
+from dynamics.Quadrotor import Quadrotor
+from MPC.MPCController import AltitudeMPC
+from trajectory.reference import ReferenceTrajectory
+
+def test_overrun_falls_back_to_the_shifted_plan():
+    traj = ReferenceTrajectory(2.0, 0.02)
+    quad = Quadrotor(pos=[0, 0, -1.8], keep_history=False)
+    budgeted = AltitudeMPC(quad, N=20, time_budget=1e-9)  # no IPOPT solve fits in it
+
+    # a first plan from a solver of the same problem without the limit
+    limited = budgeted.solver
+    budgeted.solver = AltitudeMPC(quad, N=20).solver
+    plan = budgeted.solve(*traj.desired_altitude(quad, 0, 20))
+    assert not budgeted.degraded
+    budgeted.solver = limited
+
+    u = budgeted.solve(*traj.desired_altitude(quad, 1, 20))
+    np.testing.assert_array_equal(u, np.append(plan[1:], plan[-1]))
+    assert budgeted.degraded
+    wall_time, iter_count, success, status, cost, violation = budgeted.stats.last()
+    assert not success and status == 'Maximum_WallTime_Exceeded' and np.isnan(cost)
+    assert budgeted.stats.failures_by_status() == {'Maximum_WallTime_Exceeded': 1}
+
+def test_overrun_before_a_first_plan_keeps_the_reference():
+    traj = ReferenceTrajectory(2.0, 0.02)
+    quad = Quadrotor(pos=[0, 0, -1.8], keep_history=False)
+    budgeted = AltitudeMPC(quad, N=20, time_budget=1e-9)
+    x_, u_ = traj.desired_altitude(quad, 0, 20)
+    u = budgeted.solve(x_, u_)
+    np.testing.assert_array_equal(u, np.clip(np.ravel(u_), quad.min_thrust, quad.max_thrust))
+    assert budgeted.degraded
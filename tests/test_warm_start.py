@@ -0,0 +1,39 @@
+import numpy as np
+from dynamics.Quadrotor import Quadrotor
+from MPC.MPCController import PositionMPC
+from trajectory.reference import ReferenceTrajectory
+
+def test_solution_is_shifted_into_the_warm_start():
+    traj = ReferenceTrajectory(2.0, 0.02)
+    quad = Quadrotor(pos=[0.5, 4.0, -2.0], keep_history=False)
+    thrust = np.full(20, quad.mq*quad.g)
+    controller = PositionMPC(quad, N=20)
+    u = np.array(controller.solve(*traj.desired_position(quad, 0, 20, thrust), thrust)).T
+    x = controller.next_states.copy()
+
+    np.testing.assert_array_equal(controller.u0[:-1], u[1:])
+    np.testing.assert_array_equal(controller.u0[-1], u[-1])
+    # the new last state is the old one rolled through the model with the last control
+    x_end = controller.model_step(x[-2], u[-1], controller.p_stage[-1], controller.p_vehicle).full().ravel()
+    np.testing.assert_allclose(x[-1], np.clip(x_end, controller.lbx[:4], controller.ubx[:4]))
+    # the multipliers are shifted with it
+    assert np.any(controller.lam_g != 0)
+    np.testing.assert_array_equal(controller.lam_g_stages[-1], controller.lam_g_stages[-2])
+
+def test_warm_start_saves_iterations():
+    traj = ReferenceTrajectory(4.0, 0.02)
+    quad = Quadrotor(pos=[0.0, 5.0, -2.0], dpos=[0.0, 0.0, 0.0], keep_history=False)
+    warm, cold = PositionMPC(quad, N=30), PositionMPC(quad, N=30)
+    thrust = np.full(30, quad.mq*quad.g)
+    iterations = []
+    for idx in range(20):
+        x_, u_ = traj.desired_position(quad, idx, 30, thrust)
+        phid, thed = warm.solve(x_, u_, thrust)
+        cold.reset()  # a solve from zero, as without the warm start
+        cold.solve(x_, u_, thrust)
+        iterations.append((warm.stats.last()[1], cold.stats.last()[1]))
+        # fly the planned tilt
+        quad.ori = np.array([phid[0], thed[0], 0.0])
+        quad.updateConfiguration(thrust[0], 0.0, 0.0, 0.0, 0.02)
+    warm_iterations, cold_iterations = np.mean(iterations[1:], axis=0)
+    assert warm_iterations < cold_iterations
@@ -0,0 +1,56 @@
+import numpy as np
+import os
+import pytest
+from dynamics.Quadrotor import Quadrotor
+from trajectory.reference import ReferenceTrajectory, circle
+from trajectory.waypoints import TimeIndex, WaypointTrajectory, hermite, load_waypoints
+
+def quadratic(t):
+    # a path the interpolation reproduces exactly: position, velocity, acceleration
+    c = np.array([[0.5, -1.0, 0.2], [1.0, 2.0, -0.3], [-2.0, 0.0, 0.1]])
+    pos = c[0] + np.outer(t, c[1]) + np.outer(t**2, c[2])
+    return pos, np.tile(c[1], (len(t), 1)) + np.outer(2*t, c[2]), np.tile(2*c[2], (len(t), 1))
+
+@pytest.mark.parametrize('uniform', [True, False])
+def test_interpolates_a_quadratic_exactly(uniform):
+    t = np.linspace(0.0, 4.0, 21)
+    if not uniform:
+        t = t + 0.05*np.sin(7*t)
+    data = np.column_stack((t, quadratic(t)[0]))
+    index = TimeIndex(data[:, 0])
+    assert index.uniform == uniform
+    # between the second and the second-to-last sample, the end segments take one-sided slopes
+    times = np.linspace(t[1], t[-2], 57, endpoint=False)
+    for got, expected in zip(hermite(data, index, times), quadratic(times)):
+        np.testing.assert_allclose(got, expected, atol=1e-9)
+
+def test_recorded_circle_follows_the_analytic_one(tmp_path):
+    dt = 0.02
+    reference = ReferenceTrajectory(4.0, dt)
+    t = np.arange(0.0, 4.0 + 1e-9, 0.1)
+    samples = np.column_stack((t, circle(t)[0]))
+    path = str(tmp_path / 'circle.csv')
+    np.savetxt(path, samples, delimiter=',', header='t,x,y,z,yaw', comments='')
+
+    data = load_waypoints(path)
+    assert os.path.isfile(path + '.npy') and not data.flags.writeable
+    traj = WaypointTrajectory(path, dt)
+    quad = Quadrotor(keep_history=False)
+    for idx in (25, 50, 150):
+        x_, _ = traj.desired_position(quad, idx, 20, np.full(20, 3.0))
+        expected, _ = reference.desired_position(quad, idx, 20, np.full(20, 3.0))
+        np.testing.assert_allclose(x_[1:, :2], expected[1:, :2], atol=2e-3)
+        np.testing.assert_allclose(x_[1:, 2:], expected[1:, 2:], atol=2e-2)
+
+    # past the end the last sample is held at rest
+    x_, u_ = traj.desired_altitude(quad, traj.n_samples - 5, 20)
+    np.testing.assert_allclose(x_[6:], np.tile([samples[-1, 3], 0.0], (15, 1)))
+    np.testing.assert_array_equal(traj.reference(traj.n_samples + 10), samples[-1, 1:])
+
+def test_rejects_bad_columns(tmp_path):
+    path = str(tmp_path / 'bad.npy')
+    np.save(path, np.zeros((5, 3)))
+    with pytest.raises(ValueError):
+        load_waypoints(path)
+    with pytest.raises(ValueError):
+        TimeIndex(np.array([0.0, 1.0, 1.0]))
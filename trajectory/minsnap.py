@@ -0,0 +1,153 @@
+import numpy as np
+import hashlib
+import math
+from trajectory.reference import ReferenceTrajectory
+
+ORDER = 7  # polynomial degree of a segment, the lowest one with a snap-optimal solution
+
+# the segment coefficients of solved waypoint sets, by the hash of waypoints and times
+SEGMENT_CACHE = {}
+
+def derivative_row(k, s, scale):
+    # the k-th derivative of [1, s, ..., s^ORDER] at s, d/dt = scale*d/ds
+    row = np.zeros(ORDER + 1)
+    for n in range(k, ORDER + 1):
+        row[n] = math.factorial(n)//math.factorial(n - k)*s**(n - k)
+    return row*scale**k
+
+def segment_coefficients(waypoints, times):
+    # Minimum-snap polynomials through the waypoints (M+1, d) at the times (M+1,).
+    #
+    # Segment i is p_i(s) = sum_n c_in s^n with s = (t - t_i)/T_i in [0, 1]. The
+    # vehicle starts and stops at rest (velocity, acceleration and jerk 0), passes the
+    # waypoints and is C6 at the interior ones. These 8M conditions determine the 8M
+    # coefficients and their solution is the snap-optimal trajectory. Returns (M, 8, d).
+    waypoints = np.ascontiguousarray(waypoints, dtype=float)
+    times = np.ascontiguousarray(times, dtype=float)
+    key = hashlib.sha256(waypoints.tobytes() + times.tobytes() + str(waypoints.shape).encode()).hexdigest()
+    if key in SEGMENT_CACHE:
+        return SEGMENT_CACHE[key]
+
+    M = len(waypoints) - 1
+    if M < 1 or len(times) != M + 1 or np.any(np.diff(times) <= 0):
+        raise ValueError("Expected at least two waypoints at increasing times")
+    durations = np.diff(times)
+    n = ORDER + 1
+    A = np.zeros((n*M, n*M))
+    b = np.zeros((n*M, waypoints.shape[1]))
+    row = 0
+
+    def condition(i, k, s, value=None):
+        nonlocal row
+        A[row, n*i:n*(i+1)] = derivative_row(k, s, 1.0/durations[i])
+        if value is not None:
+            b[row] = value
+        row += 1
+
+    # the start and the end at rest
+    condition(0, 0, 0.0, waypoints[0])
+    for k in range(1, 4):
+        condition(0, k, 0.0)
+    condition(M-1, 0, 1.0, waypoints[M])
+    for k in range(1, 4):
+        condition(M-1, k, 1.0)
+
+    # the interior waypoints and the continuity of the derivatives 1..6
+    for i in range(M - 1):
+        condition(i, 0, 1.0, waypoints[i+1])
+        condition(i+1, 0, 0.0, waypoints[i+1])
+        for k in range(1, ORDER):
+            A[row, n*i:n*(i+1)] = derivative_row(k, 1.0, 1.0/durations[i])
+            A[row, n*(i+1):n*(i+2)] = -derivative_row(k, 0.0, 1.0/durations[i+1])
+            row += 1
+
+    coefficients = np.linalg.solve(A, b).reshape(M, n, -1)
+    SEGMENT_CACHE[key] = coefficients
+    return coefficients
+
+class MinimumSnap:
+    # The minimum-snap trajectory of [x, y, z, yaw] waypoints, evaluated vectorized
+    def __init__(self, waypoints, times):
+        self.times = np.asarray(times, dtype=float)
+        self.coefficients = segment_coefficients(waypoints, self.times)
+        self.durations = np.diff(self.times)
+        # the coefficients of the derivatives 0..4 in s, (5, M, 8, d)
+        n = np.arange(ORDER + 1)
+        self.derivatives = np.zeros((5,) + self.coefficients.shape)
+        self.derivatives[0] = self.coefficients
+        for k in range(1, 5):
+            self.derivatives[k, :, :-1] = self.derivatives[k-1, :, 1:]*n[1:, None]
+
+    def evaluate(self, t, order=4):
+        # position, velocity, ... up to the order-th derivative at the times t (clamped to
+        # the trajectory), each (len(t), d)
+        t = np.clip(np.asarray(t, dtype=float), self.times[0], self.times[-1])
+        i = np.clip(np.searchsorted(self.times, t, side='right') - 1, 0, len(self.durations) - 1)
+        T = self.durations[i]
+        s = (t - self.times[i])/T
+        powers = s[:, None]**np.arange(ORDER + 1)
+        return [np.einsum('tn,tnd->td', powers, self.derivatives[k, i])/(T**k)[:, None]
+                for k in range(order + 1)]
+
+def flat_attitude(acc, jerk, snap, g):
+    # The tilt of the quadrotor model (ddx = T/m sin(the), ddy = -T/m sin(phi),
+    # ddz = g - T/m) that flies the acceleration, and its first two derivatives:
+    # phi, the, dphi, dthe, ddphi, ddthe as (n,) arrays; the rates of a saturated tilt are 0
+    b, db, ddb = g - acc[:, 2], -jerk[:, 2], -snap[:, 2]
+    angles = []
+    for a, da, dda, sign in ((acc[:, 1], jerk[:, 1], snap[:, 1], -1.0), (acc[:, 0], jerk[:, 0], snap[:, 0], 1.0)):
+        q = a/b
+        free = np.abs(q) < 0.999
+        q = np.clip(q, -0.999, 0.999)
+        dq = np.where(free, da/b - a*db/b**2, 0.0)
+        ddq = np.where(free, dda/b - 2*da*db/b**2 - a*ddb/b**2 + 2*a*db**2/b**3, 0.0)
+        root = np.sqrt(1 - q**2)
+        angles.append((sign*np.arcsin(q), sign*dq/root, sign*(ddq/root + q*dq**2/root**3)))
+    (phi, dphi, ddphi), (the, dthe, ddthe) = angles
+    return phi, the, dphi, dthe, ddphi, ddthe
+
+class MinimumSnapTrajectory(ReferenceTrajectory):
+    # ReferenceTrajectory of a minimum-snap trajectory through [x, y, z, yaw] waypoints.
+    #
+    # The tables hold the polynomial values and their jerk and snap, so the attitude
+    # loop gets the rates of the flat tilt of the reference and the torques that fly
+    # it (inertial and gyroscopic) instead of differences of the position plan.
+    def __init__(self, waypoints, times, dt=0.02, horizon=200):
+        self.snap_trajectory = MinimumSnap(waypoints, times)
+        self.sim_time = float(self.snap_trajectory.times[-1] - self.snap_trajectory.times[0])
+        self.dt = dt
+        self.horizon = horizon
+        self.n_samples = int(self.sim_time/dt) + 1
+
+        self.setupTables(self.n_samples + horizon)
+        t = self.snap_trajectory.times[0] + np.arange(self.n_samples + horizon)*dt
+        pos, vel, acc, jerk, snap = self.snap_trajectory.evaluate(t)
+        self.writeTables(0, pos, vel, acc)
+        self.jerk = jerk
+        self.snap = snap
+
+        self.ref = self.pos[:self.n_samples]
+        self.x_ref, self.y_ref, self.z_ref, self.psi_ref = self.ref.T
+
+    def desired_attitude(self, quad, idx, N_, phid, thed, dphid=None, dthed=None):
+        # the flat rates are exact on any grid, the rates of the plan are not needed.
+        # x_ and u_ are buffers, as in ReferenceTrajectory.desired_altitude
+        x_, u_ = self.buffer('attitude', N_, 6, 3)
+        rows = self.window(idx, N_)
+
+        x_[0, :3] = quad.ori; x_[0, 3:] = quad.dori
+        x_[1:, 0] = phid
+        x_[1:, 1] = thed
+        x_[1:, 2] = self.pos[rows, 3]
+
+        # the rates and accelerations of the flat tilt of the reference
+        phi, the, dphi, dthe, ddphi, ddthe = flat_attitude(self.acc[rows], self.jerk[rows], self.snap[rows], quad.g)
+        x_[1:, 3] = dphi
+        x_[1:, 4] = dthe
+        x_[1:, 5] = self.vel[rows, 3]
+        dpsi, ddpsi = self.vel[rows, 3], self.acc[rows, 3]
+
+        u_[:, 0] = (quad.Ix*ddphi - dthe*dpsi*(quad.Iy-quad.Iz))/quad.la
+        u_[:, 1] = (quad.Iy*ddthe - dphi*dpsi*(quad.Iz-quad.Ix))/quad.la
+        u_[:, 2] = quad.Iz*ddpsi - dphi*dthe*(quad.Ix-quad.Iy)
+        return x_, u_
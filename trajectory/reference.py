@@ -0,0 +1,164 @@
+import numpy as np
+import math
+
+def circle(t, radius=5.0, period=10.0, z=-2.0):
+    # the circle of Trajectory.desiredTrajectory: position, velocity and acceleration
+    # of [x, y, z, yaw] at the times t
+    w = 2*math.pi/period
+    s, c = np.sin(w*t), np.cos(w*t)
+    zeros, ones = np.zeros_like(t), np.ones_like(t)
+    pos = np.stack((radius*s, radius*c, z*ones, w*t), axis=1)
+    vel = np.stack((radius*w*c, -radius*w*s, zeros, w*ones), axis=1)
+    acc = np.stack((-radius*w**2*s, -radius*w**2*c, zeros, zeros), axis=1)
+    return pos, vel, acc
+
+def eight(t, radius=5.0, period=10.0, z=-2.0):
+    # the figure-8 of Trajectory.desiredTrajectory_eight
+    w = 2*math.pi/period
+    zeros, ones = np.zeros_like(t), np.ones_like(t)
+    pos = np.stack((radius*np.sin(w*t), radius*np.sin(2*w*t), z*ones, w*t), axis=1)
+    vel = np.stack((radius*w*np.cos(w*t), 2*radius*w*np.cos(2*w*t), zeros, w*ones), axis=1)
+    acc = np.stack((-radius*w**2*np.sin(w*t), -4*radius*w**2*np.sin(2*w*t), zeros, zeros), axis=1)
+    return pos, vel, acc
+
+class ReferenceTrajectory:
+    # The references of the cascade, computed once with analytic derivatives.
+    #
+    # Drop-in for Trajectory in scripts/main.py: desired_altitude/position/attitude
+    # have the same signatures and return the same layouts, but the reference rows
+    # are copied from precomputed tables into buffers owned by this object (reused
+    # by the next call of the same method), and the feedforward controls are
+    # computed in place. The tables are padded with `horizon` samples holding the
+    # last position at rest, so every window up to that length is a plain slice.
+    # The windows are copied rather than returned as views: their first row is the
+    # current state, and the solve copies them into its parameter vector anyway.
+    def __init__(self, sim_time=10.0, dt=0.02, shape=circle, horizon=200):
+        self.sim_time = sim_time
+        self.dt = dt
+        self.horizon = horizon
+        self.n_samples = int(sim_time/dt)
+
+        self.setupTables(self.n_samples + horizon)
+        pos, vel, acc = shape(np.arange(self.n_samples)*dt)
+        self.writeTables(0, pos, vel, acc)
+        self.writeTables(self.n_samples, *self.rest(pos[-1], horizon))
+
+        # the reference samples, as Trajectory.ref
+        self.ref = self.pos[:self.n_samples]
+        self.x_ref, self.y_ref, self.z_ref, self.psi_ref = self.ref.T
+
+    def setupTables(self, n):
+        self.pos = np.zeros((n, 4))
+        self.vel = np.zeros((n, 4))
+        self.acc = np.zeros((n, 4))
+        # the state rows of each loop, [z, dz] and [x, y, dx, dy]
+        self.altitude = np.zeros((n, 2))
+        self.position = np.zeros((n, 4))
+        self.buffers = {}
+
+    def writeTables(self, start, pos, vel, acc):
+        rows = slice(start, start + len(pos))
+        self.pos[rows] = pos
+        self.vel[rows] = vel
+        self.acc[rows] = acc
+        self.altitude[rows, 0] = pos[:, 2]; self.altitude[rows, 1] = vel[:, 2]
+        self.position[rows, :2] = pos[:, :2]; self.position[rows, 2:] = vel[:, :2]
+
+    @staticmethod
+    def rest(pos, n):
+        # n samples holding pos at rest, the padding after the end of a reference
+        return np.tile(pos, (n, 1)), np.zeros((n, 4)), np.zeros((n, 4))
+
+    def buffer(self, name, N_, nx, nu):
+        # the output arrays of one method and horizon, allocated on the first call
+        key = (name, N_)
+        if key not in self.buffers:
+            self.buffers[key] = (np.zeros((N_+1, nx)), np.zeros((N_, nu)))
+        return self.buffers[key]
+
+    def window(self, idx, N_):
+        # the table rows of the horizon starting at idx
+        if N_ > self.horizon:
+            raise ValueError("The horizon %d is longer than the padding %d" % (N_, self.horizon))
+        idx = min(idx, self.n_samples - 1)
+        return slice(idx, idx + N_)
+
+    def reference(self, idx):
+        # the [x, y, z, yaw] reference at sample idx
+        return self.pos[self.window(idx, 1).start]
+
+    def desired_altitude(self, quad, idx, N_):
+        # x_ and u_ are buffers of this object, the next call with the same N_ overwrites
+        # them; copy them to keep them across calls
+        x_, u_ = self.buffer('altitude', N_, 2, 1)
+        rows = self.window(idx, N_)
+
+        # initial state / references
+        x_[0, 0] = quad.pos[2]; x_[0, 1] = quad.dpos[2]
+        x_[1:] = self.altitude[rows]
+
+        # hover thrust plus the vertical acceleration
+        np.subtract(quad.g, self.acc[rows, 2], out=u_[:, 0])
+        u_ *= quad.mq
+        return x_, u_
+
+    def desired_position(self, quad, idx, N_, thrust):
+        # x_ and u_ are buffers, as in desired_altitude
+        x_, u_ = self.buffer('position', N_, 4, 2)
+        rows = self.window(idx, N_)
+
+        x_[0, 0] = quad.pos[0]; x_[0, 1] = quad.pos[1]; x_[0, 2] = quad.dpos[0]; x_[0, 3] = quad.dpos[1]
+        x_[1:] = self.position[rows]
+
+        # the tilt that produces the horizontal acceleration with the planned thrust. Below
+        # half the hover thrust (e.g. after a takeoff overshoot) the thrust of the reference
+        # is used instead, the planned one gives tilts of ±90° with the sign of its rounding
+        _, thrust_ = self.buffer('thrust', N_, 0, 1)
+        thrust_ = thrust_[:, 0]
+        np.subtract(quad.g, self.acc[rows, 2], out=thrust_)
+        thrust_ *= quad.mq
+        np.copyto(thrust_, thrust, where=np.asarray(thrust) >= 0.5*quad.mq*quad.g)
+        np.multiply(self.acc[rows, 0], quad.mq, out=u_[:, 1])
+        np.divide(u_[:, 1], thrust_, out=u_[:, 1])
+        np.arcsin(np.clip(u_[:, 1], -1, 1, out=u_[:, 1]), out=u_[:, 1])
+        np.multiply(self.acc[rows, 1], -quad.mq, out=u_[:, 0])
+        np.divide(u_[:, 0], thrust_, out=u_[:, 0])
+        np.arcsin(np.clip(u_[:, 0], -1, 1, out=u_[:, 0]), out=u_[:, 0])
+        return x_, u_
+
+    def desired_attitude(self, quad, idx, N_, phid, thed, dphid=None, dthed=None):
+        # dphid, dthed are the rates of the planned tilt if they are known on a coarser grid
+        # (a slower position loop), by default the plan is differenced on this grid.
+        # x_ and u_ are buffers, as in desired_altitude
+        x_, u_ = self.buffer('attitude', N_, 6, 3)
+        rows = self.window(idx, N_)
+        dt = self.dt
+
+        x_[0, :3] = quad.ori; x_[0, 3:] = quad.dori
+        x_[1:, 0] = phid
+        x_[1:, 1] = thed
+        x_[1:, 2] = self.pos[rows, 3]
+
+        # the rates of the planned tilt, the first one is the current rate
+        for i, rate in enumerate((dphid, dthed)):
+            x_[1, 3+i] = quad.dori[i]
+            if rate is None:
+                np.subtract(x_[2:, i], x_[1:-1, i], out=x_[2:, 3+i])
+                x_[2:, 3+i] /= dt
+            else:
+                x_[2:, 3+i] = rate[1:]
+        x_[1:, 5] = self.vel[rows, 3]
+
+        # the torques that hold the reference rates against the gyroscopic coupling. The
+        # inertial terms Ix*ddphi, Iy*ddthe of the tilt plan are left out: on a smooth plan
+        # they change the attitude tracking by less than 0.3% (the MPC plans its torques,
+        # the reference only weighs them with R), and on the saturating plans of the
+        # cascade the plan differenced twice spikes far beyond the torque bounds and
+        # the RTI solves fail. MinimumSnapTrajectory flies the flat tilt of its
+        # reference with its inertial torques.
+        dphi, dthe, dpsi = x_[1:, 3], x_[1:, 4], x_[1:, 5]
+        np.multiply(dthe, dpsi, out=u_[:, 0]); u_[:, 0] *= -(quad.Iy-quad.Iz)/quad.la
+        np.multiply(dphi, dpsi, out=u_[:, 1]); u_[:, 1] *= -(quad.Iz-quad.Ix)/quad.la
+        np.multiply(dphi, dthe, out=u_[:, 2]); u_[:, 2] *= -(quad.Ix-quad.Iy)
+        u_[:, 2] += quad.Iz*self.acc[rows, 3]
+        return x_, u_
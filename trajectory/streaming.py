@@ -0,0 +1,87 @@
+import numpy as np
+from trajectory.reference import ReferenceTrajectory, circle
+
+def stream(shape=circle, dt=0.02, duration=None, chunk=64, t0=0.0):
+    # Yields the samples of an analytic shape in chunks (t, pos, vel, acc) with t (m,)
+    # and pos/vel/acc (m, 4) of [x, y, z, yaw]; endless if duration is None
+    i = 0
+    n_samples = None if duration is None else int(duration/dt)
+    while n_samples is None or i < n_samples:
+        m = chunk if n_samples is None else min(chunk, n_samples - i)
+        t = t0 + (i + np.arange(m))*dt
+        pos, vel, acc = shape(t)
+        yield t, pos, vel, acc
+        i += m
+
+class StreamingTrajectory(ReferenceTrajectory):
+    # ReferenceTrajectory over a stream of samples, in constant memory.
+    #
+    # The tables are a rolling buffer of `capacity` rows starting at sample `base`.
+    # A window pulls samples from the source until it is covered and, when the
+    # buffer is full, the rows before it are dropped by moving the rest to the
+    # front, so windows stay plain slices. The source yields chunks (t, pos, vel, acc)
+    # as stream() or single samples (t, pos, vel, acc) with pos/vel/acc of shape (4,);
+    # after its end the last position is held at rest. Windows may only move forward.
+    def __init__(self, source, dt=0.02, horizon=200, capacity=None):
+        self.source = iter(source)
+        self.dt = dt
+        self.horizon = horizon
+        self.capacity = capacity if capacity is not None else 4*horizon
+        if self.capacity < horizon + 1:
+            raise ValueError("The capacity must exceed the horizon %d" % horizon)
+        self.setupTables(self.capacity)
+
+        self.base = 0    # the sample index of row 0
+        self.filled = 0  # the number of valid rows
+        self.skip = 0    # the number of source samples to drop, skipped by a window
+        self.pending = None  # the part of the last chunk that did not fit
+        self.exhausted = False
+        self.last = None  # the last position of the source
+
+    def pull(self):
+        # the next chunk of the source, the rest padding after its end
+        if self.pending is not None:
+            chunk, self.pending = self.pending, None
+            return chunk
+        if not self.exhausted:
+            try:
+                t, pos, vel, acc = next(self.source)
+                pos, vel, acc = np.atleast_2d(pos), np.atleast_2d(vel), np.atleast_2d(acc)
+                self.last = pos[-1].copy()
+                return pos, vel, acc
+            except StopIteration:
+                self.exhausted = True
+                if self.last is None:
+                    raise ValueError("The trajectory source is empty")
+        return self.rest(self.last, self.capacity - self.filled)
+
+    def window(self, idx, N_):
+        if N_ > self.horizon:
+            raise ValueError("The horizon %d is longer than the padding %d" % (N_, self.horizon))
+        if idx < self.base:
+            raise ValueError("Sample %d has already been dropped from the stream buffer" % idx)
+
+        # drop the rows before the window when it does not fit behind them
+        if idx + N_ - self.base > self.capacity:
+            start = idx - self.base
+            n = max(self.filled - start, 0)
+            for table in (self.pos, self.vel, self.acc, self.altitude, self.position):
+                table[:n] = table[start:start + n]
+            self.skip += max(start - self.filled, 0)
+            self.filled = n
+            self.base = idx
+
+        while self.base + self.filled < idx + N_:
+            pos, vel, acc = self.pull()
+            if self.skip:
+                skipped = min(self.skip, len(pos))
+                pos, vel, acc = pos[skipped:], vel[skipped:], acc[skipped:]
+                self.skip -= skipped
+            m = min(len(pos), self.capacity - self.filled)
+            self.writeTables(self.filled, pos[:m], vel[:m], acc[:m])
+            self.filled += m
+            if m < len(pos):
+                self.pending = pos[m:], vel[m:], acc[m:]
+
+        start = idx - self.base
+        return slice(start, start + N_)
@@ -0,0 +1,145 @@
+import numpy as np
+import os
+from trajectory.reference import ReferenceTrajectory
+
+def load_waypoints(path):
+    # The samples [t, x, y, z(, yaw)] of a recorded path as a read-only memory map.
+    #
+    # .npy files are mapped directly. A .csv file (one header line allowed) is parsed
+    # once into <path>.npy next to it, which is reused while it is newer than the csv.
+    # Where that cache cannot be written (a read-only directory or mount) the parsed
+    # samples are returned from memory, read-only as well.
+    source = path
+    if path.endswith('.csv'):
+        cache = path + '.npy'
+        if not os.path.isfile(cache) or os.path.getmtime(cache) < os.path.getmtime(path):
+            try:
+                data = np.loadtxt(path, delimiter=',', ndmin=2)
+            except ValueError:
+                data = np.loadtxt(path, delimiter=',', skiprows=1, ndmin=2)  # a header line
+            tmp_path = '%s.%d.tmp.npy' % (path, os.getpid())
+            try:
+                np.save(tmp_path, data)
+                os.replace(tmp_path, cache)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                data.setflags(write=False)
+                path = None  # the parsed samples are used
+            else:
+                path = cache
+        else:
+            path = cache
+    if path is not None:
+        data = np.load(path, mmap_mode='r')
+    if data.ndim != 2 or data.shape[1] not in (4, 5):
+        raise ValueError("Expected columns t, x, y, z and optionally yaw in %s" % source)
+    return data
+
+class TimeIndex:
+    # Sample lookup on the time column: O(1) on a uniform grid, binary search otherwise
+    def __init__(self, t, rtol=1e-9):
+        self.t = t
+        self.t0 = float(t[0])
+        self.t_end = float(t[-1])
+        self.n = len(t)
+        if self.n < 2:
+            raise ValueError("A trajectory needs at least two samples")
+        self.step = (self.t_end - self.t0)/(self.n - 1)
+        # checked in chunks, the column may be a large memory map
+        self.uniform = True
+        for start in range(0, self.n, 1 << 20):
+            chunk = np.asarray(t[start:start + (1 << 20) + 1])
+            expected = self.t0 + (start + np.arange(len(chunk)))*self.step
+            if np.any(np.diff(chunk) <= 0):
+                raise ValueError("The time column must be increasing")
+            if not np.allclose(chunk, expected, rtol=0, atol=rtol*max(abs(self.t_end), 1.0)):
+                self.uniform = False
+                break
+
+    def segment(self, times):
+        # the index i of the segment [t_i, t_i+1] of each time, clamped to the samples
+        if self.uniform:
+            i = np.floor((times - self.t0)/self.step).astype(int)
+        else:
+            i = np.searchsorted(self.t, times, side='right') - 1
+        return np.clip(i, 0, self.n - 2)
+
+def hermite(data, index, times):
+    # Cubic Hermite interpolation of the samples at the times (inside the samples):
+    # position, velocity and acceleration of the columns 1: of data. The slopes are
+    # the second-order three-point derivatives of the (possibly non-uniform) samples,
+    # one-sided at the ends of the data. Only the samples around the times are read.
+    i = index.segment(times)
+    lo = max(int(i[0]) - 1, 0)
+    hi = min(int(i[-1]) + 3, index.n)
+    window = np.asarray(data[lo:hi], dtype=float)
+    t, p = window[:, 0], window[:, 1:]
+
+    # the secants and the slopes at the samples of the window
+    h = np.diff(t)[:, None]
+    secant = np.diff(p, axis=0)/h
+    m = np.empty_like(p)
+    m[1:-1] = (h[1:]*secant[:-1] + h[:-1]*secant[1:])/(h[:-1] + h[1:])
+    m[0] = secant[0]
+    m[-1] = secant[-1]
+    if lo > 0:
+        prev = np.asarray(data[lo - 1], dtype=float)
+        h_prev = t[0] - prev[0]
+        m[0] = (h[0]*(p[0] - prev[1:])/h_prev + h_prev*secant[0])/(h_prev + h[0])
+    if hi < index.n:
+        after = np.asarray(data[hi], dtype=float)
+        h_after = after[0] - t[-1]
+        m[-1] = (h_after*secant[-1] + h[-1]*(after[1:] - p[-1])/h_after)/(h[-1] + h_after)
+
+    j = i - lo
+    h = (t[j + 1] - t[j])[:, None]
+    s = ((times - t[j])/h[:, 0])[:, None]
+    p0, p1, m0, m1 = p[j], p[j + 1], m[j]*h, m[j + 1]*h
+    s2, s3 = s*s, s*s*s
+    pos = (2*s3 - 3*s2 + 1)*p0 + (s3 - 2*s2 + s)*m0 + (-2*s3 + 3*s2)*p1 + (s3 - s2)*m1
+    vel = ((6*s2 - 6*s)*p0 + (3*s2 - 4*s + 1)*m0 + (-6*s2 + 6*s)*p1 + (3*s2 - 2*s)*m1)/h
+    acc = ((12*s - 6)*p0 + (6*s - 4)*m0 + (-12*s + 6)*p1 + (6*s - 2)*m1)/h**2
+    return pos, vel, acc
+
+class WaypointTrajectory(ReferenceTrajectory):
+    # ReferenceTrajectory of a recorded path, interpolated onto the dt grid on demand.
+    #
+    # Each window evaluates the spline at its N sample times into the tables, which
+    # hold one horizon, so a tick reads only the samples around its horizon. The
+    # last window is reused for shorter windows at the same sample. After the end of
+    # the path its last position is held at rest; a path without yaw flies yaw 0.
+    def __init__(self, path_or_data, dt=0.02, horizon=200):
+        self.data = load_waypoints(path_or_data) if isinstance(path_or_data, str) else path_or_data
+        self.index = TimeIndex(self.data[:, 0])
+        self.dt = dt
+        self.horizon = horizon
+        self.sim_time = self.index.t_end - self.index.t0
+        self.n_samples = int(self.sim_time/dt) + 1
+        self.setupTables(horizon)
+        self.loaded = (None, 0)  # the sample and length of the window in the tables
+
+    def window(self, idx, N_):
+        if N_ > self.horizon:
+            raise ValueError("The horizon %d is longer than the padding %d" % (N_, self.horizon))
+        if self.loaded[0] != idx or self.loaded[1] < N_:
+            times = self.index.t0 + (idx + np.arange(N_))*self.dt
+            inside = times <= self.index.t_end
+            n = int(np.count_nonzero(inside))
+            if n > 0:
+                self.writeTables(0, *self.interpolate(times[:n]))
+            if n < N_:
+                last = np.asarray(self.data[-1], dtype=float)
+                self.writeTables(n, *self.rest(self.yawed(last[None, 1:])[0], N_ - n))
+            self.loaded = (idx, N_)
+        return slice(0, N_)
+
+    def yawed(self, columns):
+        # [x, y, z, yaw] rows, yaw 0 if the path has none
+        if columns.shape[1] == 4:
+            return columns
+        return np.concatenate((columns, np.zeros((len(columns), 1))), axis=1)
+
+    def interpolate(self, times):
+        pos, vel, acc = hermite(self.data, self.index, times)
+        return self.yawed(pos), self.yawed(vel), self.yawed(acc)
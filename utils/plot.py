@@ -1,10 +1,14 @@
 import matplotlib.pyplot as plt
 import numpy as np
+from utils.telemetry import TelemetryRecorder
 class Plot:
 
     @staticmethod
-    def plot(his_time, his_thrust, his_tau_phi, his_tau_the, his_tau_psi, 
-             quad_vel, quad_path, ref_path, his_motor_speeds, his_forces_and_torques):
+    def plot(his_time, his_thrust=None, his_tau_phi=None, his_tau_the=None, his_tau_psi=None,
+             quad_vel=None, quad_path=None, ref_path=None, his_motor_speeds=None, his_forces_and_torques=None):
+        # Plot.plot(recorder, ref_path=...) plots a TelemetryRecorder
+        if isinstance(his_time, TelemetryRecorder):
+            return Plot.plot(*his_time.plotArguments(ref_path))
     
         # Plot Drone
         plot = Plotting("Quadrotor")
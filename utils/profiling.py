@@ -0,0 +1,266 @@
+import numpy as np
+import collections
+import contextlib
+import functools
+import json
+import math
+import threading
+import time
+
+# the active profiler, None while profiling is disabled
+_profiler = None
+
+# the span of a disabled profiler, one shared object that does nothing
+NULL_SPAN = contextlib.nullcontext()
+
+# the durations of a stage are counted in fixed logarithmic bins, BINS_PER_DECADE per
+# decade from 10 ns to 1000 s (the first and the last bin also count the durations
+# outside), so the memory of a profile does not grow with the length of the run
+BINS_PER_DECADE = 20
+MIN_DECADE = 1
+MAX_DECADE = 12
+N_BINS = (MAX_DECADE - MIN_DECADE)*BINS_PER_DECADE
+BIN_EDGES_NS = np.logspace(MIN_DECADE, MAX_DECADE, N_BINS + 1)
+
+# the events kept per thread by the trace of to_speedscope, older ones are dropped
+MAX_EVENTS = 1000000
+
+def enable(trace=False, max_events=MAX_EVENTS):
+    # start recording spans into a new profiler and return it, trace also keeps the
+    # last max_events open/close events of each thread for to_speedscope
+    global _profiler
+    _profiler = Profiler(trace, max_events)
+    return _profiler
+
+def disable():
+    # stop recording, returns the profiler with the recorded spans
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+def active():
+    return _profiler
+
+def span(name):
+    # with span('solver'): ... times the block as a stage, nested in the enclosing spans
+    if _profiler is None:
+        return NULL_SPAN
+    return Span(_profiler, name)
+
+def profiled(name=None):
+    # decorator form of span(), the name defaults to the qualified function name
+    def decorate(function):
+        label = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return function(*args, **kwargs)
+            with Span(_profiler, label):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+class Span:
+    __slots__ = ('profiler', 'name')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.open(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.close()
+        return False
+
+class StageStats:
+    # the durations of one stage [ns]: count, total, self time, maximum and histogram
+    __slots__ = ('count', 'total', 'self_time', 'max', 'bins')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.self_time = 0
+        self.max = 0
+        self.bins = [0]*N_BINS
+
+    def add(self, duration, self_time):
+        self.count += 1
+        self.total += duration
+        self.self_time += self_time
+        if duration > self.max:
+            self.max = duration
+        i = int((math.log10(duration) - MIN_DECADE)*BINS_PER_DECADE) if duration > 0 else 0
+        self.bins[min(max(i, 0), N_BINS - 1)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.self_time += other.self_time
+        self.max = max(self.max, other.max)
+        self.bins = [a + b for a, b in zip(self.bins, other.bins)]
+
+    def percentiles(self, q):
+        # the percentiles q [ns] of the histogram, log-linear inside a bin and at most the maximum
+        counts = np.array(self.bins, dtype=float)
+        cumulative = np.cumsum(counts)
+        ranks = np.asarray(q, dtype=float)/100*self.count
+        i = np.minimum(np.searchsorted(cumulative, ranks), N_BINS - 1)
+        fraction = (ranks - (cumulative[i] - counts[i]))/np.maximum(counts[i], 1)
+        values = BIN_EDGES_NS[i]*(BIN_EDGES_NS[i+1]/BIN_EDGES_NS[i])**np.clip(fraction, 0, 1)
+        return np.minimum(values, self.max)
+
+class ThreadRecord:
+    # the spans of one thread: the open ones, the statistics of each stage and the trace
+    __slots__ = ('stack', 'stages', 'events')
+
+    def __init__(self, trace, max_events):
+        self.stack = []       # [frame, start, time in child spans] of the open spans
+        self.stages = {}      # path -> StageStats, the path is a tuple of frames
+        # ('O' or 'C', frame, time) for speedscope, the last max_events of them
+        self.events = collections.deque(maxlen=max_events) if trace else None
+
+class Profiler:
+    # Nested named spans timed with perf_counter_ns.
+    #
+    # A stage is the path of a span, the names of its enclosing spans and its own,
+    # e.g. 'tick;position;solve;solver'. Every closed span adds its duration to the
+    # count, total, self time and logarithmic histogram of its stage, so a profile
+    # takes the same memory for any number of ticks; the percentiles are resolved to
+    # the bin width (12%). The event trace for speedscope is only recorded with
+    # trace=True and keeps the last max_events events of each thread. Each thread
+    # records into its own ThreadRecord; spans in other processes (the process
+    # workers of the pipelined scheduler) are not seen.
+    def __init__(self, trace=False, max_events=MAX_EVENTS):
+        self.start_ns = time.perf_counter_ns()
+        self.trace = trace
+        self.max_events = max_events
+        self.frames = []       # the span names, indexed by frame
+        self.frame_index = {}
+        self.threads = {}      # thread id -> ThreadRecord
+        self.lock = threading.Lock()
+
+    def record(self):
+        ident = threading.get_ident()
+        record = self.threads.get(ident)
+        if record is None:
+            with self.lock:
+                record = self.threads.setdefault(ident, ThreadRecord(self.trace, self.max_events))
+        return record
+
+    def frame(self, name):
+        frame = self.frame_index.get(name)
+        if frame is None:
+            with self.lock:
+                frame = self.frame_index.get(name)
+                if frame is None:
+                    frame = len(self.frames)
+                    self.frames.append(name)
+                    self.frame_index[name] = frame
+        return frame
+
+    def open(self, name):
+        record = self.record()
+        frame = self.frame(name)
+        now = time.perf_counter_ns()
+        record.stack.append([frame, now, 0])
+        if record.events is not None:
+            record.events.append(('O', frame, now))
+
+    def close(self):
+        now = time.perf_counter_ns()
+        record = self.record()
+        frame, start, child = record.stack.pop()
+        if record.events is not None:
+            record.events.append(('C', frame, now))
+        duration = now - start
+        path = tuple(s[0] for s in record.stack) + (frame,)
+        stage = record.stages.get(path)
+        if stage is None:
+            stage = record.stages[path] = StageStats()
+        stage.add(duration, duration - child)
+        if record.stack:
+            record.stack[-1][2] += duration
+
+    def stages(self):
+        # path string -> StageStats of all threads
+        merged = {}
+        for record in list(self.threads.values()):
+            for path, stage in list(record.stages.items()):
+                name = ';'.join(self.frames[f] for f in path)
+                merged.setdefault(name, StageStats()).merge(stage)
+        return dict(sorted(merged.items()))
+
+    def summary(self):
+        # the statistics of each stage in ms
+        result = {}
+        for name, stage in self.stages().items():
+            p50, p95, p99 = stage.percentiles([50, 95, 99])*1e-6
+            result[name] = {'count': stage.count, 'total_ms': stage.total*1e-6, 'self_ms': stage.self_time*1e-6,
+                            'mean_ms': stage.total*1e-6/stage.count, 'p50_ms': float(p50), 'p95_ms': float(p95),
+                            'p99_ms': float(p99), 'max_ms': stage.max*1e-6}
+        return result
+
+    def histograms(self):
+        # stage -> (counts, bin edges [ms]) of the occupied range of the logarithmic bins
+        result = {}
+        for name, stage in self.stages().items():
+            counts = np.array(stage.bins)
+            occupied = np.flatnonzero(counts)
+            first, last = occupied[0], occupied[-1] + 1
+            result[name] = (counts[first:last], BIN_EDGES_NS[first:last + 1]*1e-6)
+        return result
+
+    def report(self):
+        # the stages as an indented tree with their share of the root stage
+        summary = self.summary()
+        lines = ["%-40s %8s %11s %6s %10s %10s %10s" % ('stage', 'count', 'total ms', 'share', 'p50 ms', 'p95 ms', 'p99 ms')]
+        for name, s in summary.items():
+            parts = name.split(';')
+            root = summary[parts[0]]['total_ms'] if parts[0] in summary else s['total_ms']
+            lines.append("%-40s %8d %11.2f %5.1f%% %10.4f %10.4f %10.4f" % (
+                '  '*(len(parts) - 1) + parts[-1], s['count'], s['total_ms'],
+                100*s['total_ms']/root if root else 0.0, s['p50_ms'], s['p95_ms'], s['p99_ms']))
+        return '\n'.join(lines)
+
+    def to_speedscope(self, path, name='mpc cascade'):
+        # an evented speedscope profile per thread (https://www.speedscope.app) of the
+        # trace, spans still open are closed at the time of the export
+        if not self.trace:
+            raise ValueError("The profiler records no event trace, enable it with trace=True")
+        now = time.perf_counter_ns()
+        profiles = []
+        for ident, record in list(self.threads.items()):
+            events, open_frames = [], []
+            for kind, frame, at in list(record.events):
+                if kind == 'O':
+                    open_frames.append(frame)
+                elif open_frames:
+                    open_frames.pop()
+                else:
+                    continue  # its open event was dropped from the bounded trace
+                events.append({'type': kind, 'frame': frame, 'at': at - self.start_ns})
+            for frame in reversed(open_frames):
+                events.append({'type': 'C', 'frame': frame, 'at': now - self.start_ns})
+            if not events:
+                continue
+            profiles.append({'type': 'evented', 'name': '%s thread %d' % (name, ident), 'unit': 'nanoseconds',
+                             'startValue': events[0]['at'], 'endValue': events[-1]['at'], 'events': events})
+        document = {'$schema': 'https://www.speedscope.app/file-format-schema.json',
+                    'name': name, 'exporter': 'utils.profiling',
+                    'shared': {'frames': [{'name': frame} for frame in self.frames]},
+                    'profiles': profiles}
+        with open(path, 'w') as f:
+            json.dump(document, f)
+
+    def to_folded(self, path):
+        # folded stacks 'tick;position;solve self-time' in microseconds, the input of
+        # flamegraph.pl, inferno and speedscope
+        with open(path, 'w') as f:
+            for name, stage in self.stages().items():
+                us = int(round(stage.self_time*1e-3))
+                if us > 0:
+                    f.write('%s %d\n' % (name, us))
@@ -0,0 +1,95 @@
+import numpy as np
+import os
+
+# the channels of the simulation loop: (columns, dtype)
+CHANNELS = {'time': (1, np.float64),                # [s]
+            'state': (12, np.float64),              # x, y, z, phi, the, psi and their rates
+            'reference': (4, np.float64),           # x, y, z, psi
+            'control': (4, np.float64),             # thrust, tau_phi, tau_the, tau_psi of the MPCs
+            'motor_speed': (4, np.float64),         # [rad/s]
+            'forces_and_torques': (4, np.float64),  # with the propeller model
+            'tick_time': (1, np.float64),           # wall time of the cascade tick [s]
+            'solve_time': (3, np.float64)}          # altitude/position/attitude solve [s], nan if not solved
+
+class TelemetryRecorder:
+    # Per-tick histories in preallocated column buffers, one array per channel.
+    #
+    # A buffer holds `capacity` rows and doubles when it is full, so a run of n
+    # ticks copies O(n) rows in total. With spill_dir the buffers are memory-mapped
+    # files <spill_dir>/<channel>.dat, so long runs do not have to fit in memory.
+    # Channels not given to record() keep their initial value (0) in that row.
+    def __init__(self, channels=None, capacity=1024, spill_dir=None):
+        self.channels = dict(CHANNELS if channels is None else channels)
+        self.capacity = capacity
+        self.spill_dir = spill_dir
+        self.count = 0
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+            for name in self.channels:
+                path = os.path.join(spill_dir, name + '.dat')
+                if os.path.exists(path):
+                    os.remove(path)  # a spill of an earlier run
+        self.buffers = {name: self.allocate(name, capacity) for name in self.channels}
+
+    def shape(self, name, rows):
+        width = self.channels[name][0]
+        return (rows,) if width == 1 else (rows, width)
+
+    def allocate(self, name, rows):
+        dtype = self.channels[name][1]
+        if self.spill_dir is None:
+            return np.zeros(self.shape(name, rows), dtype=dtype)
+        path = os.path.join(self.spill_dir, name + '.dat')
+        # grow the file first, the new rows are zero-filled
+        with open(path, 'ab') as f:
+            f.truncate(int(np.prod(self.shape(name, rows)))*np.dtype(dtype).itemsize)
+        return np.memmap(path, dtype=dtype, mode='r+', shape=self.shape(name, rows))
+
+    def grow(self):
+        capacity = 2*self.capacity
+        for name, buffer in self.buffers.items():
+            if self.spill_dir is None:
+                grown = self.allocate(name, capacity)
+                grown[:self.count] = buffer[:self.count]
+            else:
+                buffer.flush()
+                grown = self.allocate(name, capacity)  # the same file, the rows are kept
+            self.buffers[name] = grown
+        self.capacity = capacity
+
+    def record(self, **values):
+        # append one row, e.g. record(time=t, control=(thrust, tau_phi, tau_the, tau_psi))
+        if self.count == self.capacity:
+            self.grow()
+        i = self.count
+        for name, value in values.items():
+            self.buffers[name][i] = value
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, name):
+        # the recorded rows of a channel, a view into the buffer
+        return self.buffers[name][:self.count]
+
+    def flush(self):
+        if self.spill_dir is not None:
+            for buffer in self.buffers.values():
+                buffer.flush()
+
+    def save(self, path):
+        np.savez(path, **{name: self[name] for name in self.channels})
+
+    def plotArguments(self, ref_path=None):
+        # the arguments of Plot.plot(); its velocity and motor histories start with the
+        # initial sample, which is not recorded and replaced by nan
+        state = self['state']
+        leading = np.full((1, 6), np.nan)
+        his_motor_speeds = np.hstack((np.full((4, 1), np.nan), self['motor_speed'].T))
+        his_forces_and_torques = np.hstack((np.full((4, 1), np.nan), self['forces_and_torques'].T))
+        control = self['control']
+        return (self['time'], control[:, 0], control[:, 1], control[:, 2], control[:, 3],
+                np.vstack((leading, state[:, 6:])), state[:, :6],
+                self['reference'] if ref_path is None else ref_path,
+                his_motor_speeds, his_forces_and_torques)